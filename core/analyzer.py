@@ -1,5 +1,8 @@
 # core/analyzer.py
 import re
+import threading
+from collections import OrderedDict
+from functools import lru_cache
 from typing import List, Optional, Any
 
 # --- Try to load spaCy lazily and fall back cleanly ---------------------------
@@ -28,6 +31,62 @@ def _get_nlp():
     return _NLP
 
 
+# Parsed docs keyed by text, so the passive/incompleteness/singularity checks
+# share one parse per requirement instead of running the pipeline three times.
+# Process-wide (every Streamlit session runs on its own thread), so it is a small
+# LRU behind a lock rather than an unbounded store of Doc objects.
+_DOC_CACHE: "OrderedDict[str, Any]" = OrderedDict()
+_DOC_CACHE_MAX = 512
+_DOC_CACHE_LOCK = threading.Lock()
+
+
+def _cached_doc(text: str):
+    with _DOC_CACHE_LOCK:
+        doc = _DOC_CACHE.get(text)
+        if doc is not None:
+            _DOC_CACHE.move_to_end(text)
+        return doc
+
+
+def _remember_doc(text: str, doc) -> None:
+    with _DOC_CACHE_LOCK:
+        _DOC_CACHE[text] = doc
+        _DOC_CACHE.move_to_end(text)
+        while len(_DOC_CACHE) > _DOC_CACHE_MAX:
+            _DOC_CACHE.popitem(last=False)
+
+
+def _parse(nlp, text: str):
+    doc = _cached_doc(text)
+    if doc is None:
+        doc = nlp(text)
+        _remember_doc(text, doc)
+    return doc
+
+
+def prime_parses(texts) -> None:
+    """
+    Batch-parse a whole set of requirement texts with nlp.pipe (one pass over the
+    corpus) so the per-requirement checks below hit the parse cache.
+    """
+    nlp = _get_nlp()
+    if nlp is None:
+        return
+    with _DOC_CACHE_LOCK:
+        cached = set(_DOC_CACHE)
+    todo = [
+        t for t in dict.fromkeys(texts)
+        if t and t not in cached and not _looks_like_code(t) and _has_modal_language(t)
+    ][:_DOC_CACHE_MAX]
+    if not todo:
+        return
+    try:
+        for t, doc in zip(todo, nlp.pipe(todo, batch_size=64)):
+            _remember_doc(t, doc)
+    except Exception:
+        pass
+
+
 # --- Gates to avoid false positives on code & non-requirements ----------------
 _MODAL_RE = re.compile(r"\b(shall|must|should|will)\b", re.I)
 
@@ -48,17 +107,26 @@ _CODE_SIGNS = [
     r"^\s*#\s*[-=]{3,}",                                   # block comment rulers
 ]
 _CODE_RE = re.compile("|".join(_CODE_SIGNS), re.I)
+# Deleting the code-ish symbols in C (str.translate) and diffing lengths counts them
+# without a per-character Python loop.
+_DROP_CODE_SYMBOLS = str.maketrans("", "", r"(){}[]:;=|\/<>.*+-_#\"'")
+_SNAKE_RE = re.compile(r"\b[a-z]+_[a-z0-9_]+\b")
+_CAMEL_RE = re.compile(r"\b[a-z]+[A-Z][A-Za-z0-9]+\b")
 
+# Every check gates on this, so one requirement hits it several times per analysis.
+@lru_cache(maxsize=4096)
 def _looks_like_code(s: str) -> bool:
     if not s:
         return False
     t = s.strip()
     if len(t) < 3:
         return False
-    sym_ratio = sum(ch in r"(){}[]:;=|\/<>.*+-_#\"'" for ch in t) / max(len(t), 1)
-    snake = len(re.findall(r"\b[a-z]+_[a-z0-9_]+\b", t))
-    camel = len(re.findall(r"\b[a-z]+[A-Z][A-Za-z0-9]+\b", t))
-    return bool(_CODE_RE.search(t)) or sym_ratio > 0.20 or (snake + camel) >= 2
+    sym_ratio = (len(t) - len(t.translate(_DROP_CODE_SYMBOLS))) / max(len(t), 1)
+    if _CODE_RE.search(t) or sym_ratio > 0.20:
+        return True
+    snake = len(_SNAKE_RE.findall(t))
+    camel = len(_CAMEL_RE.findall(t))
+    return (snake + camel) >= 2
 
 
 # --- Ambiguity ---------------------------------------------------------------
@@ -99,12 +167,15 @@ def check_requirement_ambiguity(requirement_text: str, rule_engine: Optional[Any
     if not weak_words:
         weak_words = ["etc.", "about", "approximately", "optimize", "robust", "user-friendly"]
 
-    found_words: List[str] = []
-    for word in weak_words:
-        if re.search(r"\b" + re.escape(word) + r"\b", lower_requirement, flags=re.IGNORECASE):
-            found_words.append(word)
+    # One linear scan with a cached alternation instead of one regex per word
+    hits = {m.group(0).lower() for m in _weak_word_re(tuple(weak_words)).finditer(lower_requirement)}
+    return [word for word in weak_words if word.lower() in hits]
+
 
-    return found_words
+@lru_cache(maxsize=8)
+def _weak_word_re(words: tuple):
+    ordered = sorted(set(words), key=len, reverse=True)  # prefer the longer term on overlap
+    return re.compile(r"\b(?:" + "|".join(map(re.escape, ordered)) + r")\b", re.IGNORECASE)
 
 
 # --- Passive voice -----------------------------------------------------------
@@ -128,7 +199,7 @@ def check_passive_voice(requirement_text: str) -> List[str]:
         return [f"be {v}" for _, v in heur]
 
     found_phrases: List[str] = []
-    doc = nlp(text)
+    doc = _parse(nlp, text)
     # Prefer dependency-based detection when available
     for token in doc:
         # auxpass e.g., "be" attached to a verb head in passive constructions
@@ -156,12 +227,14 @@ def check_incompleteness(requirement_text: str) -> bool:
         # Heuristic: look for any verb-ish word after the modal
         return not bool(re.search(r"\b(shall|must|should|will)\b\s+\w+", text, flags=re.I))
 
-    doc = nlp(text)
+    doc = _parse(nlp, text)
     has_verb = any(t.pos_ in ("VERB", "AUX") for t in doc)
     return not has_verb
 
 
 # --- Singularity -------------------------------------------------------------
+_AND_OR_RE = re.compile(r"\b(and|or)\b", re.I)
+
 def check_singularity(requirement_text: str) -> List[str]:
     """
     Returns list of coordinating conjunctions ('and', 'or') indicating multiple actions.
@@ -171,6 +244,10 @@ def check_singularity(requirement_text: str) -> List[str]:
     text = (requirement_text or "")
     if not text or _looks_like_code(text) or not _has_modal_language(text):
         return []
+    # Only 'and'/'or' are ever reported, so without one there is nothing to parse for
+    # (short fragments and most single-action requirements stop here).
+    if not _AND_OR_RE.search(text):
+        return []
 
     nlp = _get_nlp()
     if nlp is None or not getattr(nlp, "has_pipe", lambda *_: False)("parser"):
@@ -180,7 +257,7 @@ def check_singularity(requirement_text: str) -> List[str]:
             return list(dict.fromkeys([c.lower() for c in conj]))
         return []
 
-    doc = nlp(text)
+    doc = _parse(nlp, text)
     # Count coordinated verb heads
     issues: List[str] = []
     # Gather verbs that are heads of coordinated actions
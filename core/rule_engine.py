@@ -1,10 +1,16 @@
 # core/rule_engine.py
 import json
 import re
-from typing import List, Dict, Any
+from bisect import bisect_right
+from itertools import accumulate
+from typing import List, Dict, Any, Iterable
 
 
 class RuleEngine:
+    # joins texts for prime(); not a word character, so no \b-anchored word match can span two texts
+    _PRIME_SEP = "\u241e"
+    _PRIMED_MAX = 4096
+
     def __init__(self, rule_filepath: str = "data/default_rules.json"):
         """
         Initializes the Rule Engine by loading a JSON rule file.
@@ -24,6 +30,11 @@ class RuleEngine:
             print(f"ERROR: Could not parse JSON in {rule_filepath}. Using empty rules.")
             self.rules = {}
 
+        # compile every matcher once; check_ambiguity() runs per requirement
+        self._matchers = self._compile_matchers()
+        # findings computed ahead of time by prime(), consumed by check_ambiguity()
+        self._primed: Dict[str, List[str]] = {}
+
     # -------------------- existing getters (unchanged) --------------------
 
     def get_ambiguity_words(self) -> List[str]:
@@ -54,56 +65,106 @@ class RuleEngine:
         NOTE: This keeps the analyzer tab unchanged — it already expects
         a list of strings and renders chips / word cloud from it.
         """
-        findings: List[str] = []
         t = text or ""
-        rules_root = self.rules.get("rules", {}) if isinstance(self.rules, dict) else {}
+        primed = self._primed.pop(t, None)
+        if primed is not None:
+            return list(primed)
+        m = self._matchers
+
+        def _has(key: str) -> bool:
+            return m[key] is not None and m[key].search(t) is not None
 
+        word_hits = [hit.group(1).lower() for hit in m["ambiguity"].finditer(t)] if m["ambiguity"] is not None else []
+        has_alert = _has("alert")
+        return self._findings(t, word_hits, _has("binding_modal"), _has("weak_verbs"),
+                              has_alert, has_alert and _has("trigger"))
+
+    def prime(self, texts: Iterable[str]) -> None:
+        """
+        Run each word matcher ONCE over all `texts` (joined on a separator) and keep the
+        per-text findings for the check_ambiguity() calls that follow. Results are identical
+        to checking the texts one by one; it only saves the per-call regex overhead.
+        """
+        sep = self._PRIME_SEP
+        texts = [t for t in dict.fromkeys(texts) if t and sep not in t and t not in self._primed]
+        if len(texts) < 2:
+            return
+        if len(self._primed) + len(texts) > self._PRIMED_MAX:
+            self._primed.clear()
+
+        joined = sep.join(texts)
+        starts = list(accumulate((len(t) + 1 for t in texts[:-1]), initial=0))
+        m = self._matchers
+
+        def _owners(key: str) -> set:
+            if m[key] is None:
+                return set()
+            return {bisect_right(starts, hit.start()) - 1 for hit in m[key].finditer(joined)}
+
+        word_hits: List[List[str]] = [[] for _ in texts]
+        if m["ambiguity"] is not None:
+            for hit in m["ambiguity"].finditer(joined):
+                word_hits[bisect_right(starts, hit.start()) - 1].append(hit.group(1).lower())
+        binding, weak, alert, trigger = (_owners(k) for k in ("binding_modal", "weak_verbs", "alert", "trigger"))
+
+        for i, t in enumerate(texts):
+            self._primed[t] = self._findings(t, word_hits[i], i in binding, i in weak, i in alert, i in trigger)
+
+    def _findings(self, t: str, word_hits: List[str], has_binding: bool, has_weak: bool,
+                  has_alert: bool, has_trigger: bool) -> List[str]:
+        """Assemble check_ambiguity() output from the individual matcher results for `t`."""
         # 1) Classic ambiguous word hits (preserve original tokens for word cloud)
+        findings: List[str] = list(word_hits)
+
+        # 2) Non-binding modal (rules.binding_modal)
+        if has_binding:
+            findings.append("Non-binding modal (use 'shall' instead)")
+
+        # 3) Measurability (weak verbs + no number/unit)
+        if has_weak and not self._matchers["number_unit"].search(t):
+            findings.append("No measurable criterion (add number/unit/timing)")
+
+        # 4) Alert triggers (alert words present but no trigger/condition)
+        if has_alert and not has_trigger:
+            findings.append("Alert without trigger/condition (add when/if/upon/within/after/…)")
+
+        return _dedupe_preserve_order(findings)
+
+    def _compile_matchers(self) -> Dict[str, Any]:
+        """
+        Precompiled patterns for check_ambiguity(); None where a check is disabled
+        or has no words configured.
+        """
+        rules_root = self.rules.get("rules", {}) if isinstance(self.rules, dict) else {}
+        out: Dict[str, Any] = {
+            "ambiguity": None, "binding_modal": None, "weak_verbs": None,
+            "number_unit": None, "alert": None, "trigger": None,
+        }
+
         amb_cfg = rules_root.get("ambiguity", {}) or {}
         if amb_cfg.get("enabled", False):
-            words = amb_cfg.get("words", []) or []
-            if words:
-                sorted_words = sorted(set(words), key=len, reverse=True)
-                amb_re = re.compile(r"\b(" + "|".join(map(re.escape, sorted_words)) + r")\b", re.IGNORECASE)
-                for m in amb_re.finditer(t):
-                    findings.append(m.group(1).lower())
+            out["ambiguity"] = _word_alternation(sorted(set(amb_cfg.get("words", []) or []), key=len, reverse=True))
 
-        # 2) Non-binding modal (rules.binding_modal)
         bm_cfg = rules_root.get("binding_modal", {}) or {}
         if bm_cfg.get("enabled", False):
-            modals = bm_cfg.get("non_binding_words", []) or []
-            if modals:
-                bm_re = re.compile(r"\b(" + "|".join(map(re.escape, modals)) + r")\b", re.IGNORECASE)
-                if bm_re.search(t):
-                    findings.append("Non-binding modal (use 'shall' instead)")
+            out["binding_modal"] = _word_alternation(bm_cfg.get("non_binding_words", []) or [])
 
-        # 3) Measurability (weak verbs + no number/unit)
         meas_cfg = rules_root.get("measurability", {}) or {}
         if meas_cfg.get("enabled", False):
-            weak_verbs = meas_cfg.get("weak_verbs", []) or []
-            num_unit_pat = meas_cfg.get(
-                "number_unit_regex",
-                r"\b\d+(?:\.\d+)?\s*(ms|s|min|h|%|m|km|ft|nm|Hz|kHz|MHz|GHz|°C|C|K|V|A|W|g|kg|MB|GB|dB|bps|kbps|Mbps|ppm)\b",
-            )
-            if weak_verbs:
-                weak_re = re.compile(r"\b(" + "|".join(map(re.escape, weak_verbs)) + r")\b", re.IGNORECASE)
-                unit_re = re.compile(num_unit_pat, re.IGNORECASE)
-                if weak_re.search(t) and not unit_re.search(t):
-                    findings.append("No measurable criterion (add number/unit/timing)")
+            out["weak_verbs"] = _word_alternation(meas_cfg.get("weak_verbs", []) or [])
+            if out["weak_verbs"] is not None:
+                num_unit_pat = meas_cfg.get(
+                    "number_unit_regex",
+                    r"\b\d+(?:\.\d+)?\s*(ms|s|min|h|%|m|km|ft|nm|Hz|kHz|MHz|GHz|°C|C|K|V|A|W|g|kg|MB|GB|dB|bps|kbps|Mbps|ppm)\b",
+                )
+                out["number_unit"] = re.compile(num_unit_pat, re.IGNORECASE)
 
-        # 4) Alert triggers (alert words present but no trigger/condition)
         alert_cfg = rules_root.get("alert_triggers", {}) or {}
         if alert_cfg.get("enabled", False):
-            alert_words = alert_cfg.get("alert_words", []) or []
-            trigger_words = alert_cfg.get("trigger_words", []) or []
-            alert_re = re.compile(r"\b(" + "|".join(map(re.escape, alert_words)) + r")\b", re.IGNORECASE) if alert_words else None
-            trig_re = re.compile(r"\b(" + "|".join(map(re.escape, trigger_words)) + r")\b", re.IGNORECASE) if trigger_words else None
+            out["alert"] = _word_alternation(alert_cfg.get("alert_words", []) or [])
+            out["trigger"] = _word_alternation(alert_cfg.get("trigger_words", []) or [])
 
-            if alert_re and alert_re.search(t):
-                if not trig_re or not trig_re.search(t):
-                    findings.append("Alert without trigger/condition (add when/if/upon/within/after/…)")
-
-        return _dedupe_preserve_order(findings)
+        return out
 
     # -------------------- Diagnostics helper --------------------
 
@@ -120,6 +181,13 @@ class RuleEngine:
 
 # -------------------- small utility --------------------
 
+def _word_alternation(words: List[str]):
+    """Case-insensitive whole-word alternation over `words`, or None if empty."""
+    if not words:
+        return None
+    return re.compile(r"\b(" + "|".join(map(re.escape, words)) + r")\b", re.IGNORECASE)
+
+
 def _dedupe_preserve_order(items: List[str]) -> List[str]:
     seen = set()
     out: List[str] = []
@@ -17,6 +17,16 @@ def get_conn() -> sqlite3.Connection:
     return conn
 
 
+_LLM_CACHE_DDL = """
+    CREATE TABLE IF NOT EXISTS llm_cache (
+        prompt_hash TEXT PRIMARY KEY,
+        kind TEXT NOT NULL,
+        response TEXT NOT NULL,
+        created_at TEXT NOT NULL
+    )
+"""
+
+
 def init_db():
     """Initializes the database and creates tables if they don't exist."""
     conn = get_conn()
@@ -55,6 +65,9 @@ def init_db():
         )
     """)
 
+    # Persistent AI response cache (keyed on a hash of kind + prompt)
+    cursor.execute(_LLM_CACHE_DDL)
+
     conn.commit()
     conn.close()
 
@@ -135,6 +148,95 @@ def add_requirements(doc_id: int, requirements: List[Tuple[str, str]]) -> None:
     conn.close()
 
 
+def add_document_with_requirements(
+    project_id: int, file_name: str, score: Optional[int], requirements: List[Tuple[str, str]]
+) -> Tuple[int, int]:
+    """
+    Adds the next version of a document together with its requirements in ONE transaction.
+    Returns (doc_id, version). Nothing is written if any insert fails.
+    """
+    conn = get_conn()
+    try:
+        with conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                "SELECT MAX(version) FROM documents WHERE project_id = ? AND file_name = ?",
+                (project_id, file_name),
+            )
+            max_version = cursor.fetchone()[0]
+            version = 1 if max_version is None else max_version + 1
+            cursor.execute(
+                """
+                INSERT INTO documents (project_id, file_name, version, uploaded_at, clarity_score)
+                VALUES (?, ?, ?, ?, ?)
+                """,
+                (project_id, file_name, version, datetime.now().isoformat(), score),
+            )
+            doc_id = cursor.lastrowid
+            if requirements:
+                cursor.executemany(
+                    "INSERT INTO requirements (document_id, req_id_string, req_text) VALUES (?, ?, ?)",
+                    [(doc_id, rid, rtext) for rid, rtext in requirements],
+                )
+    finally:
+        conn.close()
+    return doc_id, version
+
+
+# ------------------------------------------
+# AI response cache
+# ------------------------------------------
+
+_llm_cache_ready = False
+
+
+def _llm_cache_conn() -> sqlite3.Connection:
+    """Connection with the llm_cache table guaranteed to exist (created on first use)."""
+    global _llm_cache_ready
+    conn = get_conn()
+    if not _llm_cache_ready:
+        conn.execute(_LLM_CACHE_DDL)
+        conn.commit()
+        _llm_cache_ready = True
+    return conn
+
+
+def llm_cache_get(prompt_hash: str) -> Optional[str]:
+    """Returns the stored AI response for prompt_hash, or None."""
+    conn = _llm_cache_conn()
+    try:
+        row = conn.execute("SELECT response FROM llm_cache WHERE prompt_hash = ?", (prompt_hash,)).fetchone()
+    finally:
+        conn.close()
+    return row[0] if row else None
+
+
+def llm_cache_put(prompt_hash: str, kind: str, response: str) -> None:
+    """Stores (or replaces) the AI response for prompt_hash."""
+    conn = _llm_cache_conn()
+    try:
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (prompt_hash, kind, response, created_at) VALUES (?, ?, ?, ?)",
+                (prompt_hash, kind, response, datetime.now().isoformat()),
+            )
+    finally:
+        conn.close()
+
+
+def llm_cache_delete(prompt_hashes) -> None:
+    """Removes the stored AI responses for the given prompt hashes."""
+    hashes = [(h,) for h in prompt_hashes]
+    if not hashes:
+        return
+    conn = _llm_cache_conn()
+    try:
+        with conn:
+            conn.executemany("DELETE FROM llm_cache WHERE prompt_hash = ?", hashes)
+    finally:
+        conn.close()
+
+
 def get_documents_for_project(project_id: int) -> List[Tuple[int, str, int, str, Optional[int]]]:
     """Returns (id, file_name, version, uploaded_at, clarity_score) for all docs in a project."""
     conn = get_conn()
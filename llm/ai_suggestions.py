@@ -3,45 +3,74 @@
 Lightweight helpers for ReqCheck's AI features (Gemini via google.generativeai).
 
 IMPORTANT:
-- Streamlit caching (@st.cache_data) is preserved.
+- Streamlit caching (@st.cache_data) is preserved; plain prompt->text calls share
+  _cached_generate, which never caches a failed call.
 - Adds run_freeform(...) for prompts that need multi-line / JSON output.
 """
 
 import streamlit as st
 import google.generativeai as genai
+from google.generativeai import client as genai_client
 import json
 import re
-from typing import List, Tuple
+import threading
+from typing import Iterator, List, Tuple
 
 # ----------------------------- Core helpers -----------------------------
 
-@st.cache_data
+# genai.configure is process-global and GenerativeModel only builds its client on the
+# first call, from whatever key was configured last. Configure + construct + bind happen
+# under this lock so a cached model keeps the key it was made for.
+_GENAI_LOCK = threading.Lock()
+
+
+def _bound_model(api_key: str, **kwargs):
+    with _GENAI_LOCK:
+        genai.configure(api_key=api_key)
+        model = genai.GenerativeModel("gemini-2.5-flash", **kwargs)
+        if getattr(model, "_client", None) is None:
+            model._client = genai_client.get_default_generative_client()
+    return model
+
+
+@st.cache_resource(show_spinner=False, max_entries=8, ttl=3600)
+def _genai_model(api_key: str):
+    """
+    One configured gemini-2.5-flash model per API key, kept across reruns so its
+    client (connection pool, auth) is built once instead of on every call.
+    """
+    return _bound_model(api_key)
+
+
+@st.cache_data(show_spinner=False, ttl=3600, max_entries=512)
+def _cached_generate(prompt: str, _api_key: str) -> str:
+    """
+    Raw model text for `prompt`, cached on the prompt alone (re-entering the key keeps hits).
+    Errors propagate instead of being returned, so a failed call is never cached.
+    """
+    resp = _genai_model(_api_key).generate_content(prompt)
+    return (getattr(resp, "text", "") or "").strip()
+
+
+def clear_cached_generations() -> None:
+    """Forget every cached prompt -> text reply, so the next call asks the model again."""
+    _cached_generate.clear()
+
+
 def run_freeform(api_key: str, prompt: str) -> str:
     """
     Generic freeform call: sends your prompt AS-IS and returns raw model text.
     Use this for prompts that expect multi-line lists, JSON, or JSON Lines.
     """
     try:
-        genai.configure(api_key=api_key)
-        model = genai.GenerativeModel("gemini-2.5-flash")
-        resp = model.generate_content(prompt)
-        return (getattr(resp, "text", "") or "").strip()
+        return _cached_generate(prompt, api_key)
     except Exception:
         # IMPORTANT: return empty string, never an error blob (callers handle retries/repairs)
         return ""
 
 
-@st.cache_data
-def get_ai_suggestion(api_key, requirement_text):
-    """
-    Ask Gemini to rewrite a requirement for clarity and testability.
-    (Single-sentence polish helper; keep for the 🪄 Rewrite button.)
-    """
-    try:
-        genai.configure(api_key=api_key)
-        model = genai.GenerativeModel('gemini-2.5-flash')
-
-        prompt = f"""
+def _suggestion_prompt(requirement_text) -> str:
+    return f"""
         You are a lead Systems Engineer acting as a mentor. Your task is to review and rewrite a single requirement statement to make it exemplary.
 
         Follow these critical INCOSE-based principles for your rewrite:
@@ -57,23 +86,42 @@ def get_ai_suggestion(api_key, requirement_text):
         
         Rewritten Requirement:
         """
-        response = model.generate_content(prompt)
-        return response.text.strip()
+
+
+def get_ai_suggestion(api_key, requirement_text):
+    """
+    Ask Gemini to rewrite a requirement for clarity and testability.
+    (Single-sentence polish helper; keep for the 🪄 Rewrite button.)
+    """
+    try:
+        prompt = _suggestion_prompt(requirement_text)
+        return _cached_generate(prompt, api_key)
 
     except Exception as e:
         return f"An error occurred with the AI service: {e}"
 
 
-@st.cache_data
+def stream_ai_suggestion(api_key, requirement_text) -> Iterator[str]:
+    """
+    Streaming twin of get_ai_suggestion: yields the rewrite in chunks as Gemini produces
+    them (for st.write_stream). Not cached; errors propagate to the caller.
+    """
+    for chunk in _genai_model(api_key).generate_content(_suggestion_prompt(requirement_text), stream=True):
+        try:
+            text = chunk.text
+        except ValueError:
+            # blocked / empty candidate: nothing to show for this chunk
+            continue
+        if text:
+            yield text
+
+
 def generate_requirement_from_need(api_key, need_text):
     """
     Convert an informal stakeholder need into a structured requirement
     or ask a clarifying question if the need is too vague.
     """
     try:
-        genai.configure(api_key=api_key)
-        model = genai.GenerativeModel('gemini-2.5-flash')
-
         prompt = f"""
         You are a Systems Engineer creating a formal requirement from a stakeholder's informal need.
         Convert the following need into a structured requirement with the format:
@@ -85,8 +133,7 @@ def generate_requirement_from_need(api_key, need_text):
 
         Structured Requirement or Clarifying Question:
         """
-        response = model.generate_content(prompt)
-        return response.text.strip()
+        return _cached_generate(prompt, api_key)
 
     except Exception as e:
         return f"An error occurred with the AI service: {e}"
@@ -98,14 +145,31 @@ def get_chatbot_response(api_key, chat_history):
     Get a conversational reply from Gemini based on the entire chat history.
     """
     try:
-        genai.configure(api_key=api_key)
-        model = genai.GenerativeModel('gemini-2.5-flash')
-        response = model.generate_content(chat_history)
+        response = _genai_model(api_key).generate_content(chat_history)
         return response.text.strip()
 
     except Exception as e:
         return f"An error occurred with the AI service: {e}"
 
+# The system instruction carries the project context, which changes as documents
+# and requirements do: keep only a few recent models instead of one per context.
+@st.cache_resource(show_spinner=False, max_entries=8, ttl=3600)
+def _chat_model(api_key: str, system_instruction: str):
+    return _bound_model(api_key, system_instruction=system_instruction)
+
+
+def send_chat_message(api_key, system_instruction, history, message):
+    """
+    One chat turn through a ChatSession: the preface rides as the model's system
+    instruction, `history` holds only the prior turns, and `message` is the new one.
+    """
+    try:
+        chat = _chat_model(api_key, system_instruction).start_chat(history=history)
+        return chat.send_message(message).text.strip()
+
+    except Exception as e:
+        return f"An error occurred with the AI service: {e}"
+
 # --- NEW: AI Requirement Extractor (full JSON-based, robust) ---
 @st.cache_data
 def extract_requirements_with_ai(
@@ -118,8 +182,7 @@ def extract_requirements_with_ai(
     Returns: list of (req_id, req_text)
     """
     try:
-        genai.configure(api_key=api_key)
-        model = genai.GenerativeModel("gemini-2.5-flash")
+        model = _genai_model(api_key)
     except Exception:
         return []
 
@@ -253,16 +316,12 @@ TEXT:
 
     return unique
 
-@st.cache_data
 def decompose_requirement_with_ai(api_key, requirement_text):
     """
     Uses the Gemini LLM to decompose a complex requirement into multiple singular requirements.
     Returns a plain list of lines, each: 'The system shall ...'.
     """
     try:
-        genai.configure(api_key=api_key)
-        model = genai.GenerativeModel("gemini-2.5-flash")
-
         prompt = f"""
 Split the compound requirement below into 3–8 singular, verifiable requirements.
 
@@ -274,8 +333,7 @@ RULES
 
 INPUT
 \"\"\"{(requirement_text or '').strip()}\"\"\""""
-        resp = model.generate_content(prompt)
-        raw = (getattr(resp, "text", "") or "").strip()
+        raw = _cached_generate(prompt, api_key)
         lines = [re.sub(r"^[\-\*\d\)\.]+\s*", "", ln.strip()) for ln in raw.splitlines() if ln.strip()]
         out = []
         for ln in lines:
@@ -294,8 +352,7 @@ def decompose_need_into_requirements(api_key: str, need_text: str) -> str:
     singular, verifiable 'The system shall ...' requirements with REQ-xxx IDs.
     """
     try:
-        genai.configure(api_key=api_key)
-        model = genai.GenerativeModel("gemini-2.5-flash")
+        model = _genai_model(api_key)
     except Exception as e:
         return f"An error occurred with the AI service: {e}"
 
@@ -418,8 +475,7 @@ def analyze_need_autofill(api_key: str, need_text: str, req_type: str) -> dict:
     Uses Gemini directly with a strict JSON prompt + light post-processing.
     """
     try:
-        genai.configure(api_key=api_key)
-        model = genai.GenerativeModel("gemini-2.5-flash")
+        model = _genai_model(api_key)
     except Exception:
         fields = _NEED_AUTOFILL_FIELDS.get(req_type or "Functional", _NEED_AUTOFILL_FIELDS["Functional"])
         return {k: "" for k in fields}
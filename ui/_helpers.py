@@ -0,0 +1,312 @@
+"""
+Document reading, requirement extraction and highlight rendering shared by the app and its tabs.
+Kept out of app.py so the patterns compile once per process instead of on every script run.
+"""
+import io
+import os
+import re
+import string
+import hashlib
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+import streamlit as st
+
+def _file_digest(data: bytes) -> str:
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+_W_NS = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+_W_BODY, _W_P, _W_R, _W_T = _W_NS + "body", _W_NS + "p", _W_NS + "r", _W_NS + "t"
+_W_TAB, _W_BR, _W_CR = _W_NS + "tab", _W_NS + "br", _W_NS + "cr"
+_W_TBL, _W_TR, _W_TC = _W_NS + "tbl", _W_NS + "tr", _W_NS + "tc"
+_W_TCPR, _W_GRIDSPAN, _W_VMERGE, _W_VAL = _W_NS + "tcPr", _W_NS + "gridSpan", _W_NS + "vMerge", _W_NS + "val"
+
+# Run containers whose runs belong to the paragraph itself. Runs nested anywhere else
+# (textboxes under w:txbxContent, drawing fallbacks under mc:AlternateContent) are
+# skipped, matching python-docx's paragraph.text.
+_W_RUN_WRAPPERS = frozenset(_W_NS + t for t in ("hyperlink", "ins", "smartTag"))
+
+def _docx_para_runs(el):
+    for child in el:
+        if child.tag == _W_R:
+            yield child
+        elif child.tag in _W_RUN_WRAPPERS:
+            yield from _docx_para_runs(child)
+
+def _docx_para_text(p) -> str:
+    out = []
+    for r in _docx_para_runs(p):
+        for child in r:
+            if child.tag == _W_T:
+                out.append(child.text or "")
+            elif child.tag == _W_TAB:
+                out.append("\t")
+            elif child.tag in (_W_BR, _W_CR):
+                out.append("\n")
+    return "".join(out)
+
+def _docx_cell_layout(tc):
+    """(grid columns spanned, continues a vertical merge) for one w:tc."""
+    pr = tc.find(_W_TCPR)
+    if pr is None:
+        return 1, False
+    span = 1
+    gs = pr.find(_W_GRIDSPAN)
+    if gs is not None:
+        try:
+            span = max(int(gs.get(_W_VAL) or 1), 1)
+        except ValueError:
+            pass
+    vm = pr.find(_W_VMERGE)
+    return span, vm is not None and vm.get(_W_VAL, "continue") == "continue"
+
+def _parse_docx_parts(_file_bytes: bytes):
+    """
+    Stream word/document.xml straight out of the zip (no python-docx object model)
+    and return immutable (parts, rows): body paragraphs first, then table cell texts.
+    Elements are dropped from the tree as soon as they are consumed. Rows are laid
+    out like python-docx's row.cells: a gridSpan cell repeats once per grid column and
+    a vMerge continuation repeats the cell above it, so column indices line up.
+    """
+    try:
+        from lxml import etree
+    except ImportError:  # the stdlib parser has the same iterparse/findall/remove API
+        import xml.etree.ElementTree as etree
+    parts, cell_parts, rows = [], [], []
+    tags, body, prev_row = [], None, ()
+    with zipfile.ZipFile(io.BytesIO(_file_bytes)) as zf, zf.open("word/document.xml") as fh:
+        for event, elem in etree.iterparse(fh, events=("start", "end")):
+            if event == "start":
+                tags.append(elem.tag)
+                if elem.tag == _W_BODY:
+                    body = elem
+                elif elem.tag == _W_TBL:
+                    prev_row = ()  # vertical merges never cross tables
+                continue
+            tags.pop()
+            parent = tags[-1] if tags else None
+            if elem.tag == _W_TR and parent == _W_TBL and len(tags) >= 2 and tags[-2] == _W_BODY:
+                row_cells = []
+                for c in elem.findall(_W_TC):
+                    span, continued = _docx_cell_layout(c)
+                    if continued:
+                        col = len(row_cells)
+                        texts = [prev_row[k] if k < len(prev_row) else "" for k in range(col, col + span)]
+                    else:
+                        texts = [" ".join(
+                            t for t in (_docx_para_text(p).strip() for p in c.findall(_W_P)) if t
+                        )] * span
+                    for cell_text in texts:
+                        row_cells.append(cell_text)
+                        if cell_text:
+                            cell_parts.append(cell_text)
+                prev_row = tuple(row_cells)
+                rows.append(prev_row)
+            elif parent == _W_BODY:
+                if elem.tag == _W_P:
+                    t = _docx_para_text(elem).strip()
+                    if t:
+                        parts.append(t)
+                body.remove(elem)
+    return tuple(parts + cell_parts), tuple(rows)
+
+def _docx_body_text(path: str) -> str:
+    """
+    Non-blank body paragraphs joined by newlines (what docx.Document(path).paragraphs gives),
+    streamed out of word/document.xml with the stdlib parser.
+    """
+    import xml.etree.ElementTree as ET
+    out, tags, body = [], [], None
+    with zipfile.ZipFile(path) as zf, zf.open("word/document.xml") as fh:
+        for event, elem in ET.iterparse(fh, events=("start", "end")):
+            if event == "start":
+                tags.append(elem.tag)
+                if elem.tag == _W_BODY:
+                    body = elem
+                continue
+            tags.pop()
+            if tags and tags[-1] == _W_BODY:
+                if elem.tag == _W_P:
+                    t = _docx_para_text(elem)
+                    if t.strip():
+                        out.append(t)
+                body.remove(elem)
+    return "\n".join(out)
+
+@st.cache_resource(show_spinner=False)
+def _docx_parse_pool():
+    return ThreadPoolExecutor(max_workers=2, thread_name_prefix="docx-parse")
+
+def _parse_docx_job(file_bytes: bytes):
+    """Runs on the pool: (result, None) or (None, error), so a bad file never fails the Future."""
+    try:
+        return _parse_docx_parts(file_bytes), None
+    except Exception as e:
+        return None, e
+
+# Shared by every session, so only recent uploads stay resident
+@st.cache_resource(show_spinner=False, max_entries=16, ttl=1800)
+def _docx_parse_future(digest: str, _file_bytes: bytes):
+    """One background parse per content digest; the Future carries _parse_docx_job's pair."""
+    return _docx_parse_pool().submit(_parse_docx_job, _file_bytes)
+
+def _load_docx_parts(data: bytes):
+    parsed, err = _docx_parse_future(_file_digest(data), data).result()
+    if err is not None:
+        raise err
+    return parsed
+
+def prefetch_docx(uploaded_files) -> None:
+    """Kick off parsing of .docx uploads as soon as they arrive; extraction later just collects."""
+    for up in uploaded_files or []:
+        if up.name.endswith(".docx"):
+            data = up.getvalue()
+            _docx_parse_future(_file_digest(data), data)
+
+def _read_docx_parts_and_rows(uploaded_file):
+    return _load_docx_parts(uploaded_file.getvalue())
+
+@st.cache_data(show_spinner=False, max_entries=32)
+def _docx_parts_from_path(path: str, mtime: float):
+    """Saved documents only change when re-uploaded; mtime busts the cache when they do."""
+    with open(path, "rb") as f:
+        data = f.read()
+    return _load_docx_parts(data)
+
+def _read_docx_parts_and_rows_from_path(path: str):
+    return _docx_parts_from_path(path, os.path.getmtime(path))
+
+# Line-anchored (MULTILINE) so one finditer over the whole text replaces split/strip/match;
+# the [^\S\n] runs stand in for the per-line strip().
+_REQ_PATTERN = re.compile(
+    r'^[^\S\n]*(([A-Z][A-Z0-9-]*-\d+)|(\d+\.))[^\S\n]+(\S(?:[^\n]*\S)?)[^\S\n]*$',
+    re.MULTILINE,
+)
+_TABLE_ID_PATTERN = re.compile(r'^[A-Z][A-Z0-9-]*-\d+$')
+
+def _extract_requirements_from_table_rows(table_rows):
+    if not table_rows:
+        return []
+    def _norm(s): return (s or "").strip().lower()
+    header_idx = None
+    for i, row in enumerate(table_rows):
+        cells = [_norm(c) for c in row]
+        if not cells:
+            continue
+        if ("id" in cells[0] and any("requirement" in c for c in cells)):
+            header_idx = i
+            break
+        if ("requirement" in cells[0] and any(c == "id" for c in cells)):
+            header_idx = i
+            break
+    if header_idx is None:
+        return []
+    header = [_norm(c) for c in table_rows[header_idx]]
+    id_col = req_col = None
+    for idx, h in enumerate(header):
+        if h == "id":
+            id_col = idx
+        if "requirement" in h:
+            req_col = idx
+    if id_col is None or req_col is None:
+        return []
+    out = []
+    for row in table_rows[header_idx + 1:]:
+        if len(row) <= max(id_col, req_col):
+            continue
+        rid = (row[id_col] or "").strip()
+        rtx = (row[req_col] or "").strip()
+        if rid and rtx and _TABLE_ID_PATTERN.match(rid):
+            out.append((rid, rtx))
+    return out
+
+# Every requirement ID starts with A-Z or 0-9; anything else can skip the regex.
+_ID_FIRST_CHARS = frozenset(string.ascii_uppercase + string.digits)
+
+def iter_requirements(lines):
+    """Yield (req_id, text) from any iterable of lines (paragraphs may contain newlines)."""
+    for part in lines:
+        for line in part.split('\n'):
+            line = line.strip()
+            if not line or line[0] not in _ID_FIRST_CHARS:
+                continue
+            m = _REQ_PATTERN.match(line)
+            if m:
+                yield m.group(1), m.group(4)
+
+def extract_requirements_from_string(content: str):
+    return [(m.group(1), m.group(4)) for m in _REQ_PATTERN.finditer(content)]
+
+def extract_requirements_from_file(uploaded_file):
+    if uploaded_file.name.endswith('.txt'):
+        content = uploaded_file.getvalue().decode("utf-8")
+        return extract_requirements_from_string(content)
+    if uploaded_file.name.endswith('.docx'):
+        data = uploaded_file.getvalue()
+        parts, table_rows = _load_docx_parts(data)
+        reqs = _extract_requirements_from_table_rows(table_rows)
+        # feed paragraphs straight to the matcher; no joined content string
+        return reqs or list(iter_requirements(parts))
+    return []
+
+_AMB_SPAN = '<span style="background-color:#FFFF00;color:black;padding:2px 4px;border-radius:3px;">%s</span>'
+_PAS_SPAN = '<span style="background-color:#FFA500;padding:2px 4px;border-radius:3px;">%s</span>'
+_FLAGGED_WRAP = '<div style="background-color:#FFF3CD;color:#856404;padding:10px;border-radius:5px;margin-bottom:10px;">%s</div>'
+
+# Optional linear-time engine for the highlighter (pip install google-re2); falls back to `re`.
+try:
+    import re2 as _hl_re
+except ImportError:
+    _hl_re = re
+
+def _compile_highlighter(pattern: str):
+    try:
+        return _hl_re.compile(pattern)
+    except Exception:
+        return re.compile(pattern)
+
+def _alternation(terms) -> str:
+    """Escaped alternation body for all terms (longest first so overlaps prefer the longer term)."""
+    return "|".join(re.escape(t) for t in sorted({t for t in terms if t}, key=len, reverse=True))
+
+def format_requirement_with_highlights(req_id, req_text, issues):
+    # One left-to-right scan for ambiguous words and passive phrases together,
+    # assembling the output from slices instead of re-substituting per token.
+    amb_words = []
+    for token in issues.get('ambiguous') or []:
+        word = token.split(":", 1)[1].strip() if ":" in token else token
+        amb_words.append(word or token)
+    alts = []
+    amb_body = _alternation(amb_words)
+    if amb_body:
+        alts.append(rf"(?P<amb>\b(?:{amb_body})\b)")
+    pas_body = _alternation(issues.get('passive') or [])
+    if pas_body:
+        alts.append(f"(?P<pas>{pas_body})")
+
+    highlighted_text = req_text
+    if alts:
+        parts, last = [], 0
+        for m in _compile_highlighter("(?i)" + "|".join(alts)).finditer(req_text):
+            start, end = m.span()
+            parts.append(req_text[last:start])
+            is_amb = bool(amb_body) and m.group("amb") is not None
+            parts.append((_AMB_SPAN if is_amb else _PAS_SPAN) % m.group(0))
+            last = end
+        parts.append(req_text[last:])
+        highlighted_text = "".join(parts)
+
+    display_html = f"⚠️ <strong>{req_id}</strong> {highlighted_text}"
+    explanations = []
+    if issues.get('ambiguous'):
+        explanations.append(f"<i>- Ambiguity: Found weak words: <b>{', '.join(issues['ambiguous'])}</b></i>")
+    if issues.get('passive'):
+        explanations.append(f"<i>- Passive Voice: Found phrase: <b>'{', '.join(issues['passive'])}'</b>. Consider active voice.</i>")
+    if issues.get('incomplete'):
+        explanations.append("<i>- Incompleteness: Requirement appears to be a fragment.</i>")
+    if issues.get('singularity'):
+        explanations.append(f"<i>- Singularity: Multiple actions indicated: <b>{', '.join(issues['singularity'])}</b></i>")
+    if explanations:
+        display_html += "<br>" + "<br>".join(explanations)
+
+    return _FLAGGED_WRAP % display_html
@@ -3,10 +3,6 @@ import streamlit as st
 import sys
 import os
 import re
-import docx
-from wordcloud import WordCloud
-import matplotlib.pyplot as plt
-import pandas as pd
 import inspect
 import importlib
 import sqlite3  # <-- to catch IntegrityError
@@ -29,6 +25,11 @@ try:
 except Exception:
     def check_singularity(_text: str):
         return []  # safe fallback
+try:
+    from core.analyzer import prime_parses  # optional
+except Exception:
+    def prime_parses(_texts):
+        return None  # safe fallback
 
 from core.scoring import calculate_clarity_score
 
@@ -128,143 +129,17 @@ def is_valid_google_key(k: str) -> bool:
     return 30 <= len(k) <= 120 and re.fullmatch(r"[A-Za-z0-9_\-]+", k) is not None
 
 # ========================= Helpers for Analyzer =========================
-def _read_docx_text_and_rows(uploaded_file):
-    d = docx.Document(uploaded_file)
-    parts, rows = [], []
-    for p in d.paragraphs:
-        t = p.text.strip()
-        if t:
-            parts.append(t)
-    for tbl in d.tables:
-        for r in tbl.rows:
-            row_cells = []
-            for c in r.cells:
-                cell_text = " ".join(p.text.strip() for p in c.paragraphs if p.text.strip())
-                row_cells.append(cell_text)
-                if cell_text:
-                    parts.append(cell_text)
-            rows.append(row_cells)
-    return "\n".join(parts), rows
-
-def _read_docx_text_and_rows_from_path(path: str):
-    d = docx.Document(path)
-    parts, rows = [], []
-    for p in d.paragraphs:
-        t = p.text.strip()
-        if t:
-            parts.append(t)
-    for tbl in d.tables:
-        for r in tbl.rows:
-            row_cells = []
-            for c in r.cells:
-                cell_text = " ".join(p.text.strip() for p in c.paragraphs if p.text.strip())
-                row_cells.append(cell_text)
-                if cell_text:
-                    parts.append(cell_text)
-            rows.append(row_cells)
-    return "\n".join(parts), rows
-
-def _extract_requirements_from_table_rows(table_rows):
-    if not table_rows:
-        return []
-    def _norm(s): return (s or "").strip().lower()
-    header_idx = None
-    for i, row in enumerate(table_rows):
-        cells = [_norm(c) for c in row]
-        if not cells:
-            continue
-        if ("id" in cells[0] and any("requirement" in c for c in cells)):
-            header_idx = i
-            break
-        if ("requirement" in cells[0] and any(c == "id" for c in cells)):
-            header_idx = i
-            break
-    if header_idx is None:
-        return []
-    header = [_norm(c) for c in table_rows[header_idx]]
-    id_col = req_col = None
-    for idx, h in enumerate(header):
-        if h == "id":
-            id_col = idx
-        if "requirement" in h:
-            req_col = idx
-    if id_col is None or req_col is None:
-        return []
-    id_pat = re.compile(r'^[A-Z][A-Z0-9-]*-\d+$')
-    out = []
-    for row in table_rows[header_idx + 1:]:
-        if len(row) <= max(id_col, req_col):
-            continue
-        rid = (row[id_col] or "").strip()
-        rtx = (row[req_col] or "").strip()
-        if rid and rtx and id_pat.match(rid):
-            out.append((rid, rtx))
-    return out
-
-def extract_requirements_from_string(content: str):
-    requirements = []
-    req_pattern = re.compile(r'^(([A-Z][A-Z0-9-]*-\d+)|(\d+\.))\s+(.*)$')
-    for line in content.split('\n'):
-        line = line.strip()
-        m = req_pattern.match(line)
-        if m:
-            rid = m.group(1)
-            text = m.group(4)
-            requirements.append((rid, text))
-    return requirements
-
-def extract_requirements_from_file(uploaded_file):
-    if uploaded_file.name.endswith('.txt'):
-        content = uploaded_file.getvalue().decode("utf-8")
-        table_rows = []
-    elif uploaded_file.name.endswith('.docx'):
-        content, table_rows = _read_docx_text_and_rows(uploaded_file)
-    else:
-        content, table_rows = "", []
-    reqs = _extract_requirements_from_table_rows(table_rows)
-    return reqs or extract_requirements_from_string(content)
-
-def format_requirement_with_highlights(req_id, req_text, issues):
-    highlighted_text = req_text
-
-    # --- ambiguity highlighting ---
-    if issues.get('ambiguous'):
-        for token in issues['ambiguous']:
-            word = token.split(":", 1)[1].strip() if ":" in token else token
-            if not word:
-                word = token
-            highlighted_text = re.sub(
-                r'\b' + re.escape(word) + r'\b',
-                f'<span style="background-color:#FFFF00;color:black;padding:2px 4px;border-radius:3px;">{word}</span>',
-                highlighted_text,
-                flags=re.IGNORECASE
-            )
-
-    if issues.get('passive'):
-        for phrase in issues['passive']:
-            highlighted_text = re.sub(
-                re.escape(phrase),
-                f'<span style="background-color:#FFA500;padding:2px 4px;border-radius:3px;">{phrase}</span>',
-                highlighted_text, flags=re.IGNORECASE
-            )
-
-    display_html = f"⚠️ <strong>{req_id}</strong> {highlighted_text}"
-    explanations = []
-    if issues.get('ambiguous'):
-        explanations.append(f"<i>- Ambiguity: Found weak words: <b>{', '.join(issues['ambiguous'])}</b></i>")
-    if issues.get('passive'):
-        explanations.append(f"<i>- Passive Voice: Found phrase: <b>'{', '.join(issues['passive'])}'</b>. Consider active voice.</i>")
-    if issues.get('incomplete'):
-        explanations.append("<i>- Incompleteness: Requirement appears to be a fragment.</i>")
-    if issues.get('singularity'):
-        explanations.append(f"<i>- Singularity: Multiple actions indicated: <b>{', '.join(issues['singularity'])}</b></i>")
-    if explanations:
-        display_html += "<br>" + "<br>".join(explanations)
-
-    return (
-        f'<div style="background-color:#FFF3CD;color:#856404;padding:10px;'
-        f'border-radius:5px;margin-bottom:10px;">{display_html}</div>'
-    )
+from ui._helpers import (
+    prefetch_docx,
+    _read_docx_parts_and_rows,
+    _read_docx_parts_and_rows_from_path,
+    _docx_body_text,
+    iter_requirements,
+    _extract_requirements_from_table_rows,
+    extract_requirements_from_string,
+    extract_requirements_from_file,
+    format_requirement_with_highlights,
+)
 
 def safe_call_ambiguity(text: str, engine: Optional['RuleEngine']):
     """
@@ -453,8 +328,16 @@ with st.container(border=False):
 if 'selected_project' not in st.session_state:
     st.session_state.selected_project = None
 
-# One RuleEngine instance (real or stub)
-rule_engine = RuleEngine()
+# One RuleEngine instance (real or stub), built once per rules-file version
+@st.cache_resource(show_spinner=False)
+def _get_rule_engine(rules_mtime: float):
+    return RuleEngine()
+
+try:
+    _rules_mtime = os.path.getmtime("data/default_rules.json")
+except OSError:
+    _rules_mtime = 0.0
+rule_engine = _get_rule_engine(_rules_mtime)
 
 # ======================= Layout: main + right panel =======================
 main_col, right_col = st.columns([4, 1], gap="large")
@@ -763,13 +646,19 @@ except Exception as e:
 CTX = {
     "HAS_AI_PARSER": HAS_AI_PARSER,
     "get_ai_suggestion": get_ai_suggestion,
+    "stream_ai_suggestion": getattr(ai, "stream_ai_suggestion", None),
+    "clear_cached_generations": getattr(ai, "clear_cached_generations", None),
     "get_chatbot_response": get_chatbot_response,
+    "send_chat_message": getattr(ai, "send_chat_message", None),
     "decompose_requirement_with_ai": decompose_requirement_with_ai,
     "decompose_need_into_requirements": ai.decompose_need_into_requirements,
     "run_freeform": ai.run_freeform,
     "extract_requirements_with_ai": extract_requirements_with_ai,
-    "_read_docx_text_and_rows": _read_docx_text_and_rows,
-    "_read_docx_text_and_rows_from_path": _read_docx_text_and_rows_from_path,
+    "_read_docx_parts_and_rows": _read_docx_parts_and_rows,
+    "_read_docx_parts_and_rows_from_path": _read_docx_parts_and_rows_from_path,
+    "_docx_body_text": _docx_body_text,
+    "iter_requirements": iter_requirements,
+    "prefetch_docx": prefetch_docx,
     "_extract_requirements_from_table_rows": _extract_requirements_from_table_rows,
     "extract_requirements_from_string": extract_requirements_from_string,
     "extract_requirements_from_file": extract_requirements_from_file,
@@ -778,6 +667,7 @@ CTX = {
     "check_passive_voice": check_passive_voice,
     "check_incompleteness": check_incompleteness,
     "check_singularity": check_singularity,
+    "prime_parses": prime_parses,
     "safe_clarity_score": safe_clarity_score,
     "_save_uploaded_file_for_doc": _save_uploaded_file_for_doc,
     "_sanitize_filename": _sanitize_filename,
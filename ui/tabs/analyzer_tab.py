@@ -1,12 +1,203 @@
 # ui/tabs/analyzer_tab.py
+import io
 import os
 import re
-import docx
-import pandas as pd
-from wordcloud import WordCloud
-import matplotlib.pyplot as plt
+import csv
+import math
+import json
+import hashlib
+import inspect
 import streamlit as st
 
+# Row templates for the read-only result lists (filled with % per row)
+_MISSING_MODAL_WRAP = (
+    '<div style="background:#FFF3CD;color:#856404;padding:10px;border-radius:5px;margin-bottom:10px;">'
+    '⚠️ <strong>%s</strong> %s<br/><em>%s</em><br/><code>Suggestion: The system shall %s</code></div>'
+)
+_NONREQ_WRAP = (
+    '<div style="background:#E2E3E5;color:#383D41;padding:10px;border-radius:5px;margin-bottom:10px;">'
+    '🛈 <strong>%s</strong> %s<br/><em>%s</em></div>'
+)
+_GIBBERISH_WRAP = (
+    '<div style="background:#F8D7DA;color:#721C24;padding:10px;border-radius:5px;margin-bottom:10px;">'
+    '🚫 <strong>%s</strong> %s<br/><em>%s</em></div>'
+)
+_BADGE_SPAN = (
+    "<span style='background:#FFF3CD;color:#856404;padding:4px 10px;border-radius:999px;"
+    "display:inline-block;margin:0 6px 6px 0;font-size:0.85rem'>%s</span>"
+)
+
+# AI prompt templates (str.format); built once at import instead of per click
+_REWRITE_TMPL = """
+You are a senior systems engineer. Rewrite the requirement below into EXACTLY ONE clear, verifiable sentence in ACTIVE voice using the verb "shall".
+CRITICAL RULES:
+- Preserve ALL original numeric values, ranges, thresholds, probabilities, units, symbols, and enumerations EXACTLY (e.g., 99.9%, -25°C to +55°C, 0–100% (non-condensing), 120 km/h). Do not invent values. Do not change units.
+- Keep the original intent and scope. If details are not specified, do NOT add any new conditions or numbers.
+- Remove vagueness (e.g., "robust", "approximately", "user-friendly") only if you can restate without introducing new numbers.
+- Make it singular (one action) if possible; otherwise keep the main action clear.
+- OUTPUT: the single rewritten sentence ONLY (no lists, no commentary).
+
+Requirement:
+\"\"\"{text}\"\"\""""
+
+_BATCH_REWRITE_TMPL = """
+You are a senior systems engineer. Rewrite EACH requirement below into EXACTLY ONE clear, verifiable sentence in ACTIVE voice using the verb "shall".
+CRITICAL RULES:
+- Preserve ALL original numeric values, ranges, thresholds, probabilities, units, symbols, and enumerations EXACTLY (e.g., 99.9%, -25°C to +55°C, 0–100% (non-condensing), 120 km/h). Do not invent values. Do not change units.
+- Keep the original intent and scope. If details are not specified, do NOT add any new conditions or numbers.
+- Remove vagueness (e.g., "robust", "approximately", "user-friendly") only if you can restate without introducing new numbers.
+- Make it singular (one action) if possible; otherwise keep the main action clear.
+- OUTPUT: ONLY a JSON array with one object per input, in the same order: {{"id": "<same id>", "rewrite": "<single sentence>"}}
+
+Requirements (JSON):
+{payload}"""
+
+_DECOMPOSE_TMPL = """
+You are decomposing a requirement that contains multiple distinct actions.
+Produce the MINIMUM number of child requirements (2–4) needed to make each child a SINGLE, testable "shall" statement.
+RULES:
+- Preserve ALL original numeric values, units, symbols, ranges EXACTLY. Do NOT invent numbers or tighten/relax thresholds.
+- Each child must be independent and verifiable.
+- Use child IDs in the format {parent_id}.1, {parent_id}.2, ... (no other text).
+- OUTPUT FORMAT: each child on its own line as:
+{parent_id}.n: <child shall sentence>
+
+Parent requirement:
+\"\"\"{text}\"\"\""""
+
+_REWRITE_DECOMPOSE_TMPL = """
+You are a senior systems engineer. Do TWO things with the requirement below.
+1) Rewrite it into EXACTLY ONE clear, verifiable sentence in ACTIVE voice using the verb "shall".
+2) Decompose that rewritten sentence into the MINIMUM number of child requirements (2–4), each a SINGLE, testable "shall" statement.
+CRITICAL RULES:
+- Preserve ALL original numeric values, ranges, thresholds, probabilities, units, symbols, and enumerations EXACTLY (e.g., 99.9%, -25°C to +55°C, 0–100% (non-condensing), 120 km/h). Do not invent values. Do not change units.
+- Keep the original intent and scope. If details are not specified, do NOT add any new conditions or numbers.
+- Each child must be independent and verifiable. Use child IDs in the format {parent_id}.1, {parent_id}.2, ...
+- OUTPUT: ONLY a JSON object: {{"rewritten": "<single sentence>", "decomposition": ["{parent_id}.1: <child shall sentence>", "..."]}}
+
+Requirement:
+\"\"\"{text}\"\"\""""
+
+
+# Singularity fallback heuristics, compiled once instead of per requirement
+_BINDING_MODAL_RE = re.compile(r"\b(shall|must)\b", re.I)
+_COORDINATED_ACTIONS_RE = re.compile(
+    r"\b(shall|must)\b[^.]*\b(and|&)\b[^.]*\b(provide|support|ensure|maintain|encrypt|log|record|alert|compute|store|verify|transmit)\b",
+    re.I,
+)
+
+# Quick Paste lines: optional "ID:" prefix (up to the first colon), then the text
+_QUICK_LINE_RE = re.compile(r"^(?:([^:\n]*):)?([^\n]*)$", re.M)
+# line breaks str.splitlines() honours besides "\n"
+_OTHER_LINE_BREAKS_RE = re.compile("[\r\x0b\x0c\x1c-\x1e\x85\u2028\u2029]")
+
+
+def _partition_results(results):
+    """
+    One pass over analysis rows -> (analyzed, flagged, clear).
+    Rows marked non_requirement are left out of all three.
+    """
+    analyzed, flagged, clear = [], [], []
+    for r in results:
+        if r.get("non_requirement"):
+            continue
+        analyzed.append(r)
+        is_flagged = r.get("flagged")
+        if is_flagged is None:  # rows kept from before the flag was stored
+            is_flagged = bool(r["ambiguous"] or r["passive"] or r["incomplete"] or r["singularity"])
+        if is_flagged:
+            flagged.append(r)
+        else:
+            clear.append(r)
+    return analyzed, flagged, clear
+
+
+def _issues_caption(r) -> str:
+    """Markdown caption listing a row's findings ("" when it has none); stored on the row at analysis time."""
+    notes = []
+    if r["ambiguous"]:
+        notes.append(f"ⓘ **Ambiguity:** {', '.join(r['ambiguous'])}")
+    if r["passive"]:
+        notes.append(f"ⓘ **Passive Voice:** {', '.join(r['passive'])}")
+    if r["incomplete"]:
+        notes.append("ⓘ **Incompleteness** detected.")
+    if r["singularity"]:
+        notes.append(f"ⓘ **Singularity:** {', '.join(r['singularity'])}")
+    return "  \n".join(notes)
+
+
+@st.cache_data(show_spinner=False, max_entries=64)
+def _results_to_csv_bytes(cache_key: tuple, _build_columns) -> bytes:
+    """
+    CSV bytes for a column-major export table. Keyed on a small identity key
+    (result source + filled-in AI cells); `_build_columns()` is only called on a
+    miss, so the table is neither deep-hashed nor rebuilt on cached reruns.
+    """
+    _columns = _build_columns()
+    buf = io.StringIO()
+    w = csv.writer(buf, lineterminator="\n")
+    w.writerow([name for name, _ in _columns])
+    w.writerows(zip(*(values for _, values in _columns)))
+    return buf.getvalue().encode("utf-8")
+
+
+# Streamlit >= 1.50 accepts a callable for download_button(data=...) and only calls it on click
+_DOWNLOAD_ACCEPTS_CALLABLE = tuple(int(x) for x in re.findall(r"\d+", getattr(st, "__version__", "0"))[:2]) >= (1, 50)
+
+
+def _download_data(build):
+    """`build` itself when Streamlit defers it to the click, else its bytes right now."""
+    return build if _DOWNLOAD_ACCEPTS_CALLABLE else build()
+
+
+@st.cache_data(show_spinner=False, max_entries=32)
+def _analyze_reqs_cached(reqs: tuple, engine_sig: str, _analyze) -> tuple:
+    """
+    (results, issue_counts) for one document's extracted requirements. Keyed on the
+    requirements themselves plus the active rule set, so widget reruns skip the checks.
+    """
+    return _analyze(reqs)
+
+
+@st.cache_data(show_spinner=False, ttl=24 * 60 * 60, max_entries=20000)
+def _cached_ambiguity(rtext: str, engine_sig: str, _check) -> list:
+    """Ambiguity findings per (text, rule-set); survives reruns and is shared across documents."""
+    return _check(rtext)
+
+
+@st.cache_data(show_spinner=False, ttl=24 * 60 * 60, max_entries=20000)
+def _cached_pure_checks(rtext: str, _check) -> tuple:
+    """(passive, incomplete, singularity) per text; these checks do not depend on the rule set."""
+    return _check(rtext)
+
+
+@st.cache_data(show_spinner=False, ttl=60)
+def _project_documents(pid: int, _db, _sanitize) -> tuple:
+    """
+    (doc_id, file_name, version, uploaded_at, clarity_score, conv_path, exists) per stored version,
+    grouped by file name with the newest version first (sorted here, once per cache fill).
+    Cleared after every save from this tab; the ttl bounds staleness from changes made elsewhere.
+    """
+    out = []
+    docs = sorted(_db.get_documents_for_project(pid), key=lambda d: (d[1], -(d[2] or 0)))
+    for (doc_id, file_name, version, uploaded_at, clarity_score) in docs:
+        conv_path = os.path.join("data", "projects", str(pid), "documents", f"{doc_id}_{_sanitize(file_name)}")
+        out.append((doc_id, file_name, version, uploaded_at, clarity_score, conv_path, os.path.exists(conv_path)))
+    return tuple(out)
+
+
+@st.cache_data(show_spinner=False, max_entries=8)
+def load_example_text(path: str, mtime: float, _docx_text=None) -> str:
+    """Text of a bundled example document; re-read only when the file on disk changes."""
+    if path.endswith(".docx"):
+        if _docx_text is not None:
+            return _docx_text(path)
+        import docx
+        d = docx.Document(path)
+        return "\n".join([p.text for p in d.paragraphs if p.text.strip()])
+    with open(path, "r", encoding="utf-8") as f:
+        return f.read()
+
 
 def render(st, db, rule_engine, CTX):
     """
@@ -21,6 +212,8 @@ def render(st, db, rule_engine, CTX):
     get_ai_suggestion = CTX["get_ai_suggestion"]
     decompose_requirement_with_ai = CTX["decompose_requirement_with_ai"]
     extract_requirements_with_ai = CTX.get("extract_requirements_with_ai")
+    run_freeform = CTX.get("run_freeform")
+    stream_ai_suggestion = CTX.get("stream_ai_suggestion")
 
     # ---------- STRICT requirement gate (shared) ----------
     _REQ_MODAL_RE = re.compile(r"\b(shall|must|will|should)\b", re.I)
@@ -117,8 +310,9 @@ def render(st, db, rule_engine, CTX):
 
         # Has modal → treat as a requirement
         return "requirement", ""
-    _read_docx_text_and_rows = CTX["_read_docx_text_and_rows"]
-    _read_docx_text_and_rows_from_path = CTX["_read_docx_text_and_rows_from_path"]
+    _read_docx_parts_and_rows = CTX["_read_docx_parts_and_rows"]
+    _read_docx_parts_and_rows_from_path = CTX["_read_docx_parts_and_rows_from_path"]
+    iter_requirements = CTX["iter_requirements"]
     _extract_requirements_from_table_rows = CTX["_extract_requirements_from_table_rows"]
     extract_requirements_from_string = CTX["extract_requirements_from_string"]
     extract_requirements_from_file = CTX["extract_requirements_from_file"]
@@ -128,6 +322,7 @@ def render(st, db, rule_engine, CTX):
     check_passive_voice = CTX["check_passive_voice"]
     check_incompleteness = CTX["check_incompleteness"]
     check_singularity = CTX["check_singularity"]
+    prime_parses = CTX.get("prime_parses", lambda _texts: None)
     safe_clarity_score = CTX["safe_clarity_score"]
 
     _save_uploaded_file_for_doc = CTX["_save_uploaded_file_for_doc"]
@@ -135,7 +330,7 @@ def render(st, db, rule_engine, CTX):
 
 
     # ---- Harden get_ai_suggestion: truncate + retry + HARD timeout ----
-    import time, concurrent.futures
+    import time, queue, threading, concurrent.futures
 
     _orig_get_ai_suggestion = CTX["get_ai_suggestion"]  # keep original
 
@@ -214,14 +409,27 @@ def render(st, db, rule_engine, CTX):
   
     # --- UI mode & onboarding (Beginner UI removed) ---------------------------
     beginner = False
+    # AI rewrite / decomposition text per requirement id: one session entry each, not one per row
+    rw_cache = st.session_state.setdefault("rewritten_cache", {})
+    dc_cache = st.session_state.setdefault("decomp_cache", {})
+
+    # llm_cache rows this session has read or written (see _durable_ai below)
+    durable_keys = st.session_state.setdefault("durable_ai_keys", set())
+
     # Quick utility to reset noisy inline AI results
     def _reset_ai_caches():
-        keys = [k for k in list(st.session_state.keys()) if k.startswith("rewritten_cache_") or k.startswith("decomp_cache_")]
-        for k in keys:
+        """Clears the inline results AND the stored replies behind them, so the next Fix asks the model again."""
+        rw_cache.clear()
+        dc_cache.clear()
+        if durable_keys and getattr(db, "llm_cache_delete", None) is not None:
             try:
-                del st.session_state[k]
+                db.llm_cache_delete(list(durable_keys))
             except Exception:
                 pass
+        durable_keys.clear()
+        clear_generations = CTX.get("clear_cached_generations")
+        if clear_generations is not None:
+            clear_generations()
 
     # --- Quick sanity helpers (AI connectivity) ---
     def _has_api_key() -> bool:
@@ -399,21 +607,17 @@ def render(st, db, rule_engine, CTX):
         st.session_state.quick_buckets = {"statement_missing_modal": [], "non_requirement": [], "gibberish": []}
 
     def _parse_quick_lines(raw: str):
+        raw = raw or ""
+        if _OTHER_LINE_BREAKS_RE.search(raw):
+            raw = "\n".join(raw.splitlines())
         rows = []
         idx = 1
-        for ln in (raw or "").splitlines():
-            t = ln.strip()
-            if not t:
+        for m in _QUICK_LINE_RE.finditer(raw):
+            left, right = m.groups()
+            rtx = right.strip()
+            if not rtx:
                 continue
-            if ":" in t:
-                left, right = t.split(":", 1)
-                rid = left.strip()
-                rtx = right.strip()
-                if not rtx:
-                    continue
-            else:
-                rid = f"R-{idx:03d}"
-                rtx = t
+            rid = left.strip() if left is not None else f"R-{idx:03d}"
             rows.append((rid, rtx))
             idx += 1
         # dedupe quick paste too
@@ -422,40 +626,24 @@ def render(st, db, rule_engine, CTX):
     # --- AI prompts (rewrite + decompose) ------------------------------------
     def _ai_rewrite_prompt(req_text: str) -> str:
         # preserves all numbers/units/ranges; no inventions
-        return f"""
-You are a senior systems engineer. Rewrite the requirement below into EXACTLY ONE clear, verifiable sentence in ACTIVE voice using the verb "shall".
-CRITICAL RULES:
-- Preserve ALL original numeric values, ranges, thresholds, probabilities, units, symbols, and enumerations EXACTLY (e.g., 99.9%, -25°C to +55°C, 0–100% (non-condensing), 120 km/h). Do not invent values. Do not change units.
-- Keep the original intent and scope. If details are not specified, do NOT add any new conditions or numbers.
-- Remove vagueness (e.g., "robust", "approximately", "user-friendly") only if you can restate without introducing new numbers.
-- Make it singular (one action) if possible; otherwise keep the main action clear.
-- OUTPUT: the single rewritten sentence ONLY (no lists, no commentary).
+        return _REWRITE_TMPL.format(text=(req_text or "").strip())
 
-Requirement:
-\"\"\"{(req_text or '').strip()}\"\"\""""
+    def _ai_batch_rewrite_prompt(items) -> str:
+        # same rules as the single rewrite, many requirements per call; items: [(id, text)]
+        payload = json.dumps([{"id": rid, "text": (txt or "").strip()} for rid, txt in items], ensure_ascii=False)
+        return _BATCH_REWRITE_TMPL.format(payload=payload)
 
     def _ai_decompose_prompt(parent_id: str, cleaned_sentence: str) -> str:
         # minimal children 2–4; preserve numbers/units; strict IDing
-        return f"""
-You are decomposing a requirement that contains multiple distinct actions.
-Produce the MINIMUM number of child requirements (2–4) needed to make each child a SINGLE, testable "shall" statement.
-RULES:
-- Preserve ALL original numeric values, units, symbols, ranges EXACTLY. Do NOT invent numbers or tighten/relax thresholds.
-- Each child must be independent and verifiable.
-- Use child IDs in the format {parent_id}.1, {parent_id}.2, ... (no other text).
-- OUTPUT FORMAT: each child on its own line as:
-{parent_id}.n: <child shall sentence>
-
-Parent requirement:
-\"\"\"{cleaned_sentence.strip()}\"\"\""""
+        return _DECOMPOSE_TMPL.format(parent_id=parent_id, text=cleaned_sentence.strip())
 
     # ---- Local AI helpers ----------------------------------------------------
-    def _ai_rewrite_clarity(api_key: str, req_text: str) -> str:
+    def _rewrite_plan(req_text: str):
         """
-        Smart rewrite:
-          - If rule engine says the requirement lacks measurable criteria or has an alert w/o trigger,
-            return a deterministic rewrite with explicit TBD placeholders (no guessing).
-          - Otherwise, call the AI with a stricter prompt.
+        Rule-engine half of the smart rewrite: (final, prompt, fallback).
+          - If the rule engine says the requirement lacks measurable criteria or has an alert w/o trigger,
+            `final` is a deterministic rewrite with explicit TBD placeholders (no guessing).
+          - Otherwise `final` is None and `prompt` is the stricter AI prompt to send.
         """
         text = (req_text or "").strip()
 
@@ -471,7 +659,7 @@ Parent requirement:
         # 3) Deterministic rewrites with explicit TBDs (no invented numbers)
         # 3a) Alerts/warnings but no trigger/condition -> add WHEN + time-to-alert TBD
         if _has("Alert without trigger"):
-            return "The system shall annunciate a warning to the crew within TBD s when <TRIGGER TBD>."
+            return "The system shall annunciate a warning to the crew within TBD s when <TRIGGER TBD>.", None, None
 
         # 3b) Weak verbs and no measurable criterion -> add measurable placeholders
         if _has("No measurable criterion"):
@@ -479,47 +667,254 @@ Parent requirement:
                 return (
                     "The system shall provide a configuration interface to set <PARAMETERS TBD>; "
                     "changes shall take effect within TBD s and be recorded per <LOGGING POLICY TBD>."
-                )
+                ), None, None
             # generic “no measurable” fallback
-            return "The system shall perform the specified function with <PERFORMANCE METRIC TBD> under <CONDITIONS TBD>."
+            return "The system shall perform the specified function with <PERFORMANCE METRIC TBD> under <CONDITIONS TBD>.", None, None
 
         # 4) If the only issue was non-binding modal, keep user wording but with “shall”
         if _has("Non-binding modal"):
             if text_fixed_modal.lower().startswith("shall "):
-                return "The system shall " + text_fixed_modal[6:]
-            return text_fixed_modal if "shall" in text_fixed_modal.lower() else f"The system shall {text_fixed_modal}"
+                return "The system shall " + text_fixed_modal[6:], None, None
+            final = text_fixed_modal if "shall" in text_fixed_modal.lower() else f"The system shall {text_fixed_modal}"
+            return final, None, None
 
         # 5) Otherwise, use AI — with a stricter prompt that prefers TBD placeholders over vagueness
-        out = get_ai_suggestion(api_key, _ai_rewrite_prompt(text_fixed_modal)) or ""
+        return None, _ai_rewrite_prompt(text_fixed_modal), text_fixed_modal
+
+    def _first_ai_line(out: str, fallback: str) -> str:
         for ln in out.splitlines():
             ln = ln.strip()
             if ln:
                 return ln
-        return out.strip() or text_fixed_modal
+        return out.strip() or fallback
+
+    # ---- Persistent AI cache (survives restarts; shared by everyone on this DB) ----
+    _llm_cache_get = getattr(db, "llm_cache_get", None)
+    _llm_cache_put = getattr(db, "llm_cache_put", None)
+
+    def _durable_key(kind: str, prompt: str) -> str:
+        return hashlib.sha256(f"{kind}|{prompt}".encode("utf-8")).hexdigest()
+
+    def _durable_lookup(kind: str, prompt: str):
+        if _llm_cache_get is None:
+            return None
+        key = _durable_key(kind, prompt)
+        durable_keys.add(key)
+        try:
+            return _llm_cache_get(key)
+        except Exception:
+            return None
+
+    def _durable_store(kind: str, prompt: str, resp: str):
+        """Empty replies and the helpers' error/no-result strings are never stored."""
+        resp = (resp or "").strip()
+        if _llm_cache_put is None or not resp or resp.startswith("An error occurred") \
+                or resp == "No decomposition produced.":
+            return
+        key = _durable_key(kind, prompt)
+        durable_keys.add(key)
+        try:
+            _llm_cache_put(key, kind, resp)
+        except Exception:
+            pass  # cache is best-effort (e.g. DB locked by a concurrent writer)
+
+    def _durable_ai(kind: str, prompt: str, call) -> str:
+        """`call()`'s reply for (kind, prompt), read from / written to the DB's llm_cache table."""
+        hit = _durable_lookup(kind, prompt)
+        if hit:
+            return hit
+        resp = (call() or "").strip()
+        _durable_store(kind, prompt, resp)
+        return resp
+
+    def _ai_rewrite_clarity(api_key: str, req_text: str) -> str:
+        """Smart rewrite: deterministic TBD rewrite when the rules allow it, else one AI call."""
+        final, prompt, fallback = _rewrite_plan(req_text)
+        if final is not None:
+            return final
+        raw = _durable_ai("rewrite", prompt, lambda: get_ai_suggestion(api_key, prompt))
+        return _first_ai_line(raw, fallback)
+
+    def _stream_with_timeout(make_stream, timeout_s: int = 20):
+        """
+        Yield make_stream()'s chunks, read on a daemon thread so a stalled stream can't
+        block the script: raises queue.Empty when no chunk arrives within timeout_s.
+        """
+        q = queue.Queue()
+        end = object()
+
+        def _pump():
+            try:
+                for chunk in make_stream():
+                    q.put(chunk)
+                q.put(end)
+            except Exception as e:
+                q.put(e)
+
+        threading.Thread(target=_pump, daemon=True).start()
+        while True:
+            item = q.get(timeout=timeout_s)
+            if item is end:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+
+    def _ai_rewrite_clarity_stream(api_key: str, req_text: str, result: list):
+        """
+        Streaming twin of _ai_rewrite_clarity for st.write_stream. The cleaned line (what
+        _ai_rewrite_clarity would return) is appended to `result` once the stream ends.
+        A stream that stalls or errors falls back to the non-streaming call, which has
+        the hard timeout and 429/5xx retries.
+        """
+        final, prompt, fallback = _rewrite_plan(req_text)
+        if final is not None:
+            result.append(final)
+            yield final
+            return
+        raw = _durable_lookup("rewrite", prompt) if api_key else None
+        if not raw and stream_ai_suggestion is not None and api_key:
+            parts = []
+            try:
+                for chunk in _stream_with_timeout(lambda: stream_ai_suggestion(api_key, prompt[:6000])):
+                    parts.append(chunk)
+                    yield chunk
+                raw = "".join(parts).strip()
+                _durable_store("rewrite", prompt, raw)
+            except Exception:
+                raw = None
+        if not raw:
+            raw = _durable_ai("rewrite", prompt, lambda: get_ai_suggestion(api_key, prompt))
+        line = _first_ai_line(raw or "", fallback)
+        result.append(line)
+
+    # At most this many AI calls in flight for the bulk actions
+    _AI_MAX_WORKERS = 8
+    # Requirements per batched rewrite prompt
+    _AI_BATCH_SIZE = 20
+
+    def _parse_batch_rewrites(raw: str) -> dict:
+        """{id: rewrite} from a JSON-array reply; anything unparsable is simply absent."""
+        s = (raw or "").strip()
+        if "[" in s and "]" in s:
+            s = s[s.index("["): s.rindex("]") + 1]
+        try:
+            data = json.loads(s)
+        except Exception:
+            return {}
+        out = {}
+        for row in data if isinstance(data, list) else []:
+            if not isinstance(row, dict):
+                continue
+            rid = str(row.get("id", "")).strip()
+            rewrite = _first_ai_line(str(row.get("rewrite", "") or ""), "")
+            if rid and rewrite:
+                out[rid] = rewrite
+        return out
+
+    def _ai_rewrite_many(api_key: str, items, prog=None, total=None):
+        """
+        Rewrite many requirements at once. The rule-engine prepass stays on this thread
+        (it writes session state); only the AI calls fan out, and the progress bar is
+        advanced here as each one completes. Returns {id: rewritten}.
+        """
+        total = total or len(items)
+        out, pending = {}, []
+        for r in items:
+            final, prompt, fallback = _rewrite_plan(r["text"])
+            if final is not None:
+                out[r["id"]] = final
+            else:
+                pending.append((r["id"], prompt, fallback))
+        done = len(out)
+        if prog is not None:
+            prog.progress(done / total)
+        if not pending:
+            return out
+
+        # 1) Batched: one JSON prompt per _AI_BATCH_SIZE requirements instead of one call each
+        if run_freeform is not None and len(pending) > 1:
+            chunks = [pending[i:i + _AI_BATCH_SIZE] for i in range(0, len(pending), _AI_BATCH_SIZE)]
+            prompts = [_ai_batch_rewrite_prompt([(rid, fallback) for rid, _, fallback in c]) for c in chunks]
+            with concurrent.futures.ThreadPoolExecutor(max_workers=min(_AI_MAX_WORKERS, len(prompts))) as ex:
+                for chunk, raw in zip(chunks, ex.map(lambda p: run_freeform(api_key, p), prompts)):
+                    got = _parse_batch_rewrites(raw)
+                    for rid, _, _ in chunk:
+                        if rid in got:
+                            out[rid] = got[rid]
+                            done += 1
+                    if prog is not None:
+                        prog.progress(done / total)
+            # 2) Whatever the batch reply missed goes through the single-item path below
+            pending = [p for p in pending if p[0] not in out]
+            if not pending:
+                return out
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=min(_AI_MAX_WORKERS, len(pending))) as ex:
+            futs = {ex.submit(_durable_ai, "rewrite", prompt, lambda p=prompt: get_ai_suggestion(api_key, p)): (rid, fallback)
+                    for rid, prompt, fallback in pending}
+            for fut in concurrent.futures.as_completed(futs):
+                rid, fallback = futs[fut]
+                try:
+                    out[rid] = _first_ai_line(fut.result() or "", fallback)
+                except Exception:
+                    pass
+                done += 1
+                if prog is not None:
+                    prog.progress(done / total)
+        return out
 
     def _ai_decompose_children(api_key: str, parent_id: str, cleaned_sentence: str) -> str:
-        return decompose_requirement_with_ai(api_key, _ai_decompose_prompt(parent_id, cleaned_sentence)) or ""
+        prompt = _ai_decompose_prompt(parent_id, cleaned_sentence)
+        return _durable_ai("decompose", prompt, lambda: decompose_requirement_with_ai(api_key, prompt))
+
+    def _parse_rewrite_decompose(raw: str):
+        """(rewritten, decomposition lines) from the fused JSON reply, or None if unusable."""
+        s = (raw or "").strip()
+        if "{" in s and "}" in s:
+            s = s[s.index("{"): s.rindex("}") + 1]
+        try:
+            data = json.loads(s)
+        except Exception:
+            return None
+        if not isinstance(data, dict):
+            return None
+        rewritten = str(data.get("rewritten") or "").strip()
+        children = data.get("decomposition")
+        if not rewritten or not isinstance(children, list):
+            return None
+        decomp = "\n".join(str(c).strip() for c in children if str(c).strip())
+        return (rewritten, decomp) if decomp else None
+
+    def _ai_rewrite_then_decompose(api_key: str, parent_id: str, req_text: str):
+        """
+        Auto pipeline: (rewritten, decomposition). When the rewrite needs the AI, both come
+        back from ONE JSON call; deterministic rewrites and unusable replies take the two-call path.
+        """
+        final, prompt, fallback = _rewrite_plan(req_text)
+        if final is None and run_freeform is not None:
+            fused = _parse_rewrite_decompose(run_freeform(
+                api_key, _REWRITE_DECOMPOSE_TMPL.format(parent_id=parent_id, text=fallback.strip())
+            ))
+            if fused is not None:
+                return fused
+        if final is None:
+            final = _first_ai_line(get_ai_suggestion(api_key, prompt) or "", fallback)
+        return final, _ai_decompose_children(api_key, parent_id, final)
 
     # --- Batch rewrite helper -------------------------------------------------
     def _ai_batch_rewrite(api_key: str, items):
         """
         items: list[dict] with keys: id, text, ambiguous, passive, incomplete, singularity
-        Stores results in st.session_state[f"rewritten_cache_{id}"]
+        Stores results in rw_cache[id]
         """
         total = len(items)
         if total == 0:
             return 0
-        prog = st.progress(0.0)
-        done = 0
-        for r in items:
-            try:
-                suggestion = _ai_rewrite_clarity(api_key, r["text"])
-                st.session_state[f"rewritten_cache_{r['id']}"] = suggestion.strip()
-                done += 1
-            except Exception:
-                pass
-            prog.progress(done / total)
-        return done
+        rewritten = _ai_rewrite_many(api_key, items, prog=st.progress(0.0))
+        for rid, suggestion in rewritten.items():
+            rw_cache[rid] = suggestion.strip()
+        return len(rewritten)
 
     # --- Batch rewrite + conditional decompose (for non-singular only) -------
     def _ai_batch_rewrite_and_decompose(api_key: str, items):
@@ -527,45 +922,50 @@ Parent requirement:
         For each flagged item:
           - rewrite to clear, singular text
           - if the original had singularity issues, also decompose (use rewritten text when available)
+        Both phases run their AI calls concurrently.
         Stores:
-          - st.session_state['rewritten_cache_{id}']
-          - st.session_state['decomp_cache_{id}']  (append if multiple decompositions)
+          - rw_cache[id]
+          - dc_cache[id]  (append if multiple decompositions)
         Returns (rewrote_count, decomposed_count)
         """
         total = len(items)
         if total == 0:
             return 0, 0
+        to_split = [r for r in items if r.get("singularity")]
+        steps = total + len(to_split)
         prog = st.progress(0.0)
-        done = 0
-        rewrote = 0
-        decomped = 0
-        for r in items:
-            # 1) rewrite
-            rewritten = ""
-            try:
-                rewritten = _ai_rewrite_clarity(api_key, r["text"]) or ""
-                st.session_state[f"rewritten_cache_{r['id']}"] = rewritten.strip()
-                if rewritten.strip():
-                    rewrote += 1
-            except Exception:
-                pass
 
-            # 2) decompose only if singularity issue present
-            if r.get("singularity"):
-                base = (rewritten.strip() or r["text"]).strip()
-                try:
-                    dec = _ai_decompose_children(api_key, r["id"], base) or ""
-                    if dec.strip():
-                        key = f"decomp_cache_{r['id']}"
-                        existing = st.session_state.get(key, "").strip()
-                        combined = (existing + "\n" + dec.strip()).strip() if existing and dec.strip() not in existing else (dec.strip() or existing)
-                        st.session_state[key] = combined
-                        decomped += 1
-                except Exception:
-                    pass
+        # 1) rewrite
+        rewritten = _ai_rewrite_many(api_key, items, prog=prog, total=steps)
+        rewrote = 0
+        for rid, text in rewritten.items():
+            rw_cache[rid] = text.strip()
+            if text.strip():
+                rewrote += 1
 
-            done += 1
-            prog.progress(done / total)
+        # 2) decompose only if singularity issue present
+        decomped = 0
+        if to_split:
+            done = total
+            with concurrent.futures.ThreadPoolExecutor(max_workers=min(_AI_MAX_WORKERS, len(to_split))) as ex:
+                futs = {
+                    ex.submit(_ai_decompose_children, api_key, r["id"],
+                              ((rewritten.get(r["id"]) or "").strip() or r["text"]).strip()): r["id"]
+                    for r in to_split
+                }
+                for fut in concurrent.futures.as_completed(futs):
+                    rid = futs[fut]
+                    try:
+                        dec = fut.result() or ""
+                        if dec.strip():
+                            existing = dc_cache.get(rid, "").strip()
+                            combined = (existing + "\n" + dec.strip()).strip() if existing and dec.strip() not in existing else (dec.strip() or existing)
+                            dc_cache[rid] = combined
+                            decomped += 1
+                    except Exception:
+                        pass
+                    done += 1
+                    prog.progress(done / steps)
         return rewrote, decomped
 
     # --- Helper: show only failing categories ---------------------------------
@@ -582,11 +982,175 @@ Parent requirement:
         if not labels:
             return ""
         chips = " ".join(
-            f"<span style='background:#FFF3CD;color:#856404;padding:4px 10px;border-radius:999px;display:inline-block;margin:0 6px 6px 0;font-size:0.85rem'>{t}</span>"
-            for t in labels
+            _BADGE_SPAN % t for t in labels
         )
         return f"<div>{chips}</div>"
 
+    # --- Helper: per-row AI actions (Quick Paste + document view) -------------
+    # Streamlit >= 1.33 can rerun just the row's fragment on a click instead of the whole tab.
+    _fragment = getattr(st, "fragment", None) or getattr(st, "experimental_fragment", None) or (lambda f: f)
+    _toggle = getattr(st, "toggle", None) or st.checkbox
+    # Streamlit >= 1.46 lays buttons out inline in one flex container instead of a columns block
+    try:
+        _HORIZONTAL = "horizontal" in inspect.signature(st.container).parameters
+    except (TypeError, ValueError):
+        _HORIZONTAL = False
+
+    @_fragment
+    def _render_ai_actions(r, key_prefix: str, key_suffix: str):
+        """
+        Tri-option logic: Fix / Decompose / Fix → Decompose depending on which
+        categories tripped. Widget keys are f"{key_prefix}<action>_{id}{key_suffix}".
+        """
+        def _key(action: str) -> str:
+            return f"{key_prefix}{action}_{r['id']}{key_suffix}"
+
+        has_amb = bool(r.get("ambiguous"))
+        has_pas = bool(r.get("passive"))
+        has_inc = bool(r.get("incomplete"))
+        has_sing = bool(r.get("singularity"))
+
+        # how many categories actually tripped
+        num_issues = int(has_amb) + int(has_pas) + int(has_inc) + int(has_sing)
+
+        def _fix():
+            try:
+                if hasattr(st, "write_stream"):
+                    # Show tokens as they arrive, then swap in the cleaned line that gets stored
+                    st.info("Rewritten:")
+                    slot, done = st.empty(), []
+                    with slot.container():
+                        st.write_stream(_ai_rewrite_clarity_stream(st.session_state.api_key, r["text"], done))
+                    suggestion = done[0] if done else ""
+                    rw_cache[r["id"]] = suggestion
+                    slot.markdown(f"> {suggestion}")
+                    return
+                suggestion = _ai_rewrite_clarity(st.session_state.api_key, r["text"])
+                rw_cache[r["id"]] = (suggestion or "").strip()
+                st.info("Rewritten:")
+                st.markdown(f"> {suggestion}")
+            except Exception as e:
+                st.warning(f"AI rewrite failed: {e}")
+
+        def _store_decomp(d: str):
+            if d.strip():
+                existing = dc_cache.get(r["id"], "").strip()
+                dc_cache[r["id"]] = ((existing + "\n" + d.strip()).strip()
+                                       if existing and d.strip() not in existing else (d.strip() or existing))
+
+        def _decompose():
+            try:
+                base = rw_cache.get(r["id"], "").strip() or r["text"]
+                d = _ai_decompose_children(st.session_state.api_key, r["id"], base)
+                _store_decomp(d)
+                st.info("Decomposition:")
+                st.markdown(dc_cache.get(r["id"], d))
+            except Exception as e:
+                st.warning(f"AI decomposition failed: {e}")
+
+        # CASE A: multiple issues and singularity present -> show all three buttons,
+        # but only once the row's toggle is on (one widget per row by default instead of four)
+        if num_issues >= 2 and has_sing:
+            if not _toggle("Show AI actions", key=_key("tgl")):
+                return
+            specs = [
+                (f"⚒️ Fix Clarity [{r['id']}]", _key("fix")),
+                (f"🧩 Decompose [{r['id']}]", _key("dec")),
+                (f"Auto: Fix → Decompose [{r['id']}]", _key("pipe")),
+            ]
+            if _HORIZONTAL:
+                with st.container(horizontal=True):
+                    fix_clicked, dec_clicked, pipe_clicked = [st.button(label, key=k) for label, k in specs]
+            else:
+                clicked = []
+                for col, (label, k) in zip(st.columns(3), specs):
+                    with col:
+                        clicked.append(st.button(label, key=k))
+                fix_clicked, dec_clicked, pipe_clicked = clicked
+
+            # results render full-width below the button row
+            if fix_clicked:
+                _fix()
+            if dec_clicked:
+                _decompose()
+
+            # Auto pipeline: Fix -> Decompose
+            if pipe_clicked:
+                try:
+                    # the spinner only mentions the rewrite when one actually runs
+                    cleaned = rw_cache.get(r["id"], "").strip()
+                    if cleaned:
+                        with st.spinner("Decomposing..."):
+                            d = _ai_decompose_children(st.session_state.api_key, r["id"], cleaned)
+                    else:
+                        with st.spinner("Rewriting, then decomposing..."):
+                            cleaned, d = _ai_rewrite_then_decompose(st.session_state.api_key, r["id"], r["text"])
+                    rw_cache[r["id"]] = cleaned
+                    _store_decomp(d)
+                    st.success("Rewritten requirement:")
+                    st.markdown(f"> {cleaned}")
+                    if dc_cache.get(r["id"], ""):
+                        st.info("Decomposition:")
+                        st.markdown(dc_cache[r["id"]])
+                except Exception as e:
+                    st.warning(f"AI pipeline failed: {e}")
+
+        # CASE B: exactly one issue
+        elif num_issues == 1:
+            # only singularity -> show Decompose
+            if has_sing:
+                if st.button(f"🧩 Decompose [{r['id']}]", key=_key("dec_only")):
+                    _decompose()
+            # only ambiguity/passive/incomplete -> show Fix only
+            else:
+                if st.button(f"⚒️ Fix Clarity [{r['id']}]", key=_key("fix_only")):
+                    _fix()
+
+        # CASE C: multiple issues but none is singularity -> Fix only
+        elif num_issues >= 2 and not has_sing:
+            if st.button(f"⚒️ Fix Clarity [{r['id']}]", key=_key("fix_multi")):
+                _fix()
+
+    # --- Helper: stream long read-only lists in chunks ------------------------
+    def _markdown_in_chunks(rows, chunk=50, sep="", html=True, writer=None):
+        """One st.markdown (or `writer`, e.g. st.success) per `chunk` rows: early rows paint while later ones are still being built."""
+        emit = writer or (lambda body: st.markdown(body, unsafe_allow_html=html))
+        buf = []
+        for row in rows:
+            buf.append(row)
+            if len(buf) == chunk:
+                emit(sep.join(buf))
+                buf = []
+        if buf:
+            emit(sep.join(buf))
+
+    # --- Helper: export table (column-major) + its cheap cache identity ---------
+    def _export_key(source, rows):
+        ai_cells = []
+        for r in rows:
+            rw = rw_cache.get(r["id"], "")
+            dc = dc_cache.get(r["id"], "")
+            if rw or dc:
+                ai_cells.append((r["id"], rw, dc))
+        # engine_sig: a rules edit changes the Ambiguity column for the same text/score
+        return (source, engine_sig, len(rows), tuple(ai_cells))
+
+    def _export_columns(rows):
+        cols = {
+            "ID": [], "Requirement": [], "Ambiguity": [], "Passive Voice": [],
+            "Incomplete": [], "Not Singular": [], "AI Rewrite": [], "AI Decomposition": [],
+        }
+        for r in rows:
+            cols["ID"].append(r["id"])
+            cols["Requirement"].append(r["text"])
+            cols["Ambiguity"].append(", ".join(r.get("ambiguous") or []))
+            cols["Passive Voice"].append(", ".join(r.get("passive") or []))
+            cols["Incomplete"].append("Yes" if r.get("incomplete") else "")
+            cols["Not Singular"].append(", ".join(r.get("singularity") or []))
+            cols["AI Rewrite"].append(rw_cache.get(r["id"], ""))
+            cols["AI Decomposition"].append(dc_cache.get(r["id"], ""))
+        return tuple((name, tuple(values)) for name, values in cols.items())
+
     # --- Helper: turn decomposition markdown/text into child rows --------------
     def _extract_child_rows_from_decomp(parent_id: str, decomp_text: str):
         """
@@ -996,6 +1560,71 @@ Parent requirement:
                          a, b, "software update policy")
         return out
 
+    # ---- Shared per-text checks (Quick Paste + documents) ----------------------
+    # Rule-set identity: edits to the JSON rules must invalidate cached analyses
+    engine_sig = hashlib.sha1(
+        json.dumps(getattr(rule_engine, "rules", None), sort_keys=True, default=str).encode("utf-8")
+    ).hexdigest()
+
+    _check_memo = {}
+    # per-run counters for the cross-rerun check cache (misses are counted inside the cached calls)
+    _check_stats = {"calls": 0, "misses": 0}
+
+    def _pure_checks_uncached(rtext: str):
+        _check_stats["misses"] += 1
+        sing = []
+        try:
+            sing = list(check_singularity(rtext) or [])
+        except Exception:
+            pass
+        return check_passive_voice(rtext), check_incompleteness(rtext), sing
+
+    def _pure_checks(rtext: str):
+        """passive / incomplete / singularity. Runs on the script thread: the spaCy parse cache is shared."""
+        _check_stats["calls"] += 1
+        pas, inc, sing = _cached_pure_checks(rtext, _pure_checks_uncached)
+        return pas, inc, list(sing)
+
+    def _ambiguity_uncached(rtext: str):
+        _check_stats["misses"] += 1
+        return _post_filter_ambiguity(rtext, safe_call_ambiguity(rtext, rule_engine))
+
+    def _ambiguity(rtext: str):
+        _check_stats["calls"] += 1
+        return _cached_ambiguity(rtext, engine_sig, _ambiguity_uncached)
+
+    def _prefetch_checks(texts):
+        """
+        Let the rule engine pre-scan every not-yet-seen text in one batch.
+        The checks themselves stay serial in _run_checks: they share the spaCy
+        pipeline and parse cache, and prime_parses has already batched the parsing.
+        """
+        todo = [t for t in dict.fromkeys(texts) if t and t not in _check_memo]
+        if hasattr(rule_engine, "prime"):
+            rule_engine.prime(todo)  # one regex pass per matcher over the whole batch
+
+    def _run_checks(rtext: str):
+        """
+        (ambiguous, passive, incomplete, singularity) for one requirement text.
+        Boilerplate repeats a lot, so each distinct text is checked once per run;
+        callers get fresh lists.
+        """
+        hit = _check_memo.get(rtext)
+        if hit is None:
+            amb = _ambiguity(rtext)
+            pas, inc, sing = _pure_checks(rtext)
+            # --- Fallback heuristics (catch things your rule engine may miss) ---
+            # 1) Multiple binding modals → definitely multiple actions
+            if len(_BINDING_MODAL_RE.findall(rtext)) >= 2:
+                sing.append("Multiple binding modals (e.g., 'shall … and shall …'). Split into separate requirements.")
+            # 2) Single modal but two coordinated predicates after it (common 'shall X … and Y …' case)
+            #    e.g., "shall provide … and support …"  (without repeating 'shall')
+            elif _COORDINATED_ACTIONS_RE.search(rtext):
+                sing.append("Multiple coordinated actions after a single modal. Consider decomposition.")
+            hit = _check_memo[rtext] = (amb, pas, inc, sing)
+        amb, pas, inc, sing = hit
+        return list(amb or []), list(pas or []), inc, list(sing)
+
     # ---- Analyze (Quick Paste) -----------------------------------------------
 
     if st.button("Analyze Pasted Lines", key="quick_analyze_btn"):
@@ -1012,30 +1641,17 @@ Parent requirement:
             quick_results = []
             # reset buckets per run
             st.session_state.quick_buckets = {"statement_missing_modal": [], "non_requirement": [], "gibberish": []}
+            # classify each distinct line once; duplicates reuse the verdict and checks
+            line_class = {t: _classify_requirement_line(t) for t in dict.fromkeys(rtx for _, rtx in pairs)}
+            prime_parses(list(line_class))
+            _prefetch_checks([t for t, (cat, _) in line_class.items() if cat == "requirement"])
             for rid, rtx in pairs:
-                cat, reason = _classify_requirement_line(rtx)
+                cat, reason = line_class[rtx]
                 if cat != "requirement":
                     st.session_state.quick_buckets[cat].append({"id": rid, "text": rtx, "reason": reason})
                     continue
 
-                amb_raw = safe_call_ambiguity(rtx, rule_engine)
-                amb = _post_filter_ambiguity(rtx, amb_raw)
-                pas = check_passive_voice(rtx)
-                inc = check_incompleteness(rtx)
-                sing = []
-                try:
-                    sing = check_singularity(rtx) or []
-                except Exception:
-                    pass
-                # --- Fallback heuristics (catch things your rule engine may miss) ---
-                # 1) Multiple binding modals → definitely multiple actions
-                if len(re.findall(r"\b(shall|must)\b", rtx, flags=re.I)) >= 2:
-                    sing.append("Multiple binding modals (e.g., 'shall … and shall …'). Split into separate requirements.")
-                # 2) Single modal but two coordinated predicates after it (common 'shall X … and Y …' case)
-                #    e.g., "shall provide … and support …"  (without repeating 'shall')
-                elif re.search(r"\b(shall|must)\b[^.]*\b(and|&)\b[^.]*\b(provide|support|ensure|maintain|encrypt|log|record|alert|compute|store|verify|transmit)\b",
-                               rtx, flags=re.I):
-                    sing.append("Multiple coordinated actions after a single modal. Consider decomposition.")
+                amb, pas, inc, sing = _run_checks(rtx)
 
                 if amb:
                     issue_counts["Ambiguity"] += 1
@@ -1052,7 +1668,8 @@ Parent requirement:
                     "ambiguous": amb,
                     "passive": pas,
                     "incomplete": inc,
-                    "singularity": sing
+                    "singularity": sing,
+                    "flagged": bool(amb or pas or inc or sing),
                 })
             st.session_state.quick_results = quick_results
             st.session_state.quick_issue_counts = issue_counts
@@ -1080,20 +1697,11 @@ Parent requirement:
         # --- Download analyzed results (Quick Paste) ---
         import io
         if quick_results:
-                df_quick = pd.DataFrame([
-                    {
-                        "ID": r["id"],
-                        "Requirement": r["text"],
-                        "Ambiguity": ", ".join(r.get("ambiguous", [])) if r.get("ambiguous") else "",
-                        "Passive Voice": ", ".join(r.get("passive", [])) if r.get("passive") else "",
-                        "Incomplete": "Yes" if r.get("incomplete") else "",
-                        "Not Singular": ", ".join(r.get("singularity", [])) if r.get("singularity") else "",
-                        "AI Rewrite": st.session_state.get(f"rewritten_cache_{r['id']}", ""),
-                        "AI Decomposition": st.session_state.get(f"decomp_cache_{r['id']}", "")
-                    }
-                    for r in quick_results
-                ])
-                csv_quick = df_quick.to_csv(index=False).encode("utf-8")
+                quick_snapshot = st.session_state.quick_text_snapshot
+                csv_quick = _download_data(lambda: _results_to_csv_bytes(
+                    _export_key(("quick", quick_snapshot), quick_results),
+                    lambda: _export_columns(quick_results),
+                ))
                 st.download_button(
                     label="📥 Download Quick Analyzer Results (CSV)",
                     data=csv_quick,
@@ -1102,8 +1710,10 @@ Parent requirement:
                     key="dl_quick_results"
                 )
 
+        # Split once; the counts, bulk actions and expanders below all reuse these lists
+        _, flagged_list, clear_list = _partition_results(quick_results)
         total = len(quick_results)
-        flagged = sum(1 for r in quick_results if r["ambiguous"] or r["passive"] or r["incomplete"] or r["singularity"])
+        flagged = len(flagged_list)
         st.markdown(f"**Analyzed:** {total} • **Flagged:** {flagged}")
         cqa = st.columns(4)
         cqa[0].metric("Ambiguity", issue_counts["Ambiguity"])
@@ -1121,10 +1731,6 @@ Parent requirement:
             with cols_bulk[1]:
                 _ai_smoke_check(label_key="ai_smoke_global")
 
-        # Define lists before rendering expanders
-        flagged_list = [r for r in quick_results if r["ambiguous"] or r["passive"] or r["incomplete"] or r["singularity"]]
-        clear_list = [r for r in quick_results if not (r["ambiguous"] or r["passive"] or r["incomplete"] or r["singularity"])]
-
         # Render classifier buckets after flagged/clear
         buckets = st.session_state.get("quick_buckets", {})
         miss = buckets.get("statement_missing_modal", [])
@@ -1137,138 +1743,49 @@ Parent requirement:
         if miss:
             st.subheader(f"🚫 Not a proper requirement — missing modal ({len(miss)})")
             st.caption("These look like sentences but are missing a binding modal. Suggest: change to “shall”.")
-            for r in miss:
-                st.markdown(
-                    f'<div style="background:#FFF3CD;color:#856404;padding:10px;border-radius:5px;margin-bottom:10px;">'
-                    f'⚠️ <strong>{r["id"]}</strong> {r["text"]}<br/><em>{r["reason"]}</em>'
-                    f'<br/><code>Suggestion: The system shall {r["text"].lstrip().rstrip(".")}</code></div>',
-                    unsafe_allow_html=True
-                )
+            _markdown_in_chunks(
+                _MISSING_MODAL_WRAP % (r["id"], r["text"], r["reason"], r["text"].lstrip().rstrip("."))
+                for r in miss
+            )
 
         if nonreq:
             st.subheader(f"🚫 Not requirements (skipped) — headings/code ({len(nonreq)})")
-            for r in nonreq:
-                st.markdown(
-                    f'<div style="background:#E2E3E5;color:#383D41;padding:10px;border-radius:5px;margin-bottom:10px;">'
-                    f'🛈 <strong>{r["id"]}</strong> {r["text"]}<br/><em>{r["reason"]}</em></div>',
-                    unsafe_allow_html=True
-                )
+            _markdown_in_chunks(_NONREQ_WRAP % (r["id"], r["text"], r["reason"]) for r in nonreq)
 
         if gib:
             st.subheader(f"🚫 Gibberish / non-language ({len(gib)})")
-            for r in gib:
-                st.markdown(
-                    f'<div style="background:#F8D7DA;color:#721C24;padding:10px;border-radius:5px;margin-bottom:10px;">'
-                    f'🚫 <strong>{r["id"]}</strong> {r["text"]}<br/><em>{r["reason"]}</em></div>',
-                    unsafe_allow_html=True
-                )
+            _markdown_in_chunks(_GIBBERISH_WRAP % (r["id"], r["text"], r["reason"]) for r in gib)
 
         with st.expander(f"Flagged ({len(flagged_list)})", expanded=True):
             if not flagged_list:
                 st.caption("None 🎉")
-            for r in flagged_list:
+            elif st.session_state.api_key:
+                # one click instead of one per row: batched prompts, calls in flight concurrently
+                if st.button(f"⚒️ Fix all {len(flagged_list)} flagged (AI)", key="qp_bulk_fix"):
+                    with st.spinner("AI rewriting all flagged requirements..."):
+                        rew_count = _ai_batch_rewrite(st.session_state.api_key, flagged_list)
+                    st.success(f"Rewrote {rew_count} requirement(s). Rewrites are included in the CSV export.")
+            # one page of rows (and their AI buttons) per rerun; the counts above use the full list
+            page_size = 25
+            n_pages = max(1, math.ceil(len(flagged_list) / page_size))
+            page = 1
+            if n_pages > 1:
+                page = int(st.number_input(
+                    f"Page (of {n_pages}, {page_size} flagged per page)",
+                    min_value=1, max_value=n_pages, value=1, step=1, key="qp_page",
+                ))
+            start = (page - 1) * page_size
+            for r in flagged_list[start:start + page_size]:
                 with st.container():
+                    # highlighted text + badges in one element
                     st.markdown(
-                        format_requirement_with_highlights(r["id"], r["text"], r),
+                        format_requirement_with_highlights(r["id"], r["text"], r) + _error_badges(r),
                         unsafe_allow_html=True,
                     )
-                    badges_html = _error_badges(r)
-                    if badges_html:
-                        st.markdown(badges_html, unsafe_allow_html=True)
-
-                    # AI actions (adaptive)
-                    has_amb = bool(r.get("ambiguous"))
-                    has_pas = bool(r.get("passive"))
-                    has_inc = bool(r.get("incomplete"))
-                    has_sing = bool(r.get("singularity"))
-
-                    num_issues = int(has_amb) + int(has_pas) + int(has_inc) + int(has_sing)
 
+                    # AI actions (adaptive); clicks rerun only this row's fragment
                     if st.session_state.api_key:
-                        # CASE A: multiple issues including singularity -> show all three
-                        if num_issues >= 2 and has_sing:
-                            cols = st.columns(3)
-
-                            with cols[0]:
-                                if st.button(f"⚒️ Fix Clarity [{r['id']}]", key=f"qp_fix_{r['id']}"):
-                                    try:
-                                        suggestion = _ai_rewrite_clarity(st.session_state.api_key, r['text'])
-                                        st.session_state[f"rewritten_cache_{r['id']}"] = (suggestion or "").strip()
-                                        st.info("Rewritten:")
-                                        st.markdown(f"> {suggestion}")
-                                    except Exception as e:
-                                        st.warning(f"AI rewrite failed: {e}")
-
-                            with cols[1]:
-                                if st.button(f"🧩 Decompose [{r['id']}]", key=f"qp_dec_{r['id']}"):
-                                    try:
-                                        base = st.session_state.get(f"rewritten_cache_{r['id']}", "").strip() or r["text"]
-                                        d = _ai_decompose_children(st.session_state.api_key, r["id"], base)
-                                        if d.strip():
-                                            key = f"decomp_cache_{r['id']}"
-                                            existing = st.session_state.get(key, "").strip()
-                                            st.session_state[key] = ((existing + "\n" + d.strip()).strip()
-                                                                     if existing and d.strip() not in existing else (d.strip() or existing))
-                                        st.info("Decomposition:")
-                                        st.markdown(st.session_state.get(f"decomp_cache_{r['id']}", d))
-                                    except Exception as e:
-                                        st.warning(f"AI decomposition failed: {e}")
-
-                            with cols[2]:
-                                if st.button(f"Auto: Fix → Decompose [{r['id']}]", key=f"qp_pipe_{r['id']}"):
-                                    try:
-                                        cleaned = st.session_state.get(f"rewritten_cache_{r['id']}","").strip() or _ai_rewrite_clarity(st.session_state.api_key, r["text"])
-                                        st.session_state[f"rewritten_cache_{r['id']}"] = cleaned
-                                        d = _ai_decompose_children(st.session_state.api_key, r["id"], cleaned)
-                                        if d.strip():
-                                            key = f"decomp_cache_{r['id']}"
-                                            existing = st.session_state.get(key, "").strip()
-                                            st.session_state[key] = ((existing + "\n" + d.strip()).strip()
-                                                                     if existing and d.strip() not in existing else (d.strip() or existing))
-                                        st.success("Rewritten requirement:")
-                                        st.markdown(f"> {cleaned}")
-                                        if st.session_state.get(f"decomp_cache_{r['id']}", ""):
-                                            st.info("Decomposition:")
-                                            st.markdown(st.session_state[f"decomp_cache_{r['id']}"])
-                                    except Exception as e:
-                                        st.warning(f"AI pipeline failed: {e}")
-
-                        # CASE B: exactly one issue
-                        elif num_issues == 1:
-                            if has_sing:
-                                if st.button(f"🧩 Decompose [{r['id']}]", key=f"qp_dec_only_{r['id']}"):
-                                    try:
-                                        base = st.session_state.get(f"rewritten_cache_{r['id']}", "").strip() or r["text"]
-                                        d = _ai_decompose_children(st.session_state.api_key, r["id"], base)
-                                        if d.strip():
-                                            key = f"decomp_cache_{r['id']}"
-                                            existing = st.session_state.get(key, "").strip()
-                                            st.session_state[key] = ((existing + "\n" + d.strip()).strip()
-                                                                     if existing and d.strip() not in existing else (d.strip() or existing))
-                                        st.info("Decomposition:")
-                                        st.markdown(st.session_state.get(f"decomp_cache_{r['id']}", d))
-                                    except Exception as e:
-                                        st.warning(f"AI decomposition failed: {e}")
-                            else:
-                                if st.button(f"⚒️ Fix Clarity [{r['id']}]", key=f"qp_fix_only_{r['id']}"):
-                                    try:
-                                        suggestion = _ai_rewrite_clarity(st.session_state.api_key, r['text'])
-                                        st.session_state[f"rewritten_cache_{r['id']}"] = (suggestion or "").strip()
-                                        st.info("Rewritten:")
-                                        st.markdown(f"> {suggestion}")
-                                    except Exception as e:
-                                        st.warning(f"AI rewrite failed: {e}")
-
-                        # CASE C: multiple issues but none is singularity
-                        elif num_issues >= 2 and not has_sing:
-                            if st.button(f"⚒️ Fix Clarity [{r['id']}]", key=f"qp_fix_multi_{r['id']}"):
-                                try:
-                                    suggestion = _ai_rewrite_clarity(st.session_state.api_key, r['text'])
-                                    st.session_state[f"rewritten_cache_{r['id']}"] = (suggestion or "").strip()
-                                    st.info("Rewritten:")
-                                    st.markdown(f"> {suggestion}")
-                                except Exception as e:
-                                    st.warning(f"AI rewrite failed: {e}")
+                        _render_ai_actions(r, "qp_", "")
             else:
                 st.caption("ℹ️ Enter your Google AI API key to enable Fix/Decompose actions.")
 
@@ -1277,12 +1794,8 @@ Parent requirement:
 
         # Insert Quick-Paste Clear expander after the flagged/detailed analysis block
         with st.expander(f"Clear ({len(clear_list)})", expanded=True):
-            for r in clear_list:
-                st.markdown(
-                    f'<div style="background-color:#D4EDDA;color:#155724;padding:10px;'
-                    f'border-radius:5px;margin-bottom:10px;">✅ <strong>{r["id"]}</strong> {r["text"]}</div>',
-                    unsafe_allow_html=True,
-                )
+            _markdown_in_chunks((f"✅ **{r['id']}** {r['text']}" for r in clear_list),
+                                sep="\n\n", writer=st.success)
 
         # --------------- NEW (Quick Paste): Contradiction detection ---------------
     st.subheader("AI Contradiction Scan (Quick Paste)")
@@ -1364,17 +1877,20 @@ Parent requirement:
     project_id = st.session_state.selected_project[0] if st.session_state.selected_project else None
     project_id = (st.session_state.get("selected_project") or [None])[0]
 
+    def _stored_docs_listing(pid):
+        """(stored_docs, labels) for the re-analyze picker, from the cached project listing."""
+        stored_docs, labels = [], []
+        for (doc_id, file_name, version, _up, _score, conv_path, exists) in \
+                _project_documents(pid, db, CTX["_sanitize_filename"]):
+            if exists:
+                stored_docs.append((doc_id, file_name, version, conv_path))
+                labels.append(f"{file_name} (v{version})")
+        return stored_docs, labels
+
     stored_to_analyze = None
     if project_id is not None and hasattr(db, "get_documents_for_project"):
         try:
-            _rows = db.get_documents_for_project(project_id)
-            stored_docs, labels = [], []
-            for (doc_id, file_name, version, uploaded_at, clarity_score) in _rows:
-                conv_path = os.path.join("data", "projects", str(project_id), "documents",
-                                         f"{doc_id}_{CTX['_sanitize_filename'](file_name)}")
-                if os.path.exists(conv_path):
-                    stored_docs.append((doc_id, file_name, version, conv_path))
-                    labels.append(f"{file_name} (v{version})")
+            stored_docs, labels = _stored_docs_listing(project_id)
             if stored_docs:
                 sel = st.selectbox("Re-analyze a saved document:", ["— Select —"] + labels, key="rean_select")
                 if sel != "— Select —":
@@ -1391,6 +1907,8 @@ Parent requirement:
         accept_multiple_files=True,
         key=f"uploader_unified_{project_id or 'none'}",
     )
+    # start .docx parsing in the background while the rest of the form renders
+    CTX.get("prefetch_docx", lambda _files: None)(uploaded_files)
 
     example_files = {"Choose an example...": None, "Drone System SRS (Complex Example)": "DRONE_SRS_v1.0.docx"}
     selected_example = st.selectbox(
@@ -1406,12 +1924,7 @@ Parent requirement:
     if selected_example != "Choose an example...":
         example_path = example_files[selected_example]
         try:
-            if example_path.endswith(".docx"):
-                d = docx.Document(example_path)
-                example_text = "\n".join([p.text for p in d.paragraphs if p.text.strip()])
-            else:
-                with open(example_path, "r", encoding="utf-8") as f:
-                    example_text = f.read()
+            example_text = load_example_text(example_path, os.path.getmtime(example_path), CTX.get("_docx_body_text"))
             docs_to_process.append(("example", selected_example, example_text))
         except FileNotFoundError:
             st.error(f"Example file not found: {example_path}. Place it in the project folder.")
@@ -1514,131 +2027,173 @@ Parent requirement:
 
         return False
 
-    # === Analyzer-local AI helpers (shared) ===================================
-    def _ai_rewrite_clarity_doc(api_key: str, req_text: str) -> str:
-        out = get_ai_suggestion(st.session_state.api_key, _ai_rewrite_prompt(req_text)) or ""
-        for ln in out.splitlines():
-            ln = ln.strip()
-            if ln:
-                return ln
-        return out.strip()
-
-    def _ai_decompose_clean_doc(api_key: str, parent_id: str, req_text: str) -> str:
-        return decompose_requirement_with_ai(api_key, _ai_decompose_prompt(parent_id, req_text)) or ""
-    # ==========================================================================
-
     # Collect rows for cross-document contradiction scanning
     all_doc_req_rows = []   # list[{"id","text","doc"}] across all analyzed docs
 
+    def _extract_doc_reqs(src_type, payload, api_key=None):
+        """
+        Extract requirements (AI + standard + table), merge/dedupe and drop headings.
+        Takes the API key as an argument (no session_state access) so it can run on a worker thread.
+        """
+        std_reqs, table_reqs, ai_reqs = [], [], []
+
+        if src_type == "upload":
+            if payload.name.endswith(".txt"):
+                raw = payload.getvalue().decode("utf-8", errors="ignore")
+                std_reqs = extract_requirements_from_string(raw) or []
+                if use_ai_parser and HAS_AI_PARSER and api_key:
+                    ai_reqs = extract_requirements_with_ai(api_key, raw) or []
+            elif payload.name.endswith(".docx"):
+                parts, table_rows = _read_docx_parts_and_rows(payload)
+                table_reqs = _extract_requirements_from_table_rows(table_rows) or []
+                # paragraphs go straight to the matcher; the joined text is only built for the AI parser
+                std_reqs = list(iter_requirements(parts))
+                if use_ai_parser and HAS_AI_PARSER and api_key:
+                    ai_reqs = extract_requirements_with_ai(api_key, "\n".join(parts)) or []
+        elif src_type == "stored":
+            path = payload
+            if path.endswith(".txt"):
+                with open(path, "r", encoding="utf-8", errors="ignore") as f:
+                    raw = f.read()
+                std_reqs = extract_requirements_from_string(raw) or []
+                if use_ai_parser and HAS_AI_PARSER and api_key:
+                    ai_reqs = extract_requirements_with_ai(api_key, raw) or []
+            elif path.endswith(".docx"):
+                parts, table_rows = _read_docx_parts_and_rows_from_path(path)
+                table_reqs = _extract_requirements_from_table_rows(table_rows) or []
+                # paragraphs go straight to the matcher; the joined text is only built for the AI parser
+                std_reqs = list(iter_requirements(parts))
+                if use_ai_parser and HAS_AI_PARSER and api_key:
+                    ai_reqs = extract_requirements_with_ai(api_key, "\n".join(parts)) or []
+        else:  # example
+            std_reqs = extract_requirements_from_string(payload) or []
+            if use_ai_parser and HAS_AI_PARSER and api_key:
+                ai_reqs = extract_requirements_with_ai(api_key, payload) or []
+
+        # Merge + dedupe
+        reqs = _merge_unique_reqs(table_reqs, std_reqs, ai_reqs)
+        # Filter headings BEFORE analysis
+        reqs = [(rid, rtx) for (rid, rtx) in reqs if not _looks_like_heading(rtx)]
+        return reqs
+
+    # Requirements per cached analysis chunk (and per progress-bar step)
+    _ANALYZE_CHUNK = 25
+
+    def _analyze_doc_reqs(reqs):
+        """Run the clarity checks over (id, text) pairs; returns (results, issue_counts)."""
+        results = []
+        issue_counts = {"Ambiguity": 0, "Passive Voice": 0, "Incompleteness": 0, "Singularity": 0}
+        # one nlp.pipe pass over the document; the checks below reuse the parses
+        # gate each distinct text once; repeated rows reuse the verdict and checks
+        is_req = {t: _is_requirement_strict(t) for t in dict.fromkeys(rtext for _, rtext in reqs)}
+        prime_parses(list(is_req))
+        _prefetch_checks([t for t, ok in is_req.items() if ok])
+
+        for rid, rtext in reqs:
+            # Hard gate: if not a requirement, record and skip analysis
+            if not is_req[rtext]:
+                results.append({
+                    "id": rid,
+                    "text": rtext,
+                    "ambiguous": [],
+                    "passive": [],
+                    "incomplete": False,
+                    "singularity": [],
+                    "flagged": False,
+                    "non_requirement": True,
+                })
+                continue
+
+            ambiguous, passive, incomplete, singular = _run_checks(rtext)
+
+            if ambiguous:
+                issue_counts["Ambiguity"] += 1
+            if passive:
+                issue_counts["Passive Voice"] += 1
+            if incomplete:
+                issue_counts["Incompleteness"] += 1
+            if singular:
+                issue_counts["Singularity"] += 1
+
+            results.append({
+                "id": rid,
+                "text": rtext,
+                "ambiguous": ambiguous,
+                "passive": passive,
+                "incomplete": incomplete,
+                "singularity": singular,
+                "flagged": bool(ambiguous or passive or incomplete or singular),
+            })
+            results[-1]["_issues_caption"] = _issues_caption(results[-1])
+
+        return results, issue_counts
+
     if docs_to_process:
         with st.spinner("Processing and analyzing documents..."):
+            # --- Extract requirements (AI + standard + table) and merge/dedupe ---
+            # Reruns reuse the parse for an unchanged upload (keyed on content hash + parser mode);
+            # everything else is extracted up front, several documents at a time (file I/O + AI parser calls).
+            api_key = st.session_state.api_key
+            parsed = st.session_state.setdefault("parsed_uploads", {})
+            doc_keys, ready, pending = [], {}, {}
             for doc_idx, (src_type, display_name, payload) in enumerate(docs_to_process):
-                # --- Extract requirements (AI + standard + table) and merge/dedupe ---
-                std_reqs, table_reqs, ai_reqs = [], [], []
-
                 if src_type == "upload":
-                    if payload.name.endswith(".txt"):
-                        raw = payload.getvalue().decode("utf-8", errors="ignore")
-                        std_reqs = extract_requirements_from_string(raw) or []
-                        if use_ai_parser and HAS_AI_PARSER and st.session_state.api_key:
-                            ai_reqs = extract_requirements_with_ai(st.session_state.api_key, raw) or []
-                    elif payload.name.endswith(".docx"):
-                        flat_text, table_rows = _read_docx_text_and_rows(payload)
-                        table_reqs = _extract_requirements_from_table_rows(table_rows) or []
-                        std_reqs = extract_requirements_from_string(flat_text) or []
-                        if use_ai_parser and HAS_AI_PARSER and st.session_state.api_key:
-                            ai_reqs = extract_requirements_with_ai(st.session_state.api_key, flat_text) or []
-                elif src_type == "stored":
-                    path = payload
-                    if path.endswith(".txt"):
-                        with open(path, "r", encoding="utf-8", errors="ignore") as f:
-                            raw = f.read()
-                        std_reqs = extract_requirements_from_string(raw) or []
-                        if use_ai_parser and HAS_AI_PARSER and st.session_state.api_key:
-                            ai_reqs = extract_requirements_with_ai(st.session_state.api_key, raw) or []
-                    elif path.endswith(".docx"):
-                        flat_text, table_rows = _read_docx_text_and_rows_from_path(path)
-                        table_reqs = _extract_requirements_from_table_rows(table_rows) or []
-                        std_reqs = extract_requirements_from_string(flat_text) or []
-                        if use_ai_parser and HAS_AI_PARSER and st.session_state.api_key:
-                            ai_reqs = extract_requirements_with_ai(st.session_state.api_key, flat_text) or []
-                else:  # example
-                    std_reqs = extract_requirements_from_string(payload) or []
-                    if use_ai_parser and HAS_AI_PARSER and st.session_state.api_key:
-                        ai_reqs = extract_requirements_with_ai(st.session_state.api_key, payload) or []
-
-                # Merge + dedupe
-                reqs = _merge_unique_reqs(table_reqs, std_reqs, ai_reqs)
-                # Filter headings BEFORE analysis
-                reqs = [(rid, rtx) for (rid, rtx) in reqs if not _looks_like_heading(rtx)]
+                    doc_key = (
+                        hashlib.blake2b(payload.getvalue(), digest_size=16).hexdigest(),
+                        bool(use_ai_parser and HAS_AI_PARSER and api_key),
+                    )
+                    if doc_key in parsed:
+                        ready[doc_idx] = parsed[doc_key]
+                    else:
+                        pending[doc_idx] = (src_type, payload)
+                else:
+                    doc_key = (display_name, src_type)
+                    pending[doc_idx] = (src_type, payload)
+                doc_keys.append(doc_key)
+            if len(pending) > 1:
+                with concurrent.futures.ThreadPoolExecutor(max_workers=min(4, len(pending))) as ex:
+                    futures = {i: ex.submit(_extract_doc_reqs, src, pl, api_key) for i, (src, pl) in pending.items()}
+                    ready.update((i, f.result()) for i, f in futures.items())
+            else:
+                ready.update((i, _extract_doc_reqs(src, pl, api_key)) for i, (src, pl) in pending.items())
+
+            for doc_idx, (src_type, display_name, payload) in enumerate(docs_to_process):
+                doc_key = doc_keys[doc_idx]
+                reqs = ready[doc_idx]
+                if src_type == "upload" and doc_idx in pending:
+                    if len(parsed) >= 16:
+                        parsed.pop(next(iter(parsed)))
+                    parsed[doc_key] = reqs
                 if not reqs:
                     st.warning(f"⚠️ No recognizable requirements in **{display_name}** after filtering headings.")
                     continue
 
                 # --- Analyze requirements --------------------------------------------
 
+                # Analyzed in chunks so the progress bar moves on long documents; each chunk is
+                # cached on its own, so reruns with the same requirements and rules skip the checks.
+                # (The bar lives out here: cached functions must not write to outside elements.)
+                reqs_t = tuple(reqs)
                 results = []
                 issue_counts = {"Ambiguity": 0, "Passive Voice": 0, "Incompleteness": 0, "Singularity": 0}
-
-                for rid, rtext in reqs:
-                    # Hard gate: if not a requirement, record and skip analysis
-                    if not _is_requirement_strict(rtext):
-                        results.append({
-                            "id": rid,
-                            "text": rtext,
-                            "ambiguous": [],
-                            "passive": [],
-                            "incomplete": False,
-                            "singularity": [],
-                            "non_requirement": True,
-                        })
-                        continue
-
-                    ambiguous = _post_filter_ambiguity(rtext, safe_call_ambiguity(rtext, rule_engine))
-                    passive = check_passive_voice(rtext)
-                    incomplete = check_incompleteness(rtext)
-                    try:
-                        singular = check_singularity(rtext)
-                    except Exception:
-                        singular = []
-
-                    # --- Fallback heuristics (catch things your rule engine may miss) ---
-                    # 1) Multiple binding modals → definitely multiple actions
-                    if len(re.findall(r"\b(shall|must)\b", rtext, flags=re.I)) >= 2:
-                        singular = singular or []
-                        singular.append("Multiple binding modals (e.g., 'shall … and shall …'). Split into separate requirements.")
-                    # 2) Single modal but two coordinated predicates after it (common 'shall X … and Y …' case)
-                    #    e.g., "shall provide … and support …"  (without repeating 'shall')
-                    elif re.search(r"\b(shall|must)\b[^.]*\b(and|&)\b[^.]*\b(provide|support|ensure|maintain|encrypt|log|record|alert|compute|store|verify|transmit)\b",
-                                   rtext, flags=re.I):
-                        singular = singular or []
-                        singular.append("Multiple coordinated actions after a single modal. Consider decomposition.")
-
-                    if ambiguous:
-                        issue_counts["Ambiguity"] += 1
-                    if passive:
-                        issue_counts["Passive Voice"] += 1
-                    if incomplete:
-                        issue_counts["Incompleteness"] += 1
-                    if singular:
-                        issue_counts["Singularity"] += 1
-
-                    results.append({
-                        "id": rid,
-                        "text": rtext,
-                        "ambiguous": ambiguous,
-                        "passive": passive,
-                        "incomplete": incomplete,
-                        "singularity": singular,
-                    })
-
-                # Totals should use only true requirements
-                analyzed_only = [r for r in results if not r.get("non_requirement")]
+                prog_ph = st.empty() if len(reqs_t) > _ANALYZE_CHUNK else None
+                for start in range(0, len(reqs_t), _ANALYZE_CHUNK):
+                    part, counts = _analyze_reqs_cached(
+                        reqs_t[start:start + _ANALYZE_CHUNK], engine_sig, _analyze_doc_reqs
+                    )
+                    results.extend(part)
+                    for k, v in counts.items():
+                        issue_counts[k] = issue_counts.get(k, 0) + v
+                    if prog_ph is not None:
+                        done_n = min(start + _ANALYZE_CHUNK, len(reqs_t))
+                        prog_ph.progress(done_n / len(reqs_t), text=f"Analyzing {display_name}: {done_n}/{len(reqs_t)}")
+                if prog_ph is not None:
+                    prog_ph.empty()
+
+                # Totals should use only true requirements (one pass splits analyzed/flagged/clear)
+                analyzed_only, flagged_doc, clear_list_doc = _partition_results(results)
                 total_reqs = len(analyzed_only)
-                flagged_total = sum(
-                    1 for r in analyzed_only
-                    if r["ambiguous"] or r["passive"] or r["incomplete"] or r["singularity"]
-                )
+                flagged_total = len(flagged_doc)
                 clarity_score = int(((total_reqs - flagged_total) / total_reqs) * 100) if total_reqs else 100
 
                 # Prepare rows for per-document and cross-document AI contradiction scan
@@ -1646,10 +2201,22 @@ Parent requirement:
                 all_doc_req_rows.extend(doc_req_rows)
 
                 # --- Save to DB if helpers exist and a project is selected ------------
-                if (st.session_state.selected_project is not None) and (src_type in ("upload", "example")):
+                # Saving is a side effect: do it once per (project, file content, score), not on every rerun.
+                saved_docs = st.session_state.setdefault("saved_doc_keys", set())
+                save_key = (
+                    (st.session_state.selected_project or [None])[0], display_name, doc_key[0], clarity_score
+                )
+                if (st.session_state.selected_project is not None) and (src_type in ("upload", "example")) \
+                        and save_key not in saved_docs:
                     project_id = st.session_state.selected_project[0]
                     try:
-                        if hasattr(db, "add_document") and hasattr(db, "add_requirements") and hasattr(db, "get_documents_for_project"):
+                        doc_id = None
+                        if hasattr(db, "add_document_with_requirements"):
+                            # document row + all requirement rows in one transaction
+                            doc_id, _version = db.add_document_with_requirements(
+                                project_id, display_name, clarity_score, reqs
+                            )
+                        elif hasattr(db, "add_document") and hasattr(db, "add_requirements") and hasattr(db, "get_documents_for_project"):
                             existing = []
                             try:
                                 existing = [d for d in db.get_documents_for_project(project_id) if d[1] == display_name]
@@ -1658,25 +2225,14 @@ Parent requirement:
                             next_version = (max([d[2] for d in existing], default=0) + 1)
                             doc_id = db.add_document(project_id, display_name, next_version, clarity_score)
                             db.add_requirements(doc_id, reqs)
-
-                            if src_type == "upload":
-                                try:
-                                    file_path = _save_uploaded_file_for_doc(project_id, doc_id, display_name, payload)
-                                    if hasattr(db, "add_document_file"):
-                                        try:
-                                            db.add_document_file(doc_id, file_path)
-                                        except Exception:
-                                            pass
-                                    elif hasattr(db, "set_document_file_path"):
-                                        try:
-                                            db.set_document_file_path(doc_id, file_path)
-                                        except Exception:
-                                            pass
-                                except Exception as _e:
-                                    st.warning(f"Saved analysis, but file persistence failed for '{display_name}': {_e}")
                         elif hasattr(db, "add_document_to_project") and hasattr(db, "add_requirements_to_document"):
                             doc_id = db.add_document_to_project(project_id, display_name, clarity_score)
                             db.add_requirements_to_document(doc_id, reqs)
+                        else:
+                            st.info("Analysis done — DB helpers not found, so nothing was saved.")
+
+                        if doc_id is not None:
+                            saved_docs.add(save_key)
 
                             if src_type == "upload":
                                 try:
@@ -1693,10 +2249,10 @@ Parent requirement:
                                             pass
                                 except Exception as _e:
                                     st.warning(f"Saved analysis, but file persistence failed for '{display_name}': {_e}")
-                        else:
-                            st.info("Analysis done — DB helpers not found, so nothing was saved.")
                     except Exception as e:
                         st.warning(f"Saved analysis for **{display_name}**, but DB write failed: {e}")
+                    # a new version was (possibly) stored: refresh the project listings
+                    _project_documents.clear()
 
                 # --- Per-document results UI -----------------------------------------
                 with st.expander(f"📄 {display_name} — Clarity {clarity_score}/100 • {total_reqs} requirements"):
@@ -1718,8 +2274,7 @@ Parent requirement:
                                         {"id": r["id"], "text": r["text"], "ambiguous": r["ambiguous"],
                                          "passive": r["passive"], "incomplete": r["incomplete"],
                                          "singularity": r["singularity"]}
-                                        for r in analyzed_only
-                                        if r["ambiguous"] or r["passive"] or r["incomplete"] or r["singularity"]
+                                        for r in flagged_doc
                                     ]
                                     rew_count = _ai_batch_rewrite(st.session_state.api_key, flagged_for_rewrite)
                                 st.success(f"Rewrote {rew_count} requirement(s).")
@@ -1730,8 +2285,7 @@ Parent requirement:
                                         {"id": r["id"], "text": r["text"], "ambiguous": r["ambiguous"],
                                          "passive": r["passive"], "incomplete": r["incomplete"],
                                          "singularity": r["singularity"]}
-                                        for r in analyzed_only
-                                        if r["ambiguous"] or r["passive"] or r["incomplete"] or r["singularity"]
+                                        for r in flagged_doc
                                     ]
                                     rew_count, dec_count = _ai_batch_rewrite_and_decompose(st.session_state.api_key, flagged_for_action)
                                 st.success(f"Rewrote {rew_count} and decomposed {dec_count} requirement(s).")
@@ -1765,8 +2319,7 @@ Parent requirement:
                     #             else:
                     #                 st.info("No contradictions detected by AI for this document.")
                     # --- AI Contradiction Scan (this document) — instrumented ---
-                    doc_req_rows = [{"id": r["id"], "text": r["text"], "doc": display_name}
-                                    for r in analyzed_only]
+                    # (doc_req_rows was built right after analysis)
                     subkey = re.sub(r"[^A-Za-z0-9]+", "_", f"{display_name}_{doc_idx}")
                     st.subheader("AI Contradiction Scan — This Document")
                     ai_temp_doc = 0.1
@@ -1849,24 +2402,16 @@ Parent requirement:
 
                     st.subheader("Issues by Type")
                     
+                    import pandas as pd
                     st.bar_chart(pd.Series(issue_counts, name="Count"))
-                        # --- Download analyzed results (This Document) ---
-                    import io
+
+                    # --- Download analyzed results (This Document) ---
                     if analyzed_only:
-                        df_doc = pd.DataFrame([
-                            {
-                                "ID": r["id"],
-                                "Requirement": r["text"],
-                                "Ambiguity": ", ".join(r.get("ambiguous", [])) if r.get("ambiguous") else "",
-                                "Passive Voice": ", ".join(r.get("passive", [])) if r.get("passive") else "",
-                                "Incomplete": "Yes" if r.get("incomplete") else "",
-                                "Not Singular": ", ".join(r.get("singularity", [])) if r.get("singularity") else "",
-                                "AI Rewrite": st.session_state.get(f"rewritten_cache_{r['id']}", ""),
-                                "AI Decomposition": st.session_state.get(f"decomp_cache_{r['id']}", "")
-                            }
-                            for r in analyzed_only
-                        ])
-                        csv_doc = df_doc.to_csv(index=False).encode("utf-8")
+                        csv_doc = _download_data(
+                            lambda analyzed_only=analyzed_only, key=("doc", doc_key, clarity_score):
+                                _results_to_csv_bytes(_export_key(key, analyzed_only),
+                                                      lambda: _export_columns(analyzed_only))
+                        )
                         st.download_button(
                             label=f"📥 Download Results for {display_name} (CSV)",
                             data=csv_doc,
@@ -1877,154 +2422,49 @@ Parent requirement:
 
                     # Debug: show all accepted requirement lines
                     with st.expander("Debug: show all accepted requirement lines"):
-                        for rid, rtext in [(r["id"], r["text"]) for r in analyzed_only]:
-                            st.markdown(f"- **{rid}**: {rtext}")
+                        _markdown_in_chunks((f"- **{r['id']}**: {r['text']}" for r in analyzed_only),
+                                            sep="\n", html=False)
 
                     st.subheader("Detailed Analysis")
-                    for r_idx, r in enumerate(analyzed_only):
-                        is_flagged = r["ambiguous"] or r["passive"] or r["incomplete"] or r["singularity"]
-                        if is_flagged:
-                            with st.container():
-                                st.markdown(
-                                    format_requirement_with_highlights(r["id"], r["text"], r),
-                                    unsafe_allow_html=True,
-                                )
-                                badges_html = _error_badges(r)
-                                if badges_html:
-                                    st.markdown(badges_html, unsafe_allow_html=True)
-                                if r["ambiguous"]:
-                                    st.caption(f"ⓘ **Ambiguity:** {', '.join(r['ambiguous'])}")
-                                if r["passive"]:
-                                    st.caption(f"ⓘ **Passive Voice:** {', '.join(r['passive'])}")
-                                if r["incomplete"]:
-                                    st.caption("ⓘ **Incompleteness** detected.")
-                                if r["singularity"]:
-                                    st.caption(f"ⓘ **Singularity:** {', '.join(r['singularity'])}")
-
-                                # === AI actions (Document view) — tri-option logic ===
-                                has_amb = bool(r.get("ambiguous"))
-                                has_pas = bool(r.get("passive"))
-                                has_inc = bool(r.get("incomplete"))
-                                has_sing = bool(r.get("singularity"))
-
-                                # how many categories actually tripped
-                                num_issues = int(has_amb) + int(has_pas) + int(has_inc) + int(has_sing)
-
-                                # namespacing for Streamlit keys so buttons don't collide across rows
-                                ns = f"doc_{doc_idx}_{r_idx}"
-
-                                if st.session_state.api_key:
-                                    # CASE A: multiple issues and singularity present -> show all three buttons
-                                    if num_issues >= 2 and has_sing:
-                                        cols = st.columns(3)
-
-                                        # Fix Clarity
-                                        with cols[0]:
-                                            if st.button(f"⚒️ Fix Clarity [{r['id']}]", key=f"fix_{r['id']}_{ns}"):
-                                                try:
-                                                    suggestion = _ai_rewrite_clarity(st.session_state.api_key, r["text"])
-                                                    st.session_state[f"rewritten_cache_{r['id']}"] = (suggestion or "").strip()
-                                                    st.info("Rewritten:")
-                                                    st.markdown(f"> {suggestion}")
-                                                except Exception as e:
-                                                    st.warning(f"AI rewrite failed: {e}")
-
-                                        # Decompose
-                                        with cols[1]:
-                                            if st.button(f"🧩 Decompose [{r['id']}]", key=f"dec_{r['id']}_{ns}"):
-                                                try:
-                                                    base = (st.session_state.get(f"rewritten_cache_{r['id']}", "").strip()
-                                                            or r["text"])
-                                                    d = _ai_decompose_children(st.session_state.api_key, r["id"], base)
-                                                    if d.strip():
-                                                        k = f"decomp_cache_{r['id']}"
-                                                        existing = st.session_state.get(k, "").strip()
-                                                        st.session_state[k] = ((existing + "\n" + d.strip()).strip()
-                                                                               if existing and d.strip() not in existing else (d.strip() or existing))
-                                                    st.info("Decomposition:")
-                                                    st.markdown(st.session_state.get(f"decomp_cache_{r['id']}", d))
-                                                except Exception as e:
-                                                    st.warning(f"AI decomposition failed: {e}")
-
-                                        # Auto pipeline: Fix -> Decompose
-                                        with cols[2]:
-                                            if st.button(f"Auto: Fix → Decompose [{r['id']}]", key=f"pipe_{r['id']}_{ns}"):
-                                                try:
-                                                    cleaned = (st.session_state.get(f"rewritten_cache_{r['id']}", "").strip()
-                                                               or _ai_rewrite_clarity(st.session_state.api_key, r["text"]))
-                                                    st.session_state[f"rewritten_cache_{r['id']}"] = cleaned
-                                                    d = _ai_decompose_children(st.session_state.api_key, r["id"], cleaned)
-                                                    if d.strip():
-                                                        k = f"decomp_cache_{r['id']}"
-                                                        existing = st.session_state.get(k, "").strip()
-                                                        st.session_state[k] = ((existing + "\n" + d.strip()).strip()
-                                                                               if existing and d.strip() not in existing else (d.strip() or existing))
-                                                    st.success("Rewritten requirement:")
-                                                    st.markdown(f"> {cleaned}")
-                                                    if st.session_state.get(f"decomp_cache_{r['id']}", ""):
-                                                        st.info("Decomposition:")
-                                                        st.markdown(st.session_state[f"decomp_cache_{r['id']}"])
-                                                except Exception as e:
-                                                    st.warning(f"AI pipeline failed: {e}")
-
-                                    # CASE B: exactly one issue
-                                    elif num_issues == 1:
-                                        # only singularity -> show Decompose
-                                        if has_sing:
-                                            if st.button(f"🧩 Decompose [{r['id']}]", key=f"dec_only_{r['id']}_{ns}"):
-                                                try:
-                                                    base = (st.session_state.get(f"rewritten_cache_{r['id']}", "").strip()
-                                                            or r["text"])
-                                                    d = _ai_decompose_children(st.session_state.api_key, r["id"], base)
-                                                    if d.strip():
-                                                        k = f"decomp_cache_{r['id']}"
-                                                        existing = st.session_state.get(k, "").strip()
-                                                        st.session_state[k] = ((existing + "\n" + d.strip()).strip()
-                                                                               if existing and d.strip() not in existing else (d.strip() or existing))
-                                                    st.info("Decomposition:")
-                                                    st.markdown(st.session_state.get(f"decomp_cache_{r['id']}", d))
-                                                except Exception as e:
-                                                    st.warning(f"AI decomposition failed: {e}")
-                                        # only ambiguity/passive/incomplete -> show Fix only
-                                        else:
-                                            if st.button(f"⚒️ Fix Clarity [{r['id']}]", key=f"fix_only_{r['id']}_{ns}"):
-                                                try:
-                                                    suggestion = _ai_rewrite_clarity(st.session_state.api_key, r["text"])
-                                                    st.session_state[f"rewritten_cache_{r['id']}"] = (suggestion or "").strip()
-                                                    st.info("Rewritten:")
-                                                    st.markdown(f"> {suggestion}")
-                                                except Exception as e:
-                                                    st.warning(f"AI rewrite failed: {e}")
-
-                                    # CASE C: multiple issues but none is singularity -> Fix only
-                                    elif num_issues >= 2 and not has_sing:
-                                        if st.button(f"⚒️ Fix Clarity [{r['id']}]", key=f"fix_multi_{r['id']}_{ns}"):
-                                            try:
-                                                suggestion = _ai_rewrite_clarity(st.session_state.api_key, r["text"])
-                                                st.session_state[f"rewritten_cache_{r['id']}"] = (suggestion or "").strip()
-                                                st.info("Rewritten:")
-                                                st.markdown(f"> {suggestion}")
-                                            except Exception as e:
-                                                st.warning(f"AI rewrite failed: {e}")
-                                else:
-                                    st.caption("ℹ️ Enter your Google AI API key to enable Fix/Decompose actions.")
+                    # One page of flagged rows is built per rerun; the counts and charts above use the full set
+                    page_size = 25
+                    n_pages = max(1, math.ceil(len(flagged_doc) / page_size))
+                    page = 1
+                    if n_pages > 1:
+                        page = int(st.number_input(
+                            f"Page (of {n_pages}, {page_size} flagged per page)",
+                            min_value=1, max_value=n_pages, value=1, step=1, key=f"doc_page_{doc_idx}",
+                        ))
+                    start = (page - 1) * page_size
+                    for r_idx, r in enumerate(flagged_doc[start:start + page_size], start=start):
+                        with st.container():
+                            # read-only markup for the row: one markdown + one caption
+                            st.markdown(
+                                format_requirement_with_highlights(r["id"], r["text"], r) + _error_badges(r),
+                                unsafe_allow_html=True,
+                            )
+                            notes = r.get("_issues_caption")
+                            if notes is None:  # rows cached before the caption was stored
+                                notes = _issues_caption(r)
+                            if notes:
+                                st.caption(notes)
+
+                            # === AI actions (Document view) — tri-option logic ===
+                            # namespacing for Streamlit keys so buttons don't collide across rows
+                            ns = f"doc_{doc_idx}_{r_idx}"
+
+                            if st.session_state.api_key:
+                                _render_ai_actions(r, "", f"_{ns}")
+                            else:
+                                st.caption("ℹ️ Enter your Google AI API key to enable Fix/Decompose actions.")
 
 
         
 
         # Insert per-document Clear expander after Detailed Analysis for this document
-                    clear_list_doc = [
-                        r for r in analyzed_only
-                        if not (r["ambiguous"] or r["passive"] or r["incomplete"] or r["singularity"])
-                    ]
-
                     with st.expander(f"Clear ({len(clear_list_doc)})", expanded=True):
-                        for r in clear_list_doc:
-                            st.markdown(
-                                f'<div style="background-color:#D4EDDA;color:#155724;padding:10px;'
-                                f'border-radius:5px;margin-bottom:10px;">✅ <strong>{r["id"]}</strong> {r["text"]}</div>',
-                                unsafe_allow_html=True,
-                            )
+                        _markdown_in_chunks((f"✅ **{r['id']}** {r['text']}" for r in clear_list_doc),
+                                            sep="\n\n", writer=st.success)
 
         # -------------------- Cross-document contradiction scan ---------------------
     if all_doc_req_rows:
@@ -2090,24 +2530,29 @@ Parent requirement:
 
     if project_id is not None:
         try:
-            _rows = db.get_documents_for_project(project_id)
+            _rows = _project_documents(project_id, db, CTX["_sanitize_filename"])
             if not _rows:
                 st.info("No documents found for this project.")
             else:
-                for (doc_id, file_name, version, uploaded_at, clarity_score) in _rows:
-                    conv_path = os.path.join("data", "projects", str(project_id), "documents",
-                                             f"{doc_id}_{CTX['_sanitize_filename'](file_name)}")
-                    if os.path.exists(conv_path):
-                        rel_path = f"data/projects/{project_id}/documents/{doc_id}_{CTX['_sanitize_filename'](file_name)}"
-                        st.markdown(
-                            f"- **{file_name} (v{version})** — Clarity: {clarity_score}/100"
-                        )
-                    else:
+                # one markdown list for the whole library instead of one element per version
+                listed = [
+                    f"- **{file_name} (v{version})** — Clarity: {clarity_score}/100"
+                    for (_id, file_name, version, _up, clarity_score, _path, exists) in _rows if exists
+                ]
+                if listed:
+                    st.markdown("\n".join(listed))
+                for (_id, _fn, _ver, _up, _score, conv_path, exists) in _rows:
+                    if not exists:
                         st.warning(f"Document file not found: {conv_path}")
         except Exception as e:
             st.error(f"Failed to load documents: {e}")
     else:
         st.info("Select a project to view its documents.")
 
+    if _check_stats["calls"]:
+        with st.sidebar.expander("⚙️ Check cache (this run)", expanded=False):
+            hits = _check_stats["calls"] - _check_stats["misses"]
+            st.caption(f"{hits} hit(s) / {_check_stats['misses']} miss(es) over {_check_stats['calls']} check lookups.")
+
 
 
@@ -9,6 +9,7 @@ import streamlit as st
 # ---- Config ----
 HISTORY_TURNS = 10          # last N message pairs to keep context lean
 MAX_CTX_LINES = 200         # limit project-context bleed
+TRANSCRIPT_TAIL = 6         # newest messages kept as live chat bubbles; older ones render as one block
 SYS_PROMPT = (
     "You are ReqCheck AI — a professional Systems Engineering assistant following INCOSE/ISO 29148. "
     "Your answers must be short, structured, and readable. "
@@ -23,8 +24,16 @@ Return ONLY valid JSON with keys:
 Keep answers short and readable.
 """
 
+@st.cache_data(show_spinner=False, max_entries=16)
+def _format_transcript(messages: tuple, _display) -> str:
+    """One markdown block for (role, content) pairs; `_display` maps a pair to its shown text."""
+    who = {"user": "🧑 **You**", "assistant": "🤖 **ReqCheck AI**"}
+    return "\n\n---\n\n".join(f"{who.get(role, role)}\n\n{_display(role, content)}" for role, content in messages)
+
+
 def render(st, db, rule_engine, CTX):
     get_chatbot_response = CTX["get_chatbot_response"]
+    send_chat_message = CTX.get("send_chat_message")
 
     # ---- Header ----
     pname = st.session_state.selected_project[1] if st.session_state.get("selected_project") else None
@@ -73,14 +82,15 @@ def render(st, db, rule_engine, CTX):
         except Exception:
             return ""
 
+    def _preface(sys_preface: str, proj_ctx: str) -> str:
+        return sys_preface + ("\n\n" + proj_ctx if proj_ctx else "") + "\n\n" + COACH_JSON_INSTRUCTIONS
+
+    def _turns(messages: List[Dict[str, str]]) -> List[Dict[str, Any]]:
+        return [{"role": "user" if m["role"] == "user" else "model", "parts": [m["content"]]} for m in messages]
+
     def _to_history(messages: List[Dict[str, str]], sys_preface: str, proj_ctx: str) -> List[Dict[str, Any]]:
-        hist: List[Dict[str, Any]] = []
-        preface = sys_preface + ("\n\n" + proj_ctx if proj_ctx else "") + "\n\n" + COACH_JSON_INSTRUCTIONS
-        hist.append({"role": "user", "parts": [preface]})
-        trimmed = messages[-(HISTORY_TURNS * 2):]
-        for m in trimmed:
-            hist.append({"role": "user" if m["role"] == "user" else "model", "parts": [m["content"]]})
-        return hist
+        hist: List[Dict[str, Any]] = [{"role": "user", "parts": [_preface(sys_preface, proj_ctx)]}]
+        return hist + _turns(messages[-(HISTORY_TURNS * 2):])
 
     # --- sanitize helpers -----------------------------------------------------
     CODE_FENCE_RE = re.compile(r"^\s*```(?:json|JSON)?\s*([\s\S]+?)\s*```\s*$")
@@ -149,21 +159,27 @@ def render(st, db, rule_engine, CTX):
         except TypeError:
             return get_chatbot_response(api_key, history)
 
+    def _display(role: str, content: str) -> str:
+        if role == "assistant":
+            # If assistant message contains JSON-like content, parse then compact-render
+            if content.strip().startswith("{") and '"reply"' in content:
+                data = _parse_bot_json(content)
+                shown = _short_format_requirement(data["reply"])
+                if data.get("follow_up"):
+                    shown += f"\n\n**Quick question:** {data['follow_up']}"
+                return shown
+            return _short_format_requirement(content)
+        return content
+
     # ---- Transcript (render) ----
-    for msg in st.session_state.messages:
+    # Older turns collapse into one cached block; only the tail stays as chat bubbles
+    msgs = st.session_state.messages
+    older, tail = msgs[:-TRANSCRIPT_TAIL], msgs[-TRANSCRIPT_TAIL:]
+    if older:
+        st.markdown(_format_transcript(tuple((m["role"], m["content"]) for m in older), _display))
+    for msg in tail:
         with st.chat_message(msg["role"]):
-            content = msg["content"]
-            if msg["role"] == "assistant":
-                # If assistant message contains JSON-like content, parse then compact-render
-                if content.strip().startswith("{") and '"reply"' in content:
-                    data = _parse_bot_json(content)
-                    st.markdown(_short_format_requirement(data["reply"]))
-                    if data.get("follow_up"):
-                        st.markdown(f"**Quick question:** {data['follow_up']}")
-                else:
-                    st.markdown(_short_format_requirement(content))
-            else:
-                st.markdown(content)
+            st.markdown(_display(msg["role"], msg["content"]))
 
     # ---- Quick replies (buttons under the chat) ----
     def _inject_user_message(txt: str):
@@ -191,14 +207,21 @@ def render(st, db, rule_engine, CTX):
         with st.chat_message("user"):
             st.markdown(user_input)
 
-        # 2) History
+        # 2) Context: preface as system instruction + prior turns (same window as before)
         proj_ctx = _safe_project_context() if st.session_state.attach_ctx else ""
-        history = _to_history(st.session_state.messages, SYS_PROMPT, proj_ctx)
 
         # 3) Call AI
         with st.spinner("🤖 Thinking…"):
             try:
-                raw = _call_ai(st.session_state.api_key, history)
+                if send_chat_message is not None:
+                    raw = send_chat_message(
+                        st.session_state.api_key,
+                        _preface(SYS_PROMPT, proj_ctx),
+                        _turns(st.session_state.messages[-(HISTORY_TURNS * 2):-1]),
+                        user_input,
+                    )
+                else:
+                    raw = _call_ai(st.session_state.api_key, _to_history(st.session_state.messages, SYS_PROMPT, proj_ctx))
             except Exception as e:
                 raw = f'{{"reply":"AI error: {e}","follow_up":"","quick_replies":[]}}'
 
@@ -2,11 +2,16 @@
 # ui/tabs/need_tab.py
 from __future__ import annotations
 
+import io
 import re
+import csv
 import time
+import random
+from functools import lru_cache
 from typing import Callable, List, Dict
 import json
-import pandas as pd
+import hashlib
+from collections import defaultdict
 import streamlit as st
 
 # -------- Streamlit rerun compatibility (new & old) --------
@@ -17,10 +22,23 @@ def _rerun():
         st.experimental_rerun()
 
 # ----------------- Resilient LLM wrapper -------------------
-def _llm_retry(api_fn: Callable[[str], str], prompt: str, retries: int = 1, backoff: float = 0.6) -> str:
+# "Retry-After: 12", "Please retry in 12.5s", "retry_delay { seconds: 12 }"
+_RETRY_AFTER_RX = re.compile(r"(?:retry[-_ ]after|retry in|retry_delay\s*\{\s*seconds)\s*:?\s*(\d+(?:\.\d+)?)", re.I)
+# How the llm.ai_suggestions helpers report a failed call instead of raising
+_AI_ERROR_PREFIX = "An error occurred with the AI service:"
+
+def _llm_retry(api_fn: Callable[[str], str], prompt: str, retries: int = 3, backoff: float = 1.0,
+               max_delay: float = 30.0) -> str:
     """
     AI-only: we DO NOT fall back to local templates. If the provider fails, we surface the error.
+    Retriable failures back off exponentially with jitter (or by the provider's Retry-After);
+    a rate limit that outlasts the retries starts a cooldown that later reruns honour without calling.
     """
+    cooldown = st.session_state.get("_llm_cooldown_until", 0.0) - time.time()
+    if cooldown > 0:
+        st.warning(f"AI service is rate-limited; try again in {int(cooldown) + 1} s.")
+        return ""
+
     def retriable(msg: str) -> bool:
         m = (msg or "").lower()
         # Only match real service/transport errors, not common words like "rate"
@@ -32,62 +50,109 @@ def _llm_retry(api_fn: Callable[[str], str], prompt: str, retries: int = 1, back
         ]
         return any(p in m for p in patterns)
 
+    def delay_for(msg: str, attempt: int) -> float:
+        m = _RETRY_AFTER_RX.search(msg or "")
+        if m:
+            return min(float(m.group(1)), max_delay)
+        return min(backoff * (2 ** attempt) + random.uniform(0, 1), max_delay)
+
     last = ""
     for i in range(retries + 1):
         try:
             out = api_fn(prompt) or ""
-            if retriable(out):
+            # only the helpers' error strings count as failures; reply text may well
+            # mention timeouts or "retry after N s" and must be returned untouched
+            if out.startswith(_AI_ERROR_PREFIX):
                 raise RuntimeError(out)
             return out.strip()
         except Exception as e:
             last = str(e)
             if i < retries and retriable(last):
-                time.sleep(backoff * (i + 1))
+                time.sleep(delay_for(last, i))
                 continue
+            if retriable(last) and _RETRY_AFTER_RX.search(last):
+                st.session_state["_llm_cooldown_until"] = time.time() + delay_for(last, i)
             st.error(f"AI service error: {last}")
             return ""
 
+_LLM_MEMO_MAX = 256
+
+def _llm_call(call_fn: Callable[[str, str], str], api_key: str, prompt: str, memo_key: str | None = None) -> str:
+    """
+    _llm_retry(call_fn(api_key, ·), prompt), remembered in session state per
+    (api-key fingerprint, sha1 of memo_key or prompt). Empty replies and the AI
+    helpers' "An error occurred ..." strings are not stored.
+    """
+    memo = st.session_state.setdefault("_llm_cache", {})
+    key = (hashlib.sha1((api_key or "").encode("utf-8")).hexdigest()[:12],
+           hashlib.sha1((memo_key or prompt).encode("utf-8")).hexdigest())
+    hit = memo.get(key)
+    if hit:
+        return hit
+    out = _llm_retry(lambda p: call_fn(api_key, p), prompt)
+    if out and not out.startswith("An error occurred"):
+        if len(memo) >= _LLM_MEMO_MAX:
+            memo.pop(next(iter(memo)))  # oldest first
+        memo[key] = out
+    return out
 
 
 # ----------------- Need normalizer --------------------------
 _NEED_SHALL_RX = re.compile(r"\b(shall|must|will)\b", re.I)
+# "[the] <system> shall " and bare "shall "/"must "/"will " in one pass
+_MODAL_STRIP_RX = re.compile(
+    r"\b(?:(?:the\s+)?(?:system|uav|vehicle|spacecraft|satellite|platform)\b\s+)?(?:shall|must|will)\s+", re.I
+)
+_LEADING_TO_RX = re.compile(r"^\s*(to\s+)?")
+_ENABLE_PREFIX_RX = re.compile(r"^(enable|provide|maintain|perform|achieve|support)\b", re.I)
+_WS_RX = re.compile(r"\s+")
 
 def _normalize_need(raw: str) -> str:
     txt = (raw or "").strip()
     if not txt:
         return ""
     if _NEED_SHALL_RX.search(txt):
-        txt_no_modal = re.sub(r"\b(the\s+)?(system|uav|vehicle|spacecraft|satellite|platform)\b\s+(shall|must|will)\s+", "", txt, flags=re.I)
-        txt_no_modal = re.sub(r"\b(shall|must|will)\s+", "", txt_no_modal, flags=re.I)
-        txt = re.sub(r"^\s*(to\s+)?", "", txt_no_modal).strip()
-        if not re.match(r"^(enable|provide|maintain|perform|achieve|support)\b", txt, re.I):
+        txt = _LEADING_TO_RX.sub("", _MODAL_STRIP_RX.sub("", txt), count=1).strip()
+        if not _ENABLE_PREFIX_RX.match(txt):
             txt = "Enable " + txt[0].lower() + txt[1:]
-    txt = re.sub(r"\s+", " ", txt)
+    txt = _WS_RX.sub(" ", txt)
     return txt.rstrip(" .")
 
 # ----------------- Domain/keywords inference ----------------
 UNIT_RX = r"(?:ms|s|min|hr|Hz|k?Hz|MHz|GHz|°C|K|Pa|kPa|bar|m/s|km/s|m|km|deg|°|A|mA|V|W|kW|dB|%|σ|Sigma|g)"
+_NUM_UNIT_RX = re.compile(rf"\b[0-9]+(?:\.[0-9]+)?\s*(?:{UNIT_RX})\b", re.I)
+
+_KEYWORD_LEX = {
+    "propulsion": ["Δv","burn","thruster","Isp","conjunction","momentum dump","keep-out zone","GN&C","engine-out"],
+    "thermal": ["TVAC","radiator","heater","time-at-limit","eclipse","full sun","thermal model","sensor fault"],
+    "uas": ["BVLOS","C2 link","GNSS","geo-fence","DAA","latency","endurance","RTH"],
+    "comms": ["throughput","latency","availability","packet loss","bandwidth","jitter","link margin"],
+    "power": ["state of charge","DoD","battery","bus voltage","power budget","load shed"],
+    "safety": ["fault","FDIR","abort","safe mode","redundancy","single-fault tolerant","hazard"],
+    "software": ["API","request rate","timeout","retry","telemetry","logging","audit"],
+    "navigation": ["odometry","state estimation","drift","star tracker","IMU","EKF","accuracy"],
+    "mechanical": ["vibration","thermal cycling","shock","mass budget","CG","modal frequency"],
+}
+# One case-insensitive substring alternation per bucket (same hits as `w.lower() in need.lower()`)
+_KEYWORD_BUCKET_RXS = [
+    (words, re.compile("|".join(re.escape(w.lower()) for w in words)))
+    for words in _KEYWORD_LEX.values()
+]
+
 def _infer_keywords(need: str) -> list[str]:
-    low = (need or "").lower()
-
-    lex = {
-        "propulsion": ["Δv","burn","thruster","Isp","conjunction","momentum dump","keep-out zone","GN&C","engine-out"],
-        "thermal": ["TVAC","radiator","heater","time-at-limit","eclipse","full sun","thermal model","sensor fault"],
-        "uas": ["BVLOS","C2 link","GNSS","geo-fence","DAA","latency","endurance","RTH"],
-        "comms": ["throughput","latency","availability","packet loss","bandwidth","jitter","link margin"],
-        "power": ["state of charge","DoD","battery","bus voltage","power budget","load shed"],
-        "safety": ["fault","FDIR","abort","safe mode","redundancy","single-fault tolerant","hazard"],
-        "software": ["API","request rate","timeout","retry","telemetry","logging","audit"],
-        "navigation": ["odometry","state estimation","drift","star tracker","IMU","EKF","accuracy"],
-        "mechanical": ["vibration","thermal cycling","shock","mass budget","CG","modal frequency"],
-    }
+    return list(_infer_keywords_cached(need or ""))
+
+@lru_cache(maxsize=32)
+def _infer_keywords_cached(need: str) -> tuple:
+    """Questions and requirement generation both ask for the same need's hints; build them once."""
+    low = need.lower()
 
     bucket_hits = []
-    for _, words in lex.items():
-        if any(w.lower() in low for w in words):
+    for words, rx in _KEYWORD_BUCKET_RXS:
+        if rx.search(low):
             bucket_hits.extend(words)
 
-    nums = re.findall(rf"\b[0-9]+(?:\.[0-9]+)?\s*(?:{UNIT_RX})\b", need or "", flags=re.I)
+    nums = _NUM_UNIT_RX.findall(need)
 
     seen = set()
     out = []
@@ -99,102 +164,83 @@ def _infer_keywords(need: str) -> list[str]:
     for g in ["units","thresholds","modes","conditions","verification","faults","budgets","interfaces","safety"]:
         if g not in seen:
             out.append(g); seen.add(g)
-    return out[:20]
+    return tuple(out[:20])
 
 # ----------------- Structured-edit parsing helpers ----------
 _ACTIONS = ["maintain", "regulate", "limit", "detect", "log", "achieve", "provide", "enforce", "control", "acquire"]
+_ACTION_RXS = [(a, re.compile(rf"\b{a}\b", re.I)) for a in _ACTIONS]
+
+_TRIGGER_RX = re.compile(r"\s*((?:when|if|while|during)[^,\.]+)[, ]", re.I)
+_CONDITIONS_RX = re.compile(r"\b(in (?:nominal (?:mode|conditions)|safe mode|eclipse(?: and full sun)?|full sun))\b", re.I)
+_PERF_RX = re.compile(r"\b(within [^\.]+|between [^\.]+|≥ ?[^,\.]+|<= ?[^,\.]+|≤ ?[^,\.]+|>= ?[^,\.]+|±\s?[^,\.]+|no more than [^,\.]+|not exceed [^,\.]+|lasting [^,\.]+|for [^,\.]+ seconds?)", re.I)
+
+# (pattern, value) in priority order; first match wins
+_OBJECT_RULES = [
+    (re.compile(r"payload optics", re.I), "payload optics temperature"),
+    (re.compile(r"battery", re.I), "battery temperatures"),
+    (re.compile(r"avionics", re.I), "avionics temperatures"),
+    (re.compile(r"(?:component|onboard)\s+temperatures?|temperatures?\b", re.I), "temperatures"),
+    (re.compile(r"C2 link", re.I), "C2 link"),
+    (re.compile(r"geo-?fenc", re.I), "geo-fencing"),
+    (re.compile(r"endurance", re.I), "endurance"),
+    (re.compile(r"latency", re.I), "latency"),
+]
+_ACTOR_RULES = [
+    (re.compile(r"\bthermal\b|\bheater|radiator|temperature", re.I), "Thermal Control Subsystem"),
+    (re.compile(r"\bbattery|power\b", re.I), "Power Subsystem"),
+    (re.compile(r"\bpayload\b", re.I), "Payload"),
+    (re.compile(r"\buav|drone\b", re.I), "UAV"),
+    (re.compile(r"\bsystem\b|\bspacecraft\b", re.I), "System"),
+]
 
 def _extract_trigger(txt: str) -> str:
-    m = re.match(r"\s*((?:when|if|while|during)[^,\.]+)[, ]", txt, flags=re.I)
+    m = _TRIGGER_RX.match(txt)
     return (m.group(1).strip() if m else "")
 
 def _extract_conditions(txt: str) -> str:
-    m = re.search(r"\b(in (?:nominal (?:mode|conditions)|safe mode|eclipse(?: and full sun)?|full sun))\b", txt, flags=re.I)
+    m = _CONDITIONS_RX.search(txt)
     return (m.group(1).strip() if m else "")
 
 def _extract_perf(txt: str) -> str:
-    m = re.search(r"\b(within [^\.]+|between [^\.]+|≥ ?[^,\.]+|<= ?[^,\.]+|≤ ?[^,\.]+|>= ?[^,\.]+|±\s?[^,\.]+|no more than [^,\.]+|not exceed [^,\.]+|lasting [^,\.]+|for [^,\.]+ seconds?)", txt, flags=re.I)
+    m = _PERF_RX.search(txt)
     return (m.group(0).strip() if m else "")
 
 def _extract_action(txt: str) -> str:
-    for a in _ACTIONS:
-        if re.search(rf"\b{a}\b", txt, flags=re.I):
+    for a, rx in _ACTION_RXS:
+        if rx.search(txt):
             return a
     return "maintain"
 
 def _extract_object(txt: str) -> str:
-    if re.search(r"payload optics", txt, flags=re.I):
-        return "payload optics temperature"
-    if re.search(r"battery", txt, flags=re.I):
-        return "battery temperatures"
-    if re.search(r"avionics", txt, flags=re.I):
-        return "avionics temperatures"
-    if re.search(r"(?:component|onboard)\s+temperatures?|temperatures?\b", txt, flags=re.I):
-        return "temperatures"
-    if re.search(r"C2 link", txt, flags=re.I):
-        return "C2 link"
-    if re.search(r"geo-?fenc", txt, flags=re.I):
-        return "geo-fencing"
-    if re.search(r"endurance", txt, flags=re.I):
-        return "endurance"
-    if re.search(r"latency", txt, flags=re.I):
-        return "latency"
+    for rx, obj in _OBJECT_RULES:
+        if rx.search(txt):
+            return obj
     return "function"
 
 def _extract_actor(txt: str) -> str:
-    if re.search(r"\bthermal\b|\bheater|radiator|temperature", txt, flags=re.I):
-        return "Thermal Control Subsystem"
-    if re.search(r"\bbattery|power\b", txt, flags=re.I):
-        return "Power Subsystem"
-    if re.search(r"\bpayload\b", txt, flags=re.I):
-        return "Payload"
-    if re.search(r"\buav|drone\b", txt, flags=re.I):
-        return "UAV"
-    if re.search(r"\bsystem\b|\bspacecraft\b", txt, flags=re.I):
-        return "System"
+    for rx, actor in _ACTOR_RULES:
+        if rx.search(txt):
+            return actor
     return "System"
 
 def _parse_req_text(txt: str) -> dict:
-    return {
-        "trigger": _extract_trigger(txt),
-        "conditions": _extract_conditions(txt),
-        "perf": _extract_perf(txt),
-        "action": _extract_action(txt),
-        "object": _extract_object(txt),
-        "actor": _extract_actor(txt),
-    }
-
-# ----------------- AI Helpers: Questions --------------------
-def _parse_questions_lines(raw: str) -> List[str]:
-    lines = [re.sub(r"^[\-\*\d\.\)\s]+", "", ln.strip()) for ln in (raw or "").splitlines() if ln.strip()]
-    out: List[str] = []
-    seen = set()
-    for ln in lines:
-        if "→ e.g." not in ln:
-            if "?" not in ln:
-                ln = ln.rstrip(".") + "? → e.g., (add 1–2 unit-bearing examples)."
-            else:
-                ln = ln + " → e.g., (add 1–2 unit-bearing examples)."
-        else:
-            pre, post = ln.split("→ e.g.", 1)
-            if "?" not in pre:
-                pre = pre.rstrip(".") + "?"
-            ln = pre.strip() + " → e.g." + post
-        key = ln.split("→", 1)[0].strip().lower()
-        if key in seen:
-            continue
-        seen.add(key)
-        out.append(ln)
-    return out
-
-def _ai_questions(need: str, req_type: str, call_fn) -> list[str]:
-    if not st.session_state.get("api_key"):
-        st.error("Missing API key. Configure your AI provider.")
-        return []
-
-    hints = ", ".join(_infer_keywords(need))
+    return dict(_parse_req_fields(txt))
+
+@lru_cache(maxsize=256)
+def _parse_req_fields(txt: str) -> tuple:
+    """The structured-edit guesses run for every card on every rerun; scan each text once."""
+    return (
+        ("trigger", _extract_trigger(txt)),
+        ("conditions", _extract_conditions(txt)),
+        ("perf", _extract_perf(txt)),
+        ("action", _extract_action(txt)),
+        ("object", _extract_object(txt)),
+        ("actor", _extract_actor(txt)),
+    )
 
-    FEWSHOT = """What Δv magnitude accuracy and timing deviation thresholds apply? → e.g., 0.1 m/s (3σ); ±10 s (3σ)
+# ----------------- AI prompt templates ----------------------
+# Built once at import; the helpers return before formatting when there is no API key.
+_QUESTIONS_FEWSHOT = """What Δv magnitude accuracy and timing deviation thresholds apply? → e.g., 0.1 m/s (3σ); ±10 s (3σ)
 What temperature limits and time-at-limit rules apply per component? → e.g., optics 0–20 °C; ≤300 s above limit/orbit
 What C2 link availability and latency must be maintained? → e.g., ≥99.9% availability; ≤200 ms (95%)
 What resources/budgets constrain operation? → e.g., heater ≤12 W (eclipse); CPU ≤40%; propellant ≥10% reserve
@@ -203,7 +249,7 @@ What triggers/conditions initiate action or abort? → e.g., threshold crossing;
 What verification methods and levels apply? → e.g., SIL/HIL; TVAC; system demo; flight telemetry correlation
 What interfaces/keep-out/compliance constraints apply? → e.g., API v2 rate ≤10 Hz; safety corridor; regulatory TBD"""
 
-    base_prompt = f"""
+_PROMPT_QUESTIONS = """
 You are a principal systems engineer. Produce EXACTLY 10 ultra-specific clarifying questions for the NEED below.
 
 FORMAT (strict):
@@ -212,16 +258,12 @@ FORMAT (strict):
 • Target domain terms: {hints}
 
 NEED:
-\"\"\"{(need or '').strip()}\"\"\"\n
+\"\"\"{need}\"\"\"\n
 STYLE EXAMPLES (do not copy values):
-{FEWSHOT}
+{fewshot}
 """
-    raw = _llm_retry(lambda p: call_fn(st.session_state.api_key, p), base_prompt)
-    lines = _parse_questions_lines(raw)
 
-    if not (8 <= len(lines) <= 12):
-        # Ask the AI to repair to exactly 10 lines
-        repair_prompt = f"""
+_PROMPT_QUESTIONS_REPAIR = """
 You did not follow instructions. Rewrite the content BELOW into EXACTLY 10 lines.
 
 RULES:
@@ -229,53 +271,11 @@ RULES:
 • No bullets, numbering, or extra text. Output ONLY the 10 lines.
 
 NEED:
-\"\"\"{(need or '').strip()}\"\"\"\n
+\"\"\"{need}\"\"\"\n
 YOUR PRIOR OUTPUT:
 \"\"\"{raw}\"\"\""""
-        raw2 = _llm_retry(lambda p: call_fn(st.session_state.api_key, p), repair_prompt)
-        lines = _parse_questions_lines(raw2)
-
-    if len(lines) < 6:
-        st.warning("AI returned fewer than 6 clarifying questions. Showing the best available.")
-    return lines[:12]
 
-# ----------------- AI Helpers: Requirements -----------------
-def _parse_requirements_jsonl(raw: str) -> List[Dict]:
-    out: List[Dict] = []
-    for ln in (raw or "").splitlines():
-        ln = ln.strip()
-        if not ln or not ln.startswith("{"):
-            continue
-        try:
-            row = json.loads(ln)
-        except Exception:
-            continue
-        txt = (row.get("text") or "").strip()
-        role = (row.get("role") or "").strip().title()
-        vm = (row.get("verification_method") or "Test").strip().title()
-        vl = (row.get("verification_level") or "Subsystem").strip().title()
-        if not txt or " shall " not in f" {txt.lower()} ":
-            continue
-        if len(txt.split()) > 26:
-            continue
-        out.append({
-            "ID": "",
-            "ParentID": "",
-            "Text": txt if txt.endswith(".") else (txt + "."),
-            "Role": role if role in {"Parent","Child"} else "Child",
-            "Verification": vm if vm in {"Test","Analysis","Inspection","Demo"} else "Test",
-            "VerificationLevel": vl if vl in {"Unit","Subsystem","System","Mission"} else "Subsystem",
-            "VerificationEvidence": "",
-            "ValidationNeedID": "",
-            "TestCaseIDs": "",
-            "AllocatedTo": "",
-            "Criticality": "Medium",
-            "Status": "Draft",
-        })
-    return out
-
-def _ai_requirements_raw(need: str, rationale: str, keywords: str, call_fn) -> str:
-    schema = """Each output line MUST be a single JSON object with keys EXACTLY:
+_REQS_SCHEMA = """Each output line MUST be a single JSON object with keys EXACTLY:
 {
  "role": "Parent"|"Child",
  "text": "Requirement sentence using 'shall' (≤ 26 words, active, singular, verifiable).",
@@ -283,13 +283,13 @@ def _ai_requirements_raw(need: str, rationale: str, keywords: str, call_fn) -> s
  "verification_level": "Unit"|"Subsystem"|"System"|"Mission"
 }"""
 
-    FEWSHOT = '''{"role":"Parent","text":"The system shall deliver the specified function within defined performance and safety constraints across operational modes.","verification_method":"Analysis","verification_level":"System"}
+_REQS_FEWSHOT = '''{"role":"Parent","text":"The system shall deliver the specified function within defined performance and safety constraints across operational modes.","verification_method":"Analysis","verification_level":"System"}
 {"role":"Child","text":"The system shall achieve end-to-end latency ≤ 200 ms (95%) during nominal operation.","verification_method":"Test","verification_level":"System"}
 {"role":"Child","text":"The Thermal Control Subsystem shall maintain payload optics between 0–20 °C during active imaging.","verification_method":"Test","verification_level":"Subsystem"}
 {"role":"Child","text":"The system shall abort a burn if GN&C position uncertainty exceeds TBD prior to ignition.","verification_method":"Test","verification_level":"System"}
 {"role":"Child","text":"The UAV shall enforce geo-fence error ≤ 10 m (95%) during BVLOS mission.","verification_method":"Demo","verification_level":"System"}'''
 
-    rubric = f"""
+_REQS_RUBRIC = """
 QUALITY BAR:
 - Use domain vocabulary ({keywords}) and active voice with 'shall'.
 - Parent: outcome-oriented, ≤ 26 words.
@@ -300,24 +300,23 @@ OUTPUT:
 - EXACTLY 1 Parent line and 10–12 Child lines.
 - JSON Lines only (no prose or code fences).
 """
-    prompt = f"""
+
+_PROMPT_REQUIREMENTS = """
 Generate requirements JSON Lines from the NEED and RATIONALE.
 
 NEED:
-\"\"\"{(need or '').strip()}\"\"\"\n
+\"\"\"{need}\"\"\"\n
 RATIONALE:
-\"\"\"{(rationale or '').strip()}\"\"\"\n
+\"\"\"{rationale}\"\"\"\n
 {schema}
 
 FEW-SHOT (style):
-{FEWSHOT}
+{fewshot}
 
 {rubric}
 """
-    return _llm_retry(lambda p: call_fn(st.session_state.api_key, p), prompt)
 
-def _ai_requirements_repair(raw: str, need: str, rationale: str, call_fn) -> str:
-    prompt = f"""
+_PROMPT_REQUIREMENTS_REPAIR = """
 Your previous output did not meet format/count requirements.
 
 REPAIR TASK:
@@ -327,20 +326,13 @@ REPAIR TASK:
 - No prose or code fences. Output JSON Lines only.
 
 NEED:
-\"\"\"{(need or '').strip()}\"\"\"\n
+\"\"\"{need}\"\"\"\n
 RATIONALE:
-\"\"\"{(rationale or '').strip()}\"\"\"\n
+\"\"\"{rationale}\"\"\"\n
 PRIOR OUTPUT:
 \"\"\"{raw}\"\"\""""
-    return _llm_retry(lambda p: call_fn(st.session_state.api_key, p), prompt)
 
-def _ai_parent_from_children(need: str, children: List[str], call_fn) -> dict | None:
-    """
-    Ask AI to synthesize ONE parent requirement summarizing the children.
-    Returns a requirement dict or None. (AI-only, no local fallback text.)
-    """
-    snip = "\n".join(f"- {c}" for c in children[:12])
-    prompt = f"""
+_PROMPT_PARENT = """
 Create ONE parent requirement in JSON Lines format summarizing the CHILD requirements below.
 
 RULES:
@@ -349,23 +341,146 @@ RULES:
 - Output ONE JSON object ONLY.
 
 NEED:
-\"\"\"{(need or '').strip()}\"\"\"\n
+\"\"\"{need}\"\"\"\n
 CHILD CANDIDATES:
 {snip}
 """
-    raw = _llm_retry(lambda p: call_fn(st.session_state.api_key, p), prompt)
+
+_PROMPT_REWRITE_STRICT = "Rewrite as ONE singular, unambiguous, verifiable requirement using 'shall', ≤ 22 words. Return only the sentence.\n\n\"\"\"{text}\"\"\""
+
+# ----------------- AI Helpers: Questions --------------------
+_Q_PREFIX_RX = re.compile(r"^[\-\*\d\.\)\s]+")
+
+def _parse_questions_lines(raw: str) -> List[str]:
+    lines = [_Q_PREFIX_RX.sub("", ln.strip()) for ln in (raw or "").splitlines() if ln.strip()]
+    out: List[str] = []
+    seen = set()
+    for ln in lines:
+        if "→ e.g." not in ln:
+            if "?" not in ln:
+                ln = ln.rstrip(".") + "? → e.g., (add 1–2 unit-bearing examples)."
+            else:
+                ln = ln + " → e.g., (add 1–2 unit-bearing examples)."
+        else:
+            pre, post = ln.split("→ e.g.", 1)
+            if "?" not in pre:
+                pre = pre.rstrip(".") + "?"
+            ln = pre.strip() + " → e.g." + post
+        key = ln.split("→", 1)[0].strip().lower()
+        if key in seen:
+            continue
+        seen.add(key)
+        out.append(ln)
+    return out
+
+def _ai_questions(need: str, req_type: str, call_fn, api_key: str) -> list[str]:
+    if not api_key:
+        st.error("Missing API key. Configure your AI provider.")
+        return []
+
+    need_s = (need or '').strip()
+    hints = ", ".join(_infer_keywords(need))
+    base_prompt = _PROMPT_QUESTIONS.format(hints=hints, need=need_s, fewshot=_QUESTIONS_FEWSHOT)
+    raw = _llm_call(call_fn, api_key, base_prompt)
+    lines = _parse_questions_lines(raw)
+
+    if not (8 <= len(lines) <= 12):
+        # Ask the AI to repair to exactly 10 lines
+        repair_prompt = _PROMPT_QUESTIONS_REPAIR.format(need=need_s, raw=raw)
+        raw2 = _llm_call(call_fn, api_key, repair_prompt)
+        lines = _parse_questions_lines(raw2)
+
+    if len(lines) < 6:
+        st.warning("AI returned fewer than 6 clarifying questions. Showing the best available.")
+    return lines[:12]
+
+# ----------------- Requirement row defaults -----------------
+_DEFAULT_REQ_ROW = {
+    "ParentID": "",
+    "Role": "Child",
+    "Verification": "Test",
+    "VerificationLevel": "Subsystem",
+    "VerificationEvidence": "",
+    "ValidationNeedID": "NEED-001",
+    "TestCaseIDs": "",
+    "AllocatedTo": "",
+    "Criticality": "Medium",
+    "Status": "Draft",
+}
+
+def _make_req_row(req_id: str, text: str, role: str = "Child", parent: str = "",
+                  need_id: str = "NEED-001", level: str = "Subsystem") -> dict:
+    """A fresh requirement row; every field not passed in comes from _DEFAULT_REQ_ROW."""
+    return {**_DEFAULT_REQ_ROW, "ID": req_id, "Text": text, "Role": role, "ParentID": parent,
+            "ValidationNeedID": need_id, "VerificationLevel": level}
+
+# ----------------- AI Helpers: Requirements -----------------
+def _parse_requirements_jsonl(raw: str) -> List[Dict]:
+    out: List[Dict] = []
+    for ln in (raw or "").splitlines():
+        ln = ln.strip()
+        if not ln or not ln.startswith("{"):
+            continue
+        try:
+            row = json.loads(ln)
+        except Exception:
+            continue
+        txt = (row.get("text") or "").strip()
+        role = (row.get("role") or "").strip().title()
+        vm = (row.get("verification_method") or "Test").strip().title()
+        vl = (row.get("verification_level") or "Subsystem").strip().title()
+        if not txt or " shall " not in f" {txt.lower()} ":
+            continue
+        if len(txt.split()) > 26:
+            continue
+        row = _make_req_row(
+            "",
+            txt if txt.endswith(".") else (txt + "."),
+            role if role in {"Parent","Child"} else "Child",
+            need_id="",
+            level=vl if vl in {"Unit","Subsystem","System","Mission"} else "Subsystem",
+        )
+        row["Verification"] = vm if vm in {"Test","Analysis","Inspection","Demo"} else "Test"
+        out.append(row)
+    return out
+
+def _ai_requirements_raw(need: str, rationale: str, keywords: str, call_fn, api_key: str) -> str:
+    if not api_key:
+        return ""
+    prompt = _PROMPT_REQUIREMENTS.format(
+        need=(need or '').strip(), rationale=(rationale or '').strip(),
+        schema=_REQS_SCHEMA, fewshot=_REQS_FEWSHOT, rubric=_REQS_RUBRIC.format(keywords=keywords),
+    )
+    return _llm_call(call_fn, api_key, prompt)
+
+def _ai_requirements_repair(raw: str, need: str, rationale: str, call_fn, api_key: str) -> str:
+    if not api_key:
+        return ""
+    prompt = _PROMPT_REQUIREMENTS_REPAIR.format(need=(need or '').strip(), rationale=(rationale or '').strip(), raw=raw)
+    return _llm_call(call_fn, api_key, prompt)
+
+def _ai_parent_from_children(need: str, children: List[str], call_fn, api_key: str) -> dict | None:
+    """
+    Ask AI to synthesize ONE parent requirement summarizing the children.
+    Returns a requirement dict or None. (AI-only, no local fallback text.)
+    """
+    if not api_key:
+        return None
+    snip = "\n".join(f"- {c}" for c in children[:12])
+    prompt = _PROMPT_PARENT.format(need=(need or '').strip(), snip=snip)
+    raw = _llm_call(call_fn, api_key, prompt)
     items = _parse_requirements_jsonl(raw)
     return items[0] if items else None
 
-def _ai_generate_requirements(need: str, rationale: str, call_fn, need_id: str) -> list[dict]:
-    if not st.session_state.get("api_key"):
+def _ai_generate_requirements(need: str, rationale: str, call_fn, need_id: str, api_key: str) -> list[dict]:
+    if not api_key:
         st.error("Missing API key. Configure your AI provider.")
         return []
 
     keywords = ", ".join(_infer_keywords(need))
 
     # Pass 1: ask for correct counts
-    raw = _ai_requirements_raw(need, rationale, keywords, call_fn)
+    raw = _ai_requirements_raw(need, rationale, keywords, call_fn, api_key)
     items = _parse_requirements_jsonl(raw)
 
     # Evaluate counts
@@ -374,14 +489,14 @@ def _ai_generate_requirements(need: str, rationale: str, call_fn, need_id: str)
 
     if not (len(parents) == 1 and 8 <= len(children) <= 16):
         # Pass 2: ask model to repair into exact counts
-        raw2 = _ai_requirements_repair(raw, need, rationale, call_fn)
+        raw2 = _ai_requirements_repair(raw, need, rationale, call_fn, api_key)
         items2 = _parse_requirements_jsonl(raw2)
         parents = [r for r in items2 if r["Role"] == "Parent"]
         children = [r for r in items2 if r["Role"] == "Child"]
 
         # If still missing a Parent but we have children, ask AI to synthesize a Parent
         if len(parents) == 0 and len(children) >= 6:
-            parent_ai = _ai_parent_from_children(need, [c["Text"] for c in children], call_fn)
+            parent_ai = _ai_parent_from_children(need, [c["Text"] for c in children], call_fn, api_key)
             if parent_ai:
                 parents = [parent_ai]
 
@@ -400,7 +515,7 @@ def _ai_generate_requirements(need: str, rationale: str, call_fn, need_id: str)
     final_parents = [r for r in items if r["Role"] == "Parent"][:1]
     final_children = []
     for ch in [r for r in items if r["Role"] == "Child"]:
-        key = re.sub(r"\s+", " ", ch["Text"].lower())
+        key = _WS_RX.sub(" ", ch["Text"].lower())
         if key in seen:
             continue
         seen.add(key)
@@ -415,6 +530,47 @@ def _ai_generate_requirements(need: str, rationale: str, call_fn, need_id: str)
 
     return final_parents + final_children[:20]
 
+# ----------------- Render-loop patterns ----------------------
+_DECOMP_BULLET_RX = re.compile(r'^[\-\*\d]+\.\s*')
+_REQ_ID_PREFIX_RX = re.compile(r'^REQ-\d{3,5}[.\s:-]\s*', re.I)
+_BULLET_PREFIX_RX = re.compile(r'^[\-\*\u2022]?\s*')
+_WORD_RX = re.compile(r'\w')
+_TRIG_START_RX = re.compile(r'^(when|if|while|during)\b', re.I)
+_MULTI_SPACE_RX = re.compile(r"\s{2,}")
+
+@lru_cache(maxsize=64)
+def _custom_choices(options: tuple) -> tuple:
+    """(selectbox options incl. "Custom…", {option: index}) for a dropdown; "function" sorts last."""
+    opts = tuple(o for o in options if o != "function") + (("function",) if "function" in options else ())
+    return opts + ("Custom…",), {o: i for i, o in enumerate(opts)}
+
+def _clean_llm_lines(raw: str, min_words: int = 1):
+    """Stripped, de-bulleted lines of an LLM reply with at least `min_words` words, in one pass."""
+    for ln in (raw or "").splitlines():
+        s = ln.strip()
+        if not s or not _WORD_RX.search(s):
+            continue
+        s = _BULLET_PREFIX_RX.sub("", s)
+        if len(s.split()) >= min_words:
+            yield s
+
+# ----------------- CSV export --------------------------------
+_EXPORT_FIELDS = [
+    "Need ID", "Validation Need ID", "ID", "ParentID", "Requirement Text", "Type", "Role",
+    "Priority", "Lifecycle", "Stakeholder", "Source",
+    "Verification", "Verification Level", "Verification Evidence",
+    "Test Case IDs", "Allocated To", "Criticality", "Status",
+    "Acceptance Criteria", "Rationale"
+]
+
+def _export_csv_bytes(rows) -> bytes:
+    """CSV for rows in _EXPORT_FIELDS order."""
+    buf = io.StringIO()
+    w = csv.writer(buf, lineterminator="\n")
+    w.writerow(_EXPORT_FIELDS)
+    w.writerows(rows)
+    return buf.getvalue().encode("utf-8")
+
 # ----------------- Render Tab -------------------------------
 def render(st, db, rule_engine, CTX):
     """
@@ -434,6 +590,8 @@ def render(st, db, rule_engine, CTX):
     run_freeform = CTX.get("run_freeform", lambda *a, **k: "")
     # NEW: dense-need decomposition hook
     decompose_need_into_requirements = CTX.get("decompose_need_into_requirements", lambda *a, **k: "")
+    # read once per render; every AI helper below gets it explicitly
+    api_key = st.session_state.get("api_key")
 
     # Prefer engine-level ambiguity checker if available; otherwise fall back to CTX helper.
     def _ambig(text: str) -> list:
@@ -511,7 +669,13 @@ def render(st, db, rule_engine, CTX):
     )
 
     # ---------- Helpers ----------
+    # text -> (amb, pas, inc, sing); swept of texts no card uses at the end of each render
+    qc_cache = S.setdefault("_qc_cache", {})
+
     def _qc(text: str):
+        hit = qc_cache.get(text)
+        if hit is not None:
+            return hit
         try:
             amb = _ambig(text)
         except Exception:
@@ -519,7 +683,13 @@ def render(st, db, rule_engine, CTX):
         pas = check_passive_voice(text)
         inc = check_incompleteness(text)
         sing = check_singularity(text)
-        return amb, pas, inc, sing
+        qc_cache[text] = (amb, pas, inc, sing)
+        return qc_cache[text]
+
+    def _sing(text: str):
+        """Singularity only (all the Decompose gate needs); reuses a full _qc result when one exists."""
+        hit = qc_cache.get(text)
+        return hit[3] if hit is not None else check_singularity(text)
 
 
     def _badge_row(text: str) -> str:
@@ -527,6 +697,24 @@ def render(st, db, rule_engine, CTX):
         def mark(ok, label): return ("✅ " if ok else "⚠️ ") + label
         return f"{mark(not amb,'Unambiguous')}  {mark(not pas,'Active Voice')}  {mark(not inc,'Complete')}  {mark(not sing,'Singular')}"
 
+    def _sel_or_custom(label, options, ksel, kcust, initial=""):
+        choices, idx_of = _custom_choices(tuple(options))
+        n_opts = len(idx_of)
+        preset = initial if initial in idx_of else (choices[0] if n_opts else "")
+        sel = st.selectbox(
+            label,
+            choices,
+            index=idx_of.get(preset, n_opts),
+            key=ksel
+        )
+        if sel == "Custom…":
+            return st.text_input(
+                f"{label} (custom)",
+                value=initial if (initial and initial not in idx_of) else "",
+                key=kcust
+            )
+        return sel
+
     def _next_child_id(parent_id: str) -> str:
         S["child_counts"].setdefault(parent_id, 1)
         idx = S["child_counts"][parent_id]
@@ -534,29 +722,17 @@ def render(st, db, rule_engine, CTX):
         return f"{parent_id}.{idx}"
 
     def _append_children_ids(base_parent: str, children_texts: list[str]) -> list[dict]:
-        rows = []
-        for txt in children_texts:
-            rows.append({
-                "ID": _next_child_id(base_parent),
-                "ParentID": base_parent,
-                "Text": txt,
-                "Role": "Child",
-                "Verification": "Test",
-                "VerificationLevel": "Subsystem",
-                "VerificationEvidence": "",
-                "ValidationNeedID": S.get("need_id", "NEED-001"),
-                "TestCaseIDs": "",
-                "AllocatedTo": "",
-                "Criticality": "Medium",
-                "Status": "Draft"
-            })
-        return rows
+        need_id = S.get("need_id", "NEED-001")
+        return [
+            _make_req_row(_next_child_id(base_parent), txt, parent=base_parent, need_id=need_id)
+            for txt in children_texts
+        ]
 
     def _ai_rewrite_strict(text: str) -> str:
-        if not st.session_state.get("api_key"):
+        if not api_key:
             return text
-        prompt = f"Rewrite as ONE singular, unambiguous, verifiable requirement using 'shall', ≤ 22 words. Return only the sentence.\n\n\"\"\"{text.strip()}\"\"\""
-        out = _llm_retry(lambda p: run_freeform(st.session_state.api_key, p), prompt)
+        prompt = _PROMPT_REWRITE_STRICT.format(text=text.strip())
+        out = _llm_call(run_freeform, api_key, prompt)
         return (out.splitlines()[0].strip() if out else text)
 
     # ---------- Generate (one click) ----------
@@ -567,25 +743,25 @@ def render(st, db, rule_engine, CTX):
             need_clean = _normalize_need(S["need_text"])
             if not need_clean.strip():
                 st.error("Enter the stakeholder need first.")
-            elif not st.session_state.get("api_key"):
+            elif not api_key:
                 st.error("Missing API key. Configure your AI provider.")
             else:
                 with st.spinner("Thinking like a systems engineer…"):
                     # AI-only questions (aim 10, accept 6–12)
-                    S["ai_questions"] = _ai_questions(need_clean, S["req_type"], run_freeform)
+                    S["ai_questions"] = _ai_questions(need_clean, S["req_type"], run_freeform, api_key)
 
                     # AI-only requirements (1 parent + 8–12 children; repair loops)
                     reqs = _ai_generate_requirements(
-                        need_clean, S["rationale"], run_freeform, S.get("need_id", "NEED-001")
+                        need_clean, S["rationale"], run_freeform, S.get("need_id", "NEED-001"), api_key
                     )
 
                     # --- Dense-need fallback if counts are weak ---
                     parent_try = next((r for r in reqs if r["Role"] == "Parent"), None) if reqs else None
                     children_try = [r for r in (reqs or []) if r["Role"] == "Child"]
                     if (not parent_try) or (len(children_try) < 8):
-                        decomp_raw = _llm_retry(
-                            lambda _: decompose_need_into_requirements(st.session_state.api_key, need_clean),
-                            "DENSE_DECOMP"
+                        decomp_raw = _llm_call(
+                            lambda k, _: decompose_need_into_requirements(k, need_clean),
+                            api_key, "DENSE_DECOMP", memo_key="dense|" + need_clean
                         )
                         # Parse decomposition lines into child requirement texts
                         child_texts: List[str] = []
@@ -594,14 +770,14 @@ def render(st, db, rule_engine, CTX):
                             if not ln:
                                 continue
                             # strip leading bullets/numbers/REQ-ids
-                            ln = re.sub(r'^[\-\*\d]+\.\s*', '', ln)
-                            ln = re.sub(r'^REQ-\d{3,5}[.\s:-]\s*', '', ln, flags=re.I).strip()
+                            ln = _DECOMP_BULLET_RX.sub('', ln)
+                            ln = _REQ_ID_PREFIX_RX.sub('', ln).strip()
                             # keep only normative sentences
                             if " shall " in f" {ln.lower()} ":
                                 if len(ln.split()) <= 26:
                                     child_texts.append(ln if ln.endswith(".") else (ln + "."))
                         if len(child_texts) >= 8:
-                            parent_ai = _ai_parent_from_children(need_clean, child_texts, run_freeform)
+                            parent_ai = _ai_parent_from_children(need_clean, child_texts, run_freeform, api_key)
                             if parent_ai:
                                 # Build items WITHOUT IDs; structuring below will assign IDs
                                 parent_ai["ID"] = ""
@@ -609,20 +785,11 @@ def render(st, db, rule_engine, CTX):
                                 parent_ai["Role"] = "Parent"
                                 parent_ai["VerificationLevel"] = parent_ai.get("VerificationLevel") or "System"
                                 parent_ai["ValidationNeedID"] = S.get("need_id", "NEED-001")
-                                child_items = [{
-                                    "ID": "",
-                                    "ParentID": "",
-                                    "Text": txt,
-                                    "Role": "Child",
-                                    "Verification": "Test",
-                                    "VerificationLevel": "Subsystem",
-                                    "VerificationEvidence": "",
-                                    "ValidationNeedID": S.get("need_id", "NEED-001"),
-                                    "TestCaseIDs": "",
-                                    "AllocatedTo": "",
-                                    "Criticality": "Medium",
-                                    "Status": "Draft",
-                                } for txt in child_texts[:16]]
+                                need_id = S.get("need_id", "NEED-001")
+                                child_items = [
+                                    _make_req_row("", txt, need_id=need_id)
+                                    for txt in child_texts[:16]
+                                ]
                                 reqs = [parent_ai] + child_items
                                 st.info("Used dense-need decomposition fallback for broader coverage.")
 
@@ -666,28 +833,28 @@ def render(st, db, rule_engine, CTX):
 
     # ---------- Quick Add (Parent / Child) ----------
     st.subheader("🧱 Requirements")
+    # badges run all four analyzers per card, so they are opt-in
+    show_badges = (getattr(st, "toggle", None) or st.checkbox)(
+        "Show quality badges", value=False, key="need_show_badges"
+    )
+    # One pass gives the parent count, the picker options and each parent's row index
+    parent_at: dict[str, int] = {}
+    n_parents = 0
+    for i, r in enumerate(S["requirements"]):
+        if r["Role"] == "Parent":
+            n_parents += 1
+            parent_at.setdefault(r["ID"], i)
+
     quick_cols = st.columns([0.20, 0.40, 0.40])
     with quick_cols[0]:
         if st.button("➕ Add Parent", key="add_parent_btn"):
-            new_id = "REQ-001" if not S["requirements"] else f"REQ-{len([r for r in S['requirements'] if r['Role']=='Parent'])+1:03d}"
+            new_id = "REQ-001" if not S["requirements"] else f"REQ-{n_parents+1:03d}"
             S["child_counts"].setdefault(new_id, 1)
-            S["requirements"].append({
-                "ID": new_id,
-                "ParentID": "",
-                "Text": "The System shall TBD.",
-                "Role": "Parent",
-                "Verification": "Test",
-                "VerificationLevel": "System",
-                "VerificationEvidence": "",
-                "ValidationNeedID": S.get("need_id", "NEED-001"),
-                "TestCaseIDs": "",
-                "AllocatedTo": "",
-                "Criticality": "Medium",
-                "Status": "Draft",
-            })
+            S["requirements"].append(_make_req_row(new_id, "The System shall TBD.", "Parent",
+                                                   need_id=S.get("need_id", "NEED-001"), level="System"))
             _rerun()
     with quick_cols[1]:
-        parent_choices = [r["ID"] for r in S["requirements"] if r["Role"] == "Parent"]
+        parent_choices = list(parent_at)
         if parent_choices:
             sel_parent = st.selectbox("Parent for new child", parent_choices, key="add_child_parent")
         else:
@@ -697,21 +864,9 @@ def render(st, db, rule_engine, CTX):
         if st.button("➕ Add Child", key="add_child_btn", disabled=not parent_choices):
             pid = sel_parent
             child_id = _next_child_id(pid)
-            new_child = {
-                "ID": child_id,
-                "ParentID": pid,
-                "Text": "The System shall TBD.",
-                "Role": "Child",
-                "Verification": "Test",
-                "VerificationLevel": "Subsystem",
-                "VerificationEvidence": "",
-                "ValidationNeedID": S.get("need_id", "NEED-001"),
-                "TestCaseIDs": "",
-                "AllocatedTo": "",
-                "Criticality": "Medium",
-                "Status": "Draft",
-            }
-            insert_at = next((i for i, r in enumerate(S["requirements"]) if r["ID"] == pid), None)
+            new_child = _make_req_row(child_id, "The System shall TBD.", parent=pid,
+                                      need_id=S.get("need_id", "NEED-001"))
+            insert_at = parent_at.get(pid)
             if insert_at is None:
                 S["requirements"].append(new_child)
             else:
@@ -723,7 +878,26 @@ def render(st, db, rule_engine, CTX):
     if not reqs:
         st.caption("No requirements yet. Use **Generate Questions & Requirements** or **Add Parent/Child**.")
     else:
+        # ParentID -> child row indices, built once per render (rows are only mutated right before a rerun)
+        children_of = defaultdict(list)
+        for i, r in enumerate(reqs):
+            if r.get("ParentID"):
+                children_of[r["ParentID"]].append(i)
+
+        def _descendants(root_id: str) -> list[int]:
+            """Row indices of every requirement below root_id in the ParentID tree."""
+            out, seen, stack = [], set(), list(children_of.get(root_id, ()))
+            while stack:
+                i = stack.pop()
+                if i in seen:
+                    continue
+                seen.add(i)
+                out.append(i)
+                stack.extend(children_of.get(reqs[i]["ID"], ()))
+            return out
+
         for idx, req in enumerate(reqs):
+            req_live = S["requirements"][idx]  # the stored row; edits below go through it
             rid, role = req["ID"], req["Role"]
             text = req.get("Text", "")
             # ensure defaults
@@ -736,57 +910,69 @@ def render(st, db, rule_engine, CTX):
             req.setdefault("Criticality", req.get("Criticality", "Medium"))
             req.setdefault("Status", req.get("Status", "Draft"))
 
+            # Read-only header (border, title, badges) goes out as one markdown element
             border = "1px solid #94a3b8" if role == "Parent" else "1px solid #e2e8f0"
-            st.markdown(f"<div style='border:{border};border-radius:10px;padding:12px;margin-bottom:10px;'>", unsafe_allow_html=True)
-
-            # Header + ID + Text
             title = "Parent" if role == "Parent" else ("Child" if role == "Child" else "Requirement")
-            st.markdown(f"**{title}**")
-            top = st.columns([0.20, 0.80])
-            with top[0]:
-                new_id = st.text_input("ID", value=rid, key=f"id_{rid}")
+            badges = f"<br><span style='font-size:0.9em;'>{_badge_row(text)}</span>" if show_badges else ""
+            st.markdown(
+                f"<div style='border:{border};border-radius:10px;padding:8px 12px;margin-bottom:6px;'>"
+                f"<b>{title}</b>{badges}</div>",
+                unsafe_allow_html=True,
+            )
+
+            # ID + Text
+            # ID/text edits are batched in a form: typing reruns nothing until Apply
+            with st.form(f"card_form_{rid}", clear_on_submit=False):
+                top = st.columns([0.20, 0.80])
+                with top[0]:
+                    new_id = st.text_input("ID", value=rid, key=f"id_{rid}")
+                with top[1]:
+                    new_text = st.text_input("Requirement", value=text, key=f"text_{rid}")
+                submitted = st.form_submit_button("Apply")
+            if submitted:
+                if new_text != text:
+                    req_live["Text"] = new_text
+                    if show_badges and not (new_id and new_id != rid):
+                        _rerun()  # header badges were drawn from the old text
                 if new_id and new_id != rid:
                     prefix_old = rid + "."
                     prefix_new = new_id + "."
-                    for j, r2 in enumerate(S["requirements"]):
-                        if r2["ID"] == rid:
-                            S["requirements"][j]["ID"] = new_id
-                            if r2["Role"] == "Parent":
-                                if rid in S["child_counts"] and new_id not in S["child_counts"]:
-                                    S["child_counts"][new_id] = S["child_counts"].pop(rid)
-                        elif r2.get("ParentID") == rid:
-                            S["requirements"][j]["ParentID"] = new_id
+                    req_live["ID"] = new_id
+                    if role == "Parent" and rid in S["child_counts"] and new_id not in S["child_counts"]:
+                        S["child_counts"][new_id] = S["child_counts"].pop(rid)
+                    # only this row's subtree can reference the old ID
+                    for j in _descendants(rid):
+                        r2 = S["requirements"][j]
+                        if r2.get("ParentID") == rid:
+                            r2["ParentID"] = new_id
+                        elif r2.get("ParentID", "").startswith(prefix_old):
+                            r2["ParentID"] = prefix_new + r2["ParentID"][len(prefix_old):]
                         if r2["ID"].startswith(prefix_old):
-                            S["requirements"][j]["ID"] = prefix_new + r2["ID"][len(prefix_old):]
+                            r2["ID"] = prefix_new + r2["ID"][len(prefix_old):]
                     _rerun()
-            with top[1]:
-                new_text = st.text_input("Requirement", value=text, key=f"text_{rid}")
-                if new_text != text:
-                    S["requirements"][idx]["Text"] = new_text
 
             # Tools row (Rewrite always; Decompose only for non-singular)
             tools = st.columns([0.18, 0.18, 0.18, 0.46])
             with tools[0]:
                 if st.button("🪄 Rewrite", key=f"rw_{rid}"):
-                    S["requirements"][idx]["Text"] = _ai_rewrite_strict(S["requirements"][idx]["Text"])
+                    req_live["Text"] = _ai_rewrite_strict(req_live["Text"])
                     _rerun()
 
-            _, _, _, sing_issues = _qc(S["requirements"][idx]["Text"])
-            show_decompose = bool(sing_issues)
+            show_decompose = bool(_sing(req_live["Text"]))
 
             with tools[1]:
                 if show_decompose:
                     if st.button("🧩 Decompose", key=f"dc_{rid}"):
-                        base_parent = S["requirements"][idx]["ID"]
-                        if st.session_state.get("api_key"):
-                            raw = _llm_retry(lambda _: decompose_requirement_with_ai(st.session_state.api_key, S["requirements"][idx]["Text"]), "DECOMPOSE")
-                            kids_txt = [re.sub(r'^[\-\*\u2022]?\s*', '', ln.strip()) for ln in (raw or "").splitlines() if re.search(r'\w', ln)]
-                            kids_txt = [k for k in kids_txt if len(k.split()) > 3]
+                        base_parent = req_live["ID"]
+                        if api_key:
+                            raw = _llm_call(lambda k, _: decompose_requirement_with_ai(k, req_live["Text"]),
+                                            api_key, "DECOMPOSE", memo_key="decompose|" + req_live["Text"])
+                            kids_txt = list(_clean_llm_lines(raw, min_words=4))
                         else:
                             kids_txt = []
                         if kids_txt:
-                            if S["requirements"][idx]["Role"] == "Standalone":
-                                S["requirements"][idx]["Role"] = "Parent"
+                            if req_live["Role"] == "Standalone":
+                                req_live["Role"] = "Parent"
                                 S["child_counts"][base_parent] = 1
                             S["child_counts"].setdefault(base_parent, 1)
                             children = _append_children_ids(base_parent, kids_txt)
@@ -800,32 +986,15 @@ def render(st, db, rule_engine, CTX):
 
             with tools[2]:
                 if st.button("🗑️ Delete", key=f"del_{rid}"):
-                    pref = rid + "."
-                    S["requirements"] = [r for r in S["requirements"] if not (r["ID"] == rid or r["ID"].startswith(pref))]
+                    to_drop = {idx, *_descendants(rid)}
+                    S["requirements"] = [r for i, r in enumerate(S["requirements"]) if i not in to_drop]
                     _rerun()
             with tools[3]:
                 st.caption("")
 
             # Structured edit (dropdowns / with custom)
             with st.expander("Structured edit (dropdowns / with custom)"):
-                def _sel_or_custom(label, options, ksel, kcust, initial=""):
-                    opts = [o for o in options if o != "function"] + (["function"] if "function" in options else [])
-                    preset = initial if initial in opts else (opts[0] if opts else "")
-                    sel = st.selectbox(
-                        label,
-                        opts + ["Custom…"],
-                        index=(opts + ["Custom…"]).index(preset) if preset in opts else len(opts),
-                        key=ksel
-                    )
-                    if sel == "Custom…":
-                        return st.text_input(
-                            f"{label} (custom)",
-                            value=initial if (initial and initial not in opts) else "",
-                            key=kcust
-                        )
-                    return sel
-
-                txt_now = S["requirements"][idx]["Text"]
+                txt_now = req_live["Text"]
                 parsed = _parse_req_text(txt_now)
 
                 actor_guess = parsed["actor"]
@@ -863,7 +1032,7 @@ def render(st, db, rule_engine, CTX):
                     t = t.strip()
                     if not t:
                         return ""
-                    return t if re.match(r'^(when|if|while|during)\b', t, flags=re.I) else f"during {t}"
+                    return t if _TRIG_START_RX.match(t) else f"during {t}"
 
                 trig_part = (_norm_trig(trigger) + ", ") if trigger.strip() else ""
                 perf_final = perf.strip() if perf.strip() else perf_guess
@@ -872,9 +1041,9 @@ def render(st, db, rule_engine, CTX):
                 rebuilt = f"{trig_part}{actor} {modal} {action} {obj}{tail_perf}{tail_cond}".strip()
                 if not rebuilt.endswith("."):
                     rebuilt += "."
-                rebuilt = re.sub(r"\s{2,}", " ", rebuilt)
+                rebuilt = _MULTI_SPACE_RX.sub(" ", rebuilt)
                 if st.button("Apply structured edit", key=f"apply_{rid}"):
-                    S["requirements"][idx]["Text"] = rebuilt
+                    req_live["Text"] = rebuilt
                     _rerun()
 
             # 🔻 V&V & traceability
@@ -882,23 +1051,23 @@ def render(st, db, rule_engine, CTX):
                 row_vv1 = st.columns([0.26, 0.26, 0.24, 0.24])
                 with row_vv1[0]:
                     ver_options = ["Test", "Analysis", "Inspection", "Demo"]
-                    cur = S["requirements"][idx].get("Verification", "Test")
+                    cur = req_live.get("Verification", "Test")
                     sel = st.selectbox("Verification Method", ver_options, index=ver_options.index(cur) if cur in ver_options else 0, key=f"{rid}_verif")
                     if sel != cur:
-                        S["requirements"][idx]["Verification"] = sel
+                        req_live["Verification"] = sel
                 with row_vv1[1]:
                     lvl_opts = ["Unit", "Subsystem", "System", "Mission"]
-                    cur = S["requirements"][idx].get("VerificationLevel", "Subsystem")
+                    cur = req_live.get("VerificationLevel", "Subsystem")
                     sel = st.selectbox("Verification Level", lvl_opts, index=lvl_opts.index(cur) if cur in lvl_opts else 1, key=f"{rid}_verlvl")
                     if sel != cur:
-                        S["requirements"][idx]["VerificationLevel"] = sel
+                        req_live["VerificationLevel"] = sel
                 with row_vv1[2]:
-                    cur = S["requirements"][idx].get("ValidationNeedID", S.get("need_id", "NEED-001"))
+                    cur = req_live.get("ValidationNeedID", S.get("need_id", "NEED-001"))
                     val = st.text_input("Validation Need ID", value=cur, key=f"{rid}_valneed")
                     if val != cur:
-                        S["requirements"][idx]["ValidationNeedID"] = val
+                        req_live["ValidationNeedID"] = val
                 with row_vv1[3]:
-                    cur = S["requirements"][idx].get("AllocatedTo", "")
+                    cur = req_live.get("AllocatedTo", "")
                     val = st.text_input(
                         "Allocated To",
                         value=cur,
@@ -906,77 +1075,73 @@ def render(st, db, rule_engine, CTX):
                         placeholder="e.g., Propulsion Subsystem / Thermal Subsystem / Flight Software / API Service"
                     )
                     if val != cur:
-                        S["requirements"][idx]["AllocatedTo"] = val
+                        req_live["AllocatedTo"] = val
 
                 row_vv2 = st.columns([0.50, 0.25, 0.25])
                 with row_vv2[0]:
-                    cur = S["requirements"][idx].get("VerificationEvidence", "")
+                    cur = req_live.get("VerificationEvidence", "")
                     val = st.text_input("Verification Evidence (link/ID)", value=cur, key=f"{rid}_verevid")
                     if val != cur:
-                        S["requirements"][idx]["VerificationEvidence"] = val
+                        req_live["VerificationEvidence"] = val
                 with row_vv2[1]:
-                    cur = S["requirements"][idx].get("TestCaseIDs", "")
+                    cur = req_live.get("TestCaseIDs", "")
                     val = st.text_input("Test Case ID(s)", value=cur, key=f"{rid}_tcids", placeholder="e.g., HIL-BURN-07; TVAC-OPT-02")
                     if val != cur:
-                        S["requirements"][idx]["TestCaseIDs"] = val
+                        req_live["TestCaseIDs"] = val
                 with row_vv2[2]:
                     crit_options = ["High", "Medium", "Low"]
-                    cur_crit = S["requirements"][idx].get("Criticality", "Medium")
+                    cur_crit = req_live.get("Criticality", "Medium")
                     sel_crit = st.selectbox("Criticality", crit_options, index=crit_options.index(cur_crit) if cur_crit in crit_options else 1, key=f"{rid}_crit")
                     if sel_crit != cur_crit:
-                        S["requirements"][idx]["Criticality"] = sel_crit
+                        req_live["Criticality"] = sel_crit
 
                 status_row = st.columns([1.0])
                 with status_row[0]:
                     status_options = ["Draft", "Reviewed", "Approved"]
-                    cur_status = S["requirements"][idx].get("Status", "Draft")
+                    cur_status = req_live.get("Status", "Draft")
                     sel_status = st.selectbox("Status", status_options, index=status_options.index(cur_status) if cur_status in status_options else 0, key=f"{rid}_status")
                     if sel_status != cur_status:
-                        S["requirements"][idx]["Status"] = sel_status
+                        req_live["Status"] = sel_status
 
-            # Quality badges
-            st.markdown(_badge_row(S["requirements"][idx]["Text"]))
-            st.markdown("</div>", unsafe_allow_html=True)
+    # Drop analyzer results for texts no requirement uses any more
+    live_texts = {r.get("Text", "") for r in S.get("requirements", [])}
+    for stale in [t for t in qc_cache if t not in live_texts]:
+        del qc_cache[stale]
 
     # ---------- Export ----------
     st.subheader("⬇️ Export Requirements (CSV)")
     if not S.get("requirements"):
         st.info("No requirements to export yet.")
     else:
-        rows = []
-        for r in S["requirements"]:
-            rows.append({
-                "Need ID": S.get("need_id", "NEED-001"),
-                "Validation Need ID": r.get("ValidationNeedID", S.get("need_id", "NEED-001")),
-                "ID": r["ID"],
-                "ParentID": r["ParentID"],
-                "Requirement Text": r["Text"],
-                "Type": S.get("req_type", "Functional"),
-                "Role": r["Role"],
-                "Priority": S.get("priority", "Should"),
-                "Lifecycle": S.get("lifecycle", "Operations"),
-                "Stakeholder": S.get("stakeholder", ""),
-                "Source": "Need",
-                "Verification": r.get("Verification", ""),
-                "Verification Level": r.get("VerificationLevel", ""),
-                "Verification Evidence": r.get("VerificationEvidence", ""),
-                "Test Case IDs": r.get("TestCaseIDs", ""),
-                "Allocated To": r.get("AllocatedTo", ""),
-                "Criticality": r.get("Criticality", ""),
-                "Status": r.get("Status", ""),
-                "Acceptance Criteria": "",
-                "Rationale": S.get("rationale", "")
-            })
-        df_pro = pd.DataFrame(rows, columns=[
-            "Need ID", "Validation Need ID", "ID", "ParentID", "Requirement Text", "Type", "Role",
-            "Priority", "Lifecycle", "Stakeholder", "Source",
-            "Verification", "Verification Level", "Verification Evidence",
-            "Test Case IDs", "Allocated To", "Criticality", "Status",
-            "Acceptance Criteria", "Rationale"
-        ])
+        need_id = S.get("need_id", "NEED-001")
+        rows = tuple(
+            (
+                need_id,
+                r.get("ValidationNeedID", need_id),
+                r["ID"],
+                r["ParentID"],
+                r["Text"],
+                S.get("req_type", "Functional"),
+                r["Role"],
+                S.get("priority", "Should"),
+                S.get("lifecycle", "Operations"),
+                S.get("stakeholder", ""),
+                "Need",
+                r.get("Verification", ""),
+                r.get("VerificationLevel", ""),
+                r.get("VerificationEvidence", ""),
+                r.get("TestCaseIDs", ""),
+                r.get("AllocatedTo", ""),
+                r.get("Criticality", ""),
+                r.get("Status", ""),
+                "",
+                S.get("rationale", ""),
+            )
+            for r in S["requirements"]
+        )
         st.download_button(
             "Download CSV",
-            data=df_pro.to_csv(index=False).encode("utf-8"),
+            data=_export_csv_bytes(rows),
             file_name="Requirements_Export.csv",
             mime="text/csv",
             key="pro_export_csv"